@@ -25,6 +25,10 @@ class A2C(Actor_Critic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="rmsprop",
+        compress_memory=False,
+        device_buffer=False,
+        eval_workers=1,
+        async_eval=False,
     ):
         super().__init__(
             env_builder,
@@ -43,6 +47,10 @@ class A2C(Actor_Critic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            compress_memory,
+            device_buffer,
+            eval_workers,
+            async_eval,
         )
 
         self.name = "A2C"
@@ -96,12 +104,6 @@ class A2C(Actor_Critic_Policy_Gradient_Family):
         terminateds,
         truncateds,
     ):
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncateds = jnp.stack(truncateds)
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         value = jax.vmap(self.critic, in_axes=(None, None, 0))(
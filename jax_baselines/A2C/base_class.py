@@ -10,6 +10,8 @@ from tqdm.auto import trange
 
 from jax_baselines.common.cpprb_buffers import EpochBuffer
 from jax_baselines.common.env_builer import VectorizedEnv
+from jax_baselines.common.evaluator import AsyncEvaluator, vectorized_eval
+from jax_baselines.common.jax_envs import JaxVectorizedEnv
 from jax_baselines.common.logger import TensorboardLogger
 from jax_baselines.common.utils import (
     convert_jax,
@@ -39,12 +41,19 @@ class Actor_Critic_Policy_Gradient_Family(object):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        compress_memory=False,
+        device_buffer=False,
+        eval_workers=1,
+        async_eval=False,
     ):
         self.name = "Actor_Critic_Policy_Gradient_Family"
         self.env_builder = env_builder
         self.model_builder_maker = model_builder_maker
         self.num_workers = num_workers
         self.eval_eps = eval_eps
+        self.eval_workers = eval_workers
+        self.async_eval = async_eval
+        self.async_evaluator = None
         self.log_interval = log_interval
         self.policy_kwargs = policy_kwargs
         self.seed = 42 if seed is None else seed
@@ -62,6 +71,9 @@ class Actor_Critic_Policy_Gradient_Family(object):
         self.save_path = None
         self.optimizer = select_optimizer(optimizer, self.learning_rate)
 
+        self.compress_memory = compress_memory
+        self.device_buffer = device_buffer
+
         self.get_env_setup()
 
     def save_params(self, path):
@@ -76,14 +88,35 @@ class Actor_Critic_Policy_Gradient_Family(object):
             self.observation_space,
             self.worker_size,
             [1] if self.action_type == "discrete" else self.action_size,
+            self.compress_memory,
+            self.device_buffer,
         )
+        self.buffer.memory_report()
 
     def get_env_setup(self):
         self.env = self.env_builder(self.num_workers)
-        self.eval_env = self.env_builder(1)
+        self.eval_env = self.env_builder(self.eval_workers, evaluation=True)
 
         print("----------------------env------------------------")
-        if isinstance(self.env, VectorizedEnv):
+        if isinstance(self.env, JaxVectorizedEnv):
+            print("Jax environmet")
+            env_info = self.env.env_info
+            self.observation_space = [list(env_info["observation_space"].shape)]
+            if not isinstance(env_info["action_space"], spaces.Box):
+                self.action_size = [env_info["action_space"].n]
+                self.action_type = "discrete"
+                self.conv_action = lambda a: a[0]
+            else:
+                self.action_size = [env_info["action_space"].shape[0]]
+                self.action_type = "continuous"
+                self.conv_action = lambda a: np.clip(a, -3.0, 3.0) / 3.0
+            self.worker_size = self.env.worker_num
+            self.env_type = "JaxEnv"
+            self._jax_env_steps = jax.jit(
+                self._jax_env_steps, static_argnums=(0,), donate_argnums=(1,)
+            )
+
+        elif isinstance(self.env, VectorizedEnv):
             print("Vectorized environmet")
             env_info = self.env.env_info
             self.observation_space = [list(env_info["observation_space"].shape)]
@@ -96,6 +129,8 @@ class Actor_Critic_Policy_Gradient_Family(object):
                 self.action_type = "continuous"
                 self.conv_action = lambda a: np.clip(a, -3.0, 3.0) / 3.0
             self.worker_size = self.env.worker_num
+            # rollouts are stored as [worker, T], every worker has to step every time
+            assert not self.env.async_step, "on policy rollouts need a synchronous env"
             self.env_type = "VectorizedEnv"
 
         elif isinstance(self.env, gym.Env) or isinstance(self.env, gym.Wrapper):
@@ -123,11 +158,13 @@ class Actor_Critic_Policy_Gradient_Family(object):
             self.get_logprob = self.get_logprob_discrete
             self._loss = self._loss_discrete
             self.actions = self.action_discrete
+            self.act = jax.jit(self.act_discrete)
         elif self.action_type == "continuous":
             self._get_actions = self._get_actions_continuous
             self.get_logprob = self.get_logprob_continuous
             self._loss = self._loss_continuous
             self.actions = self.action_continuous
+            self.act = jax.jit(self.act_continuous)
 
     def setup_model(self):
         pass
@@ -147,15 +184,19 @@ class Actor_Critic_Policy_Gradient_Family(object):
         return mu, jnp.exp(std)
 
     def action_discrete(self, obs):
-        prob = np.asarray(self._get_actions(self.params, obs))
-        return np.expand_dims(
-            np.stack([np.random.choice(self.action_size[0], p=p) for p in prob], axis=0),
-            axis=1,
-        )
+        return np.asarray(self.act(self.params, obs, next(self.key_seq)))
 
     def action_continuous(self, obs):
-        mu, std = self._get_actions(self.params, obs)
-        return np.random.normal(mu, std)
+        return np.asarray(self.act(self.params, obs, next(self.key_seq)))
+
+    def act_discrete(self, params, obses, key):
+        # the actions are sampled on the device, only the int actions are transferred back
+        prob = self._get_actions(params, obses)
+        return jnp.expand_dims(jax.random.categorical(key, jnp.log(prob)), axis=1)
+
+    def act_continuous(self, params, obses, key):
+        mu, std = self._get_actions(params, obses)
+        return mu + std * jax.random.normal(key, mu.shape)
 
     def get_logprob_discrete(self, prob, action, key, out_prob=False):
         prob = jnp.clip(jax.nn.softmax(prob), 1e-5, 1.0)
@@ -211,14 +252,27 @@ class Actor_Critic_Policy_Gradient_Family(object):
         self.update_eps = 1.0
         self.eval_freq = ((total_timesteps // 100) // self.worker_size) * self.worker_size
 
-        pbar = trange(0, total_timesteps, self.worker_size, miniters=log_interval)
+        if self.env_type == "JaxEnv":
+            # one compiled call runs whole epochs from one evaluation to the next
+            epoch_steps = self.worker_size * self.batch_size
+            self.eval_freq = max(self.eval_freq // epoch_steps, 1) * epoch_steps
+            pbar = trange(0, total_timesteps, self.eval_freq)
+        else:
+            pbar = trange(0, total_timesteps, self.worker_size, miniters=log_interval)
         self.logger = TensorboardLogger(run_name, experiment_name, self.log_dir, self)
         with self.logger as self.logger_run:
+            if self.async_eval:
+                self.async_evaluator = AsyncEvaluator(self)
             if self.env_type == "SingleEnv":
                 self.learn_SingleEnv(pbar, callback, log_interval)
             if self.env_type == "VectorizedEnv":
                 self.learn_VectorizedEnv(pbar, callback, log_interval)
+            if self.env_type == "JaxEnv":
+                self.learn_JaxEnv(pbar, callback, log_interval)
 
+            if self.async_evaluator is not None:
+                self.async_evaluator.close()
+                self.async_evaluator = None
             self.eval(total_timesteps)
 
             self.save_params(self.logger_run.get_local_path("params"))
@@ -281,51 +335,130 @@ class Actor_Critic_Policy_Gradient_Family(object):
             if steps % log_interval == 0 and eval_result is not None and len(self.lossque) > 0:
                 pbar.set_description(self.discription(eval_result))
 
+    def learn_JaxEnv(self, pbar, callback=None, log_interval=1000):
+        """Training loop of a JaxVectorizedEnv, compiled as a whole.
+
+        The rollout of every epoch is a ``lax.scan`` of the policy and the env step, the train step
+        takes it as the ``[worker, time, ...]`` arrays EpochBuffer would return and all epochs up to
+        the next evaluation run in one more scan, Python only evaluates and logs in between.
+        """
+        self.lossque = deque(maxlen=10)
+        eval_result = None
+        n_epochs = self.eval_freq // (self.worker_size * self.batch_size)
+        carry = (self.params, self.opt_state, self.env.state, self.env.obs, next(self.key_seq))
+
+        for steps in pbar:
+            carry, losses = self._jax_env_steps(n_epochs, carry)
+            self.params, self.opt_state, self.env.state, self.env.obs, _ = carry
+            loss = np.mean(np.asarray(losses))
+            self.lossque.append(loss)
+            if self.logger_run:
+                self.logger_run.log_metric("loss/critic_loss", loss, steps + self.eval_freq)
+
+            eval_result = self.eval(steps + self.eval_freq)
+            if eval_result is not None:
+                pbar.set_description(self.discription(eval_result))
+
+    def _jax_env_steps(self, n_epochs, carry):
+        def env_step(carry, _):
+            params, env_state, obs, key = carry
+            key, actions_key, env_key = jax.random.split(key, 3)
+            actions = self.act(params, [obs], actions_key)
+            if self.action_type == "continuous":
+                env_actions = jnp.clip(actions, -3.0, 3.0) / 3.0
+            else:
+                env_actions = actions
+            env_state, next_obs, end_obs, rewards, terminateds, truncateds = self.env.step_fn(
+                env_key, env_state, env_actions
+            )
+            transition = (obs, actions, rewards, end_obs, terminateds, truncateds)
+            return (params, env_state, next_obs, key), transition
+
+        def epoch(carry, _):
+            params, opt_state, env_state, obs, key = carry
+            key, train_key = jax.random.split(key)
+            (_, env_state, obs, key), rollout = jax.lax.scan(
+                env_step, (params, env_state, obs, key), None, length=self.batch_size
+            )
+            # [time, worker, ...] to the [worker, time, ...] layout of EpochBuffer
+            obses, actions, rewards, nxtobses, terminateds, truncateds = [
+                jnp.swapaxes(x, 0, 1) for x in rollout
+            ]
+            outputs = self._train_step(
+                params,
+                opt_state,
+                train_key,
+                [obses],
+                actions.astype(jnp.float32),
+                rewards[..., None].astype(jnp.float32),
+                [nxtobses],
+                terminateds[..., None].astype(jnp.float32),
+                truncateds[..., None].astype(jnp.float32),
+            )
+            params, opt_state, critic_loss = outputs[:3]
+            return (params, opt_state, env_state, obs, key), critic_loss
+
+        return jax.lax.scan(epoch, carry, None, length=n_epochs)
+
     def eval(self, steps):
-        original_rewards = []
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
+        if self.async_evaluator is not None:
+            return self.async_evaluator.submit(steps)
+        if self.eval_workers > 1:
 
-        obs, info = self.eval_env.reset()
-        obs = [np.expand_dims(obs, axis=0)]
-        have_original_reward = "original_reward" in info.keys()
-        have_lives = "lives" in info.keys()
-        if have_original_reward:
-            original_reward = info["original_reward"]
-        terminated = False
-        truncated = False
-        eplen = 0
-
-        for ep in range(self.eval_eps):
-            while not terminated and not truncated:
-                actions = self.actions(obs)[0]
-                observation, reward, terminated, truncated, info = self.eval_env.step(
-                    self.conv_action(actions)
-                )
-                obs = [np.expand_dims(observation, axis=0)]
-                if have_original_reward:
-                    original_reward += info["original_reward"]
-                total_reward[ep] += reward
-                eplen += 1
+            def eval_actions(obs):
+                # the vectorized envs take the discrete actions as [M, 1]
+                actions = self.actions([obs])
+                return actions if self.action_type == "discrete" else self.conv_action(actions)
 
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
-            if have_original_reward:
-                if have_lives:
-                    if info["lives"] == 0:
-                        original_rewards.append(original_reward)
-                        original_reward = 0
-                else:
-                    original_rewards.append(original_reward)
-                    original_reward = 0
+            total_reward, total_ep_len, total_truncated, original_rewards = vectorized_eval(
+                self.eval_env, eval_actions, self.eval_eps
+            )
+            have_original_reward = original_rewards is not None
+        else:
+            original_rewards = []
+            total_reward = np.zeros(self.eval_eps)
+            total_ep_len = np.zeros(self.eval_eps)
+            total_truncated = np.zeros(self.eval_eps)
 
             obs, info = self.eval_env.reset()
             obs = [np.expand_dims(obs, axis=0)]
+            have_original_reward = "original_reward" in info.keys()
+            have_lives = "lives" in info.keys()
+            if have_original_reward:
+                original_reward = info["original_reward"]
             terminated = False
             truncated = False
             eplen = 0
 
+            for ep in range(self.eval_eps):
+                while not terminated and not truncated:
+                    actions = self.actions(obs)[0]
+                    observation, reward, terminated, truncated, info = self.eval_env.step(
+                        self.conv_action(actions)
+                    )
+                    obs = [np.expand_dims(observation, axis=0)]
+                    if have_original_reward:
+                        original_reward += info["original_reward"]
+                    total_reward[ep] += reward
+                    eplen += 1
+
+                total_ep_len[ep] = eplen
+                total_truncated[ep] = float(truncated)
+                if have_original_reward:
+                    if have_lives:
+                        if info["lives"] == 0:
+                            original_rewards.append(original_reward)
+                            original_reward = 0
+                    else:
+                        original_rewards.append(original_reward)
+                        original_reward = 0
+
+                obs, info = self.eval_env.reset()
+                obs = [np.expand_dims(obs, axis=0)]
+                terminated = False
+                truncated = False
+                eplen = 0
+
         if have_original_reward:
             mean_original_score = np.mean(original_rewards)
         mean_reward = np.mean(total_reward)
@@ -358,7 +491,8 @@ class Actor_Critic_Policy_Gradient_Family(object):
         directory = self.logger_run.get_local_path("video")
         os.makedirs(directory, exist_ok=True)
 
-        Render_env = RecordVideo(self.eval_env, directory, episode_trigger=lambda x: True)
+        test_env = self.env_builder(1, render_mode="rgb_array")
+        Render_env = RecordVideo(test_env, directory, episode_trigger=lambda x: True)
         Render_env = RecordEpisodeStatistics(Render_env, buffer_length=episode)
         total_rewards = []
         with Render_env:
@@ -371,7 +505,7 @@ class Actor_Critic_Policy_Gradient_Family(object):
                 eplen = 0
                 while not terminated and not truncated:
                     actions = self.actions(obs)[0]
-                    observation, reward, terminated, truncated, info = self.eval_env.step(
+                    observation, reward, terminated, truncated, info = Render_env.step(
                         self.conv_action(actions)
                     )
                     obs = [np.expand_dims(observation, axis=0)]
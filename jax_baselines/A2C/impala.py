@@ -29,6 +29,7 @@ class IMPALA(IMPALA_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        inference_server=False,
     ):
         super().__init__(
             workers,
@@ -51,6 +52,7 @@ class IMPALA(IMPALA_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            inference_server,
         )
 
         self.name = "IMPALA_AC"
@@ -124,14 +126,7 @@ class IMPALA(IMPALA_Family):
         terminateds,
         truncateds,
     ):
-        # ((b x h x w x c), (b x n)) x x -> (x x b x h x w x c), (x x b x n)
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        mu_log_prob = jnp.stack(mu_log_prob)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncateds = jnp.stack(truncateds)
+        # the trajectory store samples (sample x b x h x w x c), (sample x b x n) batches
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         feature = jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, obses)
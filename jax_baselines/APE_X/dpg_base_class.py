@@ -1,15 +1,19 @@
 import time
 from collections import deque
+from functools import partial
 
 import gymnasium as gym
-import jax
 import numpy as np
 import ray
 from tqdm.auto import trange
 
 from jax_baselines.common.base_classes import TensorboardWriter, restore, save
 from jax_baselines.common.cpprb_buffers import MultiPrioritizedReplayBuffer
+from jax_baselines.common.inference_server import Inference_server
 from jax_baselines.common.optimizer import select_optimizer
+from jax_baselines.common.param_channel import ParamChannel
+from jax_baselines.common.prefetch_buffer import PipelinedReplayBuffer
+from jax_baselines.common.sharded_buffers import ShardedPrioritizedReplayBuffer
 from jax_baselines.common.utils import key_gen
 
 
@@ -43,6 +47,9 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        inference_server=False,
+        replay_shards=0,
+        pipeline_batches=0,
     ):
         self.workers = workers
         self.model_builder_maker = model_builder_maker
@@ -80,6 +87,9 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
         self.optimizer = select_optimizer(optimizer, self.learning_rate, 1e-3 / self.batch_size)
         self.model_builder = None
         self.actor_builder = None
+        self.inference_server = inference_server
+        self.replay_shards = replay_shards
+        self.pipeline_batches = pipeline_batches
 
         self.compress_memory = compress_memory
 
@@ -109,16 +119,37 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
         print("-------------------------------------------------")
 
     def get_memory_setup(self):
-        self.replay_buffer = MultiPrioritizedReplayBuffer(
-            self.buffer_size,
-            self.observation_space,
-            self.prioritized_replay_alpha,
-            self.action_size,
-            self.n_step,
-            self.gamma,
-            self.m,
-            self.compress_memory,
-        )
+        if self.replay_shards > 0:
+            # independent shards, the adds of the workers do not wait for the learner's sampling
+            self.replay_buffer = ShardedPrioritizedReplayBuffer(
+                self.buffer_size,
+                self.observation_space,
+                self.prioritized_replay_alpha,
+                self.action_size,
+                self.n_step,
+                self.gamma,
+                self.replay_shards,
+                self.compress_memory,
+            )
+        else:
+            self.replay_buffer = MultiPrioritizedReplayBuffer(
+                self.buffer_size,
+                self.observation_space,
+                self.prioritized_replay_alpha,
+                self.action_size,
+                self.n_step,
+                self.gamma,
+                self.m,
+                self.compress_memory,
+            )
+        self.replay_buffer.memory_report()
+        if self.pipeline_batches > 0:
+            self.replay_buffer = PipelinedReplayBuffer(
+                self.replay_buffer,
+                self.batch_size,
+                self.prioritized_replay_beta0,
+                self.pipeline_batches,
+            )
 
     def setup_model(self):
         pass
@@ -129,6 +160,21 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
     def _get_actions(self, params, obses) -> np.ndarray:
         pass
 
+    def get_inference_builder(self):
+        model_builder = self.model_builder
+        actor_builder = self.actor_builder
+
+        def builder():
+            preproc, actor_model, critic_model = model_builder()
+            get_abs_td_error, actor, _, _, _, key_seq = actor_builder()
+            return (
+                partial(actor, actor_model, preproc),
+                partial(get_abs_td_error, actor_model, critic_model, preproc),
+                key_seq,
+            )
+
+        return builder
+
     def discription(self):
         return "buffer len : {} loss : {:.3f} |".format(
             len(self.replay_buffer), np.mean(self.lossque)
@@ -164,13 +210,14 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
     def learn_SingleEnv(self, pbar, callback, log_interval):
         stop = self.m.Event()
         worker_num = len(self.workers)
-        update = [self.m.Event() for i in range(worker_num)]
         stop.clear()
-        for u in update:
-            u.clear()
 
-        cpu_param = jax.device_put(self.params, jax.devices("cpu")[0])
-        param_server = Param_server.remote(cpu_param)
+        param_channel = ParamChannel(self.params)
+        inference_server = None
+        if self.inference_server:
+            inference_server = Inference_server.remote(
+                self.get_inference_builder(), param_channel, worker_num
+            )
 
         self.logger_server.add_multiline.remote(
             [
@@ -190,11 +237,11 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
                     self.replay_buffer.buffer_info(),
                     self.model_builder,
                     self.actor_builder,
-                    param_server,
+                    param_channel,
                     self.logger_server,
-                    update[idx],
                     stop,
                     eps,
+                    inference_server,
                 )
             )
             time.sleep(0.1)
@@ -205,6 +252,7 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
             if stop.is_set():
                 print("Stop Training")
                 _, still_running = ray.wait(jobs, timeout=300)
+                param_channel.close()
                 self.m.shutdown()
                 return
 
@@ -218,30 +266,30 @@ class Ape_X_Deteministic_Policy_Gradient_Family(object):
             self.lossque.append(loss)
             if steps % log_interval == 0:
                 pbar.set_description(self.discription())
+                if self.pipeline_batches > 0:
+                    self.logger_server.log_trainer.remote(steps, self.replay_buffer.stats())
             if steps % 20 == 0:
-                cpu_param = jax.device_put(self.params, jax.devices("cpu")[0])
-                param_server.update_params.remote(cpu_param)
-                for u in update:
-                    u.set()
+                param_channel.publish(self.params)
+        if self.pipeline_batches > 0:
+            self.replay_buffer.close()
+            # the totals after the last train step
+            self.logger_server.log_trainer.remote(steps, self.replay_buffer.stats())
+        print("------------------param channel------------------")
+        print(f"versions : {param_channel.version}, size : {param_channel.nbytes / 2**20:.2f} MB")
+        print("-------------------------------------------------")
+        if inference_server is not None:
+            stats = ray.get(inference_server.get_stats.remote())
+            print("-------------------inference---------------------")
+            print(f"batches : {stats['batches']}, mean batch : {stats['mean_batch']:.2f}")
+            print("-------------------------------------------------")
         self.logger_server.last_update.remote()
         stop.set()
         _, still_running = ray.wait(jobs, timeout=300)
+        param_channel.close()
         time.sleep(1)
         self.m.shutdown()
 
 
-@ray.remote
-class Param_server(object):
-    def __init__(self, params) -> None:
-        self.params = params
-
-    def get_params(self):
-        return self.params
-
-    def update_params(self, params):
-        self.params = params
-
-
 @ray.remote
 class Logger_server(object):
     def __init__(self, log_dir, log_name) -> None:
@@ -9,6 +9,7 @@ import numpy as np
 import ray
 
 from jax_baselines.common.cpprb_buffers import ReplayBuffer
+from jax_baselines.common.inference_server import remote_inference
 
 
 @ray.remote(num_cpus=1)
@@ -35,16 +36,15 @@ class Ape_X_Worker(object):
         buffer_info,
         model_builder,
         actor_builder,
-        param_server,
+        param_channel,
         logger_server,
-        update,
         stop,
         eps=0.05,
+        inference_server=None,
     ):
         try:
             gloabal_buffer, env_dict, n_s = buffer_info
             local_buffer = ReplayBuffer(local_size, env_dict=env_dict, n_s=n_s)
-            preproc, actor_model, cricit_model = model_builder()
             (
                 get_abs_td_error,
                 actor,
@@ -54,17 +54,25 @@ class Ape_X_Worker(object):
                 key_seq,
             ) = actor_builder()
 
-            get_abs_td_error = jax.jit(
-                partial(get_abs_td_error, actor_model, cricit_model, preproc)
-            )
-            actor = jax.jit(partial(actor, actor_model, preproc))
+            if inference_server is None:
+                preproc, actor_model, cricit_model = model_builder()
+                get_abs_td_error = jax.jit(
+                    partial(get_abs_td_error, actor_model, cricit_model, preproc)
+                )
+                actor = jax.jit(partial(actor, actor_model, preproc))
+            else:
+                # the server runs the model, the worker only steps the env
+                actor, get_abs_td_error = remote_inference(inference_server)
             _get_action = partial(get_action, actor)
             get_action = random_action
 
             score = 0
             obs, info = self.env.reset()
             obs = [np.expand_dims(obs, axis=0)]
-            params = ray.get(param_server.get_params.remote())
+            if inference_server is None:
+                version, params = param_channel.read()
+            else:
+                version, params = param_channel.version, None
             eplen = 0
             episode = 0
             if eps is None:
@@ -77,9 +85,12 @@ class Ape_X_Worker(object):
                 to_label = f"env/time_over/eps{eps:.2f}"
 
             while not stop.is_set():
-                if update.is_set():
-                    params = ray.get(param_server.get_params.remote())
-                    update.clear()
+                if param_channel.version != version:
+                    # polls the shared memory header, the parameters are only read when they change
+                    if inference_server is None:
+                        version, params = param_channel.read()
+                    else:
+                        version = param_channel.version
                     get_action = _get_action
 
                 eplen += 1
@@ -124,6 +135,7 @@ class Ape_X_Worker(object):
                 "---------------------------------------------------------------------------------"
             )
         finally:
+            param_channel.close()
             if stop.is_set():
                 print("worker stoped")
             else:
@@ -8,6 +8,7 @@ import numpy as np
 import ray
 
 from jax_baselines.common.cpprb_buffers import ReplayBuffer
+from jax_baselines.common.inference_server import remote_inference
 
 
 @ray.remote(num_cpus=1)
@@ -38,16 +39,15 @@ class Ape_X_Worker(object):
         buffer_info,
         model_builder,
         actor_builder,
-        param_server,
+        param_channel,
         logger_server,
-        update,
         stop,
         eps=0.05,
+        inference_server=None,
     ):
         try:
             gloabal_buffer, env_dict, n_s = buffer_info
             local_buffer = ReplayBuffer(local_size, env_dict=env_dict, n_s=n_s)
-            preproc, model = model_builder()
             (
                 get_abs_td_error,
                 actor,
@@ -56,8 +56,13 @@ class Ape_X_Worker(object):
                 key_seq,
             ) = actor_builder()
 
-            get_abs_td_error = jax.jit(partial(get_abs_td_error, model, preproc))
-            actor = jax.jit(partial(actor, model, preproc))
+            if inference_server is None:
+                preproc, model = model_builder()
+                get_abs_td_error = jax.jit(partial(get_abs_td_error, model, preproc))
+                actor = jax.jit(partial(actor, model, preproc))
+            else:
+                # the server runs the model, the worker only steps the env
+                actor, get_abs_td_error = remote_inference(inference_server)
             _get_action = partial(get_action, actor)
             get_action = random_action
 
@@ -68,7 +73,10 @@ class Ape_X_Worker(object):
                 original_score = 0
             score = 0
             obs = [np.expand_dims(obs, axis=0)]
-            params = ray.get(param_server.get_params.remote())
+            if inference_server is None:
+                version, params = param_channel.read()
+            else:
+                version, params = param_channel.version, None
             eplen = 0
             episode = 0
             if eps is None:
@@ -85,9 +93,12 @@ class Ape_X_Worker(object):
                 to_label = f"env/time_over/eps{eps:.2f}"
 
             while not stop.is_set():
-                if update.is_set():
-                    params = ray.get(param_server.get_params.remote())
-                    update.clear()
+                if param_channel.version != version:
+                    # polls the shared memory header, the parameters are only read when they change
+                    if inference_server is None:
+                        version, params = param_channel.read()
+                    else:
+                        version = param_channel.version
                     get_action = _get_action
 
                 eplen += 1
@@ -133,6 +144,7 @@ class Ape_X_Worker(object):
                     )
                     gloabal_buffer.add(**transition, priorities=abs_td_error)
         finally:
+            param_channel.close()
             if stop.is_set():
                 print("worker stoped")
             else:
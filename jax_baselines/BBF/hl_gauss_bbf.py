@@ -16,6 +16,7 @@ from jax_baselines.DQN.base_class import Q_Network_Family
 from jax_baselines.SPR.efficent_buffer import (
     PrioritizedTransitionReplayBuffer,
     TransitionReplayBuffer,
+    get_memmap_dir,
 )
 
 
@@ -50,8 +51,10 @@ class HL_GAUSS_BBF(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        memmap_buffer=False,
     ):
 
+        self.memmap_buffer = memmap_buffer
         self.shift_size = 4
         self.prediction_depth = 5
         self.off_policy_fix = off_policy_fix
@@ -102,6 +105,7 @@ class HL_GAUSS_BBF(Q_Network_Family):
             self.setup_model()
 
     def get_memory_setup(self):
+        memmap_dir = get_memmap_dir(self.memmap_buffer, self.log_dir)
         if self.prioritized_replay:
             self.replay_buffer = PrioritizedTransitionReplayBuffer(
                 self.buffer_size,
@@ -110,6 +114,8 @@ class HL_GAUSS_BBF(Q_Network_Family):
                 prediction_depth=max(self.prediction_depth, self.n_step),
                 alpha=self.prioritized_replay_alpha,
                 eps=self.prioritized_replay_eps,
+                memmap_dir=memmap_dir,
+                frame_stack=4 if self.compress_memory else 1,
             )
         else:
             self.replay_buffer = TransitionReplayBuffer(
@@ -117,6 +123,8 @@ class HL_GAUSS_BBF(Q_Network_Family):
                 self.observation_space,
                 1,
                 prediction_depth=max(self.prediction_depth, self.n_step),
+                memmap_dir=memmap_dir,
+                frame_stack=4 if self.compress_memory else 1,
             )
 
     def setup_model(self):
@@ -159,17 +167,15 @@ class HL_GAUSS_BBF(Q_Network_Family):
         self._train_step = jax.jit(self._train_step)
 
     def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(
-                self._get_actions(
-                    self.target_params,
-                    obs,
-                    next(self.key_seq) if self.param_noise else None,
-                )
+        actor = self.acting_agent()
+        return np.asarray(
+            self.act(
+                actor.target_params,
+                obs,
+                next(actor.key_seq),
+                epsilon,
             )
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
+        )
 
     def get_q(self, params, obses, key=None) -> jnp.ndarray:
         return self.model(params, key, self.preproc(params, key, obses))
@@ -316,11 +322,12 @@ class HL_GAUSS_BBF(Q_Network_Family):
         obses = convert_jax(obses)
         actions = actions.astype(jnp.int32)
         not_terminateds = 1.0 - terminateds
+        # the uint8 frames are augmented as float32, PreProcess still scales them
         obses = [
             jax.lax.cond(
                 len(o.shape) >= 5,
-                lambda: self._image_augmentation(o, key),
-                lambda: o,
+                lambda: self._image_augmentation(o.astype(jnp.float32), key),
+                lambda: o.astype(jnp.float32),
             )
             for o in obses
         ]
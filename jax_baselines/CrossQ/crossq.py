@@ -37,6 +37,12 @@ class CrossQ(Deteministic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        compress_memory=False,
+        prefetch_sampler=False,
+        scanned_updates=False,
+        eval_workers=1,
+        async_eval=False,
+        cpu_actor_update_freq=0,
     ):
         super().__init__(
             env_builder,
@@ -65,6 +71,12 @@ class CrossQ(Deteministic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            compress_memory,
+            prefetch_sampler,
+            scanned_updates,
+            eval_workers,
+            async_eval,
+            cpu_actor_update_freq,
         )
 
         self.name = "CrossQ"
@@ -135,30 +147,21 @@ class CrossQ(Deteministic_Policy_Gradient_Family):
         return pi
 
     def actions(self, obs, steps, eval=False):
+        actor = self.acting_agent()
         if self.simba:
             if steps != np.inf:
                 self.obs_rms.update(obs)
             obs = self.obs_rms.normalize(obs)
 
         if self.learning_starts < steps:
-            actions = np.asarray(self._get_actions(self.policy_params, obs, next(self.key_seq)))
+            actions = np.asarray(self._get_actions(actor.policy_params, obs, next(actor.key_seq)))
         else:
-            actions = np.random.uniform(-1.0, 1.0, size=(self.worker_size, self.action_size[0]))
+            actions = np.random.uniform(-1.0, 1.0, size=(len(obs[0]), self.action_size[0]))
         return actions
 
     def train_step(self, steps, gradient_steps):
         # Sample a batch from the replay buffer
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
-            if self.simba:
-                data["obses"] = self.obs_rms.normalize(data["obses"])
-                data["nxtobses"] = self.obs_rms.normalize(data["nxtobses"])
-
+        if self.scanned_updates:
             (
                 self.policy_params,
                 self.critic_params,
@@ -168,19 +171,57 @@ class CrossQ(Deteministic_Policy_Gradient_Family):
                 t_mean,
                 self.log_ent_coef,
                 new_priorities,
-            ) = self._train_step(
-                self.policy_params,
-                self.critic_params,
-                self.opt_policy_state,
-                self.opt_critic_state,
-                next(self.key_seq),
-                self.train_steps_count,
-                self.log_ent_coef,
-                **data
+            ) = self.sample_scanned_train_step(
+                gradient_steps,
+                (
+                    self.policy_params,
+                    self.critic_params,
+                    self.opt_policy_state,
+                    self.opt_critic_state,
+                    next(self.key_seq),
+                    self.train_steps_count + 1,
+                    self.log_ent_coef,
+                ),
+                {0: 0, 1: 1, 2: 2, 3: 3, 6: 6},
+                step_arg=5,
+                key_arg=4,
             )
+            self.train_steps_count += gradient_steps
+            loss, t_mean = jnp.mean(loss), jnp.mean(t_mean)
+        else:
+            for _ in range(gradient_steps):
+                self.train_steps_count += 1
+                if self.prioritized_replay:
+                    data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
+                else:
+                    data = self.replay_buffer.sample(self.batch_size)
+
+                if self.simba:
+                    data["obses"] = self.obs_rms.normalize(data["obses"])
+                    data["nxtobses"] = self.obs_rms.normalize(data["nxtobses"])
+
+                (
+                    self.policy_params,
+                    self.critic_params,
+                    self.opt_policy_state,
+                    self.opt_critic_state,
+                    loss,
+                    t_mean,
+                    self.log_ent_coef,
+                    new_priorities,
+                ) = self._train_step(
+                    self.policy_params,
+                    self.critic_params,
+                    self.opt_policy_state,
+                    self.opt_critic_state,
+                    next(self.key_seq),
+                    self.train_steps_count,
+                    self.log_ent_coef,
+                    **data
+                )
 
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+                if self.prioritized_replay:
+                    self.replay_buffer.update_priorities(data["indexes"], new_priorities)
 
         if self.logger_run and steps % self.log_interval == 0:
             self.logger_run.log_metric("loss/qloss", loss, steps)
@@ -273,7 +314,7 @@ class CrossQ(Deteministic_Policy_Gradient_Family):
         if self.prioritized_replay:
             new_priorities = abs_error
         if self.scaled_by_reset:
-            policy_params = scaled_by_reset(
+            policy_params, opt_policy_state = scaled_by_reset(
                 policy_params,
                 opt_policy_state,
                 self.optimizer,
@@ -282,7 +323,7 @@ class CrossQ(Deteministic_Policy_Gradient_Family):
                 self.reset_freq,
                 0.1,  # tau = 0.1 is softreset, but original paper uses 1.0
             )
-            critic_params = scaled_by_reset(
+            critic_params, opt_critic_state = scaled_by_reset(
                 critic_params,
                 opt_critic_state,
                 self.optimizer,
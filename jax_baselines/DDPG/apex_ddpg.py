@@ -39,6 +39,9 @@ class APE_X_DDPG(Ape_X_Deteministic_Policy_Gradient_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        inference_server=False,
+        replay_shards=0,
+        pipeline_batches=0,
     ):
         super().__init__(
             workers,
@@ -66,6 +69,9 @@ class APE_X_DDPG(Ape_X_Deteministic_Policy_Gradient_Family):
             seed,
             optimizer,
             compress_memory,
+            inference_server,
+            replay_shards,
+            pipeline_batches,
         )
 
         if _init_setup_model:
@@ -2,6 +2,8 @@ import os
 from collections import deque
 
 import gymnasium as gym
+import jax
+import jax.numpy as jnp
 import numpy as np
 from tqdm.auto import trange
 
@@ -11,10 +13,20 @@ from jax_baselines.common.cpprb_buffers import (
     PrioritizedReplayBuffer,
     ReplayBuffer,
 )
+from jax_baselines.common.cpu_actor import CPUActor
 from jax_baselines.common.env_builer import VectorizedEnv
+from jax_baselines.common.evaluator import AsyncEvaluator, vectorized_eval
 from jax_baselines.common.logger import TensorboardLogger
 from jax_baselines.common.optimizer import select_optimizer
-from jax_baselines.common.utils import RunningMeanStd, key_gen, restore, save
+from jax_baselines.common.prefetch_buffer import PrefetchReplayBuffer
+from jax_baselines.common.utils import (
+    RunningMeanStd,
+    key_gen,
+    restore,
+    save,
+    scan_train_step,
+    split_batch,
+)
 
 
 class Deteministic_Policy_Gradient_Family(object):
@@ -46,12 +58,23 @@ class Deteministic_Policy_Gradient_Family(object):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        compress_memory=False,
+        prefetch_sampler=False,
+        scanned_updates=False,
+        eval_workers=1,
+        async_eval=False,
+        cpu_actor_update_freq=0,
     ):
         self.name = "Deteministic_Policy_Gradient_Family"
         self.env_builder = env_builder
         self.model_builder_maker = model_builder_maker
         self.num_workers = num_workers
         self.eval_eps = eval_eps
+        self.eval_workers = eval_workers
+        self.async_eval = async_eval
+        self.async_evaluator = None
+        self.cpu_actor_update_freq = cpu_actor_update_freq
+        self.cpu_actor = None
         self.log_interval = log_interval
         self.policy_kwargs = policy_kwargs
         self.seed = 42 if seed is None else seed
@@ -83,8 +106,14 @@ class Deteministic_Policy_Gradient_Family(object):
         self.save_path = None
         self.optimizer = select_optimizer(optimizer, self.learning_rate, 1e-3 / self.batch_size)
 
+        self.compress_memory = compress_memory
+        self.prefetch_sampler = prefetch_sampler
+        self.scanned_updates = scanned_updates
+        self._scanned_train_step = None
+
         self.get_env_setup()
         self.get_memory_setup()
+        self.act = jax.jit(self.act)
 
         if self.simba:
             self.obs_rms = RunningMeanStd(shapes=self.observation_space, dtype=np.float64)
@@ -97,7 +126,7 @@ class Deteministic_Policy_Gradient_Family(object):
 
     def get_env_setup(self):
         self.env = self.env_builder(self.num_workers)
-        self.eval_env = self.env_builder(1)
+        self.eval_env = self.env_builder(self.eval_workers, evaluation=True)
 
         print("----------------------env------------------------")
         if isinstance(self.env, VectorizedEnv):
@@ -106,6 +135,7 @@ class Deteministic_Policy_Gradient_Family(object):
             self.observation_space = [list(env_info["observation_space"].shape)]
             self.action_size = [env_info["action_space"].shape[0]]
             self.worker_size = self.env.worker_num
+            self.env_batch_size = self.env.batch_size
             self.env_type = "VectorizedEnv"
 
         elif isinstance(self.env, gym.Env) or isinstance(self.env, gym.Wrapper):
@@ -115,11 +145,15 @@ class Deteministic_Policy_Gradient_Family(object):
             self.observation_space = [list(observation_space.shape)]
             self.action_size = [action_space.shape[0]]
             self.worker_size = 1
+            self.env_batch_size = 1
             self.env_type = "SingleEnv"
 
         print("observation size : ", self.observation_space)
         print("action size : ", self.action_size)
         print("worker_size : ", self.worker_size)
+        self.env_ids = None
+        if self.env_batch_size < self.worker_size:
+            print("async env batch size : ", self.env_batch_size)
         print("-------------------------------------------------")
 
     def get_memory_setup(self):
@@ -133,7 +167,7 @@ class Deteministic_Policy_Gradient_Family(object):
                     self.n_step,
                     self.gamma,
                     self.prioritized_replay_alpha,
-                    False,
+                    self.compress_memory,
                     self.prioritized_replay_eps,
                 )
             else:
@@ -142,8 +176,9 @@ class Deteministic_Policy_Gradient_Family(object):
                     self.observation_space,
                     self.prioritized_replay_alpha,
                     self.action_size,
-                    False,
+                    self.compress_memory,
                     self.prioritized_replay_eps,
+                    self.worker_size,
                 )
 
         else:
@@ -155,11 +190,56 @@ class Deteministic_Policy_Gradient_Family(object):
                     self.worker_size,
                     self.n_step,
                     self.gamma,
+                    self.compress_memory,
                 )
             else:
                 self.replay_buffer = ReplayBuffer(
-                    self.buffer_size, self.observation_space, self.action_size
+                    self.buffer_size,
+                    self.observation_space,
+                    self.action_size,
+                    self.compress_memory,
+                    worker_size=self.worker_size,
                 )
+        self.replay_buffer.memory_report()
+        if self.prefetch_sampler:
+            self.replay_buffer = PrefetchReplayBuffer(
+                self.replay_buffer,
+                self.batch_size * (self.gradient_steps if self.scanned_updates else 1),
+                self.prioritized_replay_beta0 if self.prioritized_replay else None,
+            )
+
+    def sample_scanned_train_step(
+        self, gradient_steps, args, carry_map, step_arg=None, key_arg=None
+    ):
+        """Sample all batches at once and run gradient_steps train steps in one ``lax.scan``.
+
+        :param args: (tuple) arguments of _train_step for the first step, without the batch
+        :param carry_map: (dict) argument index -> index of the output that replaces it in the next
+            step, e.g. the parameters and optimizer states
+        :param step_arg: (int) index of the step counter argument, increased by one every step
+        :param key_arg: (int) index of the PRNG key argument, split every step
+        :return: (tuple) outputs of _train_step, carried outputs of the last step and the others
+            (losses, priorities...) stacked over the steps. The batches are sampled before the
+            first step, so the priority updates of this call are not seen by its later steps.
+        """
+        if self._scanned_train_step is None:
+            self._scanned_train_step = jax.jit(
+                scan_train_step(self._train_step, carry_map, step_arg, key_arg)
+            )
+        if self.prioritized_replay:
+            data = self.replay_buffer.sample(
+                gradient_steps * self.batch_size, self.prioritized_replay_beta0
+            )
+        else:
+            data = self.replay_buffer.sample(gradient_steps * self.batch_size)
+        if self.simba:
+            data["obses"] = self.obs_rms.normalize(data["obses"])
+            data["nxtobses"] = self.obs_rms.normalize(data["nxtobses"])
+        indexes = data.pop("indexes", None)
+        outputs = self._scanned_train_step(*args, **split_batch(data, gradient_steps))
+        if self.prioritized_replay:
+            self.replay_buffer.update_priorities(indexes, np.reshape(outputs[-1], -1))
+        return outputs
 
     def setup_model(self):
         pass
@@ -170,6 +250,32 @@ class Deteministic_Policy_Gradient_Family(object):
     def _get_actions(self, params, obses) -> np.ndarray:
         pass
 
+    def act(self, params, obs, key, noise_scale):
+        """Deterministic policy actions with gaussian exploration noise in one jitted call.
+
+        The noise is drawn on the device from key, only the final float actions are transferred
+        back.
+
+        :param params: (dict) parameters of the policy
+        :param obs: (list) observations of all envs
+        :param key: (jax.random.PRNGKey) key of the exploration noise
+        :param noise_scale: (float) standard deviation of the noise, 0 for the greedy actions
+        :return: (jnp.ndarray) actions clipped to [-1, 1]
+        """
+        actions = self._get_actions(params, obs, None)
+        noise = jax.random.normal(key, actions.shape)
+        return jnp.clip(actions + noise_scale * noise, -1, 1)
+
+    def acting_agent(self):
+        """The object action selection reads its parameters and keys from.
+
+        :return: (object) the agent, or its CPUActor with the host copy of the parameters
+        """
+        if self.cpu_actor is None:
+            return self
+        self.cpu_actor.update(self.train_steps_count)
+        return self.cpu_actor
+
     def actions(self, obs, steps, eval=False):
         pass
 
@@ -200,16 +306,29 @@ class Deteministic_Policy_Gradient_Family(object):
         run_name="DPG_network",
     ):
         run_name = self.run_name_update(run_name)
-        self.eval_freq = ((total_timesteps // 100) // self.worker_size) * self.worker_size
+        self.eval_freq = ((total_timesteps // 100) // self.env_batch_size) * self.env_batch_size
 
-        pbar = trange(0, total_timesteps, self.worker_size, miniters=log_interval)
+        pbar = trange(0, total_timesteps, self.env_batch_size, miniters=log_interval)
         self.logger = TensorboardLogger(run_name, experiment_name, self.log_dir, self)
         with self.logger as self.logger_run:
+            if self.async_eval:
+                self.async_evaluator = AsyncEvaluator(self)
+            if self.cpu_actor_update_freq > 0 and self.env_type != "JaxEnv":
+                self.cpu_actor = CPUActor(self, self.cpu_actor_update_freq)
             if self.env_type == "SingleEnv":
                 self.learn_SingleEnv(pbar, callback, log_interval)
             if self.env_type == "VectorizedEnv":
                 self.learn_VectorizedEnv(pbar, callback, log_interval)
 
+            if self.async_evaluator is not None:
+                self.async_evaluator.close()
+                self.async_evaluator = None
+            if self.cpu_actor is not None:
+                self.cpu_actor.close()
+                self.cpu_actor = None
+            if isinstance(self.replay_buffer, PrefetchReplayBuffer):
+                # stops the sampler thread, the next learn starts a new one
+                self.replay_buffer.close()
             self.eval(total_timesteps)
 
             self.save_params(self.logger_run.get_local_path("params"))
@@ -247,11 +366,14 @@ class Deteministic_Policy_Gradient_Family(object):
 
         for steps in pbar:
             obs = self.env.current_obs()
+            if self.env.async_step:
+                # envs of the current obs, for per env exploration state
+                self.env_ids = self.env.env_ids
             actions = self.actions([obs], steps)
             self.env.step(actions)
 
             if steps > self.learning_starts and steps % self.train_freq == 0:
-                for idx in range(self.worker_size):
+                for idx in range(self.env_batch_size):
                     loss = self.train_step(steps + idx, self.gradient_steps)
                     self.lossque.append(loss)
 
@@ -263,7 +385,14 @@ class Deteministic_Policy_Gradient_Family(object):
                 infos,
             ) = self.env.get_result()
 
-            self.replay_buffer.add([obs], actions, rewards, [next_obses], terminateds, truncateds)
+            env_ids = None
+            if self.env.async_step:
+                # the results are of the envs which finished first, not of the obs stepped above
+                obs, actions = self.env.result_obs, self.env.result_actions
+                env_ids = self.env.env_ids
+            self.replay_buffer.add(
+                [obs], actions, rewards, [next_obses], terminateds, truncateds, env_ids=env_ids
+            )
             if steps % self.eval_freq == 0:
                 eval_result = self.eval(steps)
 
@@ -271,26 +400,16 @@ class Deteministic_Policy_Gradient_Family(object):
                 pbar.set_description(self.discription(eval_result))
 
     def eval(self, steps):
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
-
-        obs, info = self.eval_env.reset()
-        obs = [np.expand_dims(obs, axis=0)]
-        terminated = False
-        truncated = False
-        eplen = 0
-
-        for ep in range(self.eval_eps):
-            while not terminated and not truncated:
-                actions = self.actions(obs, steps, eval=True)
-                observation, reward, terminated, truncated, info = self.eval_env.step(actions[0])
-                obs = [np.expand_dims(observation, axis=0)]
-                total_reward[ep] += reward
-                eplen += 1
-
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
+        if self.async_evaluator is not None:
+            return self.async_evaluator.submit(steps)
+        if self.eval_workers > 1:
+            total_reward, total_ep_len, total_truncated, _ = vectorized_eval(
+                self.eval_env, lambda obs: self.actions([obs], steps, eval=True), self.eval_eps
+            )
+        else:
+            total_reward = np.zeros(self.eval_eps)
+            total_ep_len = np.zeros(self.eval_eps)
+            total_truncated = np.zeros(self.eval_eps)
 
             obs, info = self.eval_env.reset()
             obs = [np.expand_dims(obs, axis=0)]
@@ -298,6 +417,25 @@ class Deteministic_Policy_Gradient_Family(object):
             truncated = False
             eplen = 0
 
+            for ep in range(self.eval_eps):
+                while not terminated and not truncated:
+                    actions = self.actions(obs, steps, eval=True)
+                    observation, reward, terminated, truncated, info = self.eval_env.step(
+                        actions[0]
+                    )
+                    obs = [np.expand_dims(observation, axis=0)]
+                    total_reward[ep] += reward
+                    eplen += 1
+
+                total_ep_len[ep] = eplen
+                total_truncated[ep] = float(truncated)
+
+                obs, info = self.eval_env.reset()
+                obs = [np.expand_dims(obs, axis=0)]
+                terminated = False
+                truncated = False
+                eplen = 0
+
         mean_reward = np.mean(total_reward)
         mean_ep_len = np.mean(total_ep_len)
 
@@ -42,6 +42,9 @@ class APE_X_DQN(Ape_X_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        inference_server=False,
+        replay_shards=0,
+        pipeline_batches=0,
     ):
         super().__init__(
             workers,
@@ -73,6 +76,9 @@ class APE_X_DQN(Ape_X_Family):
             seed,
             optimizer,
             compress_memory,
+            inference_server,
+            replay_shards,
+            pipeline_batches,
         )
 
         if _init_setup_model:
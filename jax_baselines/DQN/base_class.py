@@ -2,6 +2,8 @@ import os
 from collections import deque
 
 import gymnasium as gym
+import jax
+import jax.numpy as jnp
 import numpy as np
 from tqdm.auto import trange
 
@@ -11,11 +13,25 @@ from jax_baselines.common.cpprb_buffers import (
     PrioritizedReplayBuffer,
     ReplayBuffer,
 )
+from jax_baselines.common.cpu_actor import CPUActor
 from jax_baselines.common.env_builer import VectorizedEnv
+from jax_baselines.common.evaluator import AsyncEvaluator, vectorized_eval
+from jax_baselines.common.jax_buffers import (
+    JaxPrioritizedReplayBuffer,
+    JaxReplayBuffer,
+)
+from jax_baselines.common.jax_envs import JaxVectorizedEnv
 from jax_baselines.common.logger import TensorboardLogger
 from jax_baselines.common.optimizer import select_optimizer
+from jax_baselines.common.prefetch_buffer import PrefetchReplayBuffer
 from jax_baselines.common.schedules import ConstantSchedule, LinearSchedule
-from jax_baselines.common.utils import key_gen, restore, save
+from jax_baselines.common.utils import (
+    key_gen,
+    restore,
+    save,
+    scan_train_step,
+    split_batch,
+)
 
 
 class Q_Network_Family(object):
@@ -53,12 +69,23 @@ class Q_Network_Family(object):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_buffer=False,
+        prefetch_sampler=False,
+        scanned_updates=False,
+        eval_workers=1,
+        async_eval=False,
+        cpu_actor_update_freq=0,
     ):
         self.name = "Q_Network_Family"
         self.env_builder = env_builder
         self.model_builder_maker = model_builder_maker
         self.num_workers = num_workers
         self.eval_eps = eval_eps
+        self.eval_workers = eval_workers
+        self.async_eval = async_eval
+        self.async_evaluator = None
+        self.cpu_actor_update_freq = cpu_actor_update_freq
+        self.cpu_actor = None
         self.log_interval = log_interval
         self.policy_kwargs = policy_kwargs
         self.seed = 42 if seed is None else seed
@@ -100,9 +127,14 @@ class Q_Network_Family(object):
         self.optimizer = select_optimizer(optimizer, self.learning_rate, 1e-3 / self.batch_size)
 
         self.compress_memory = compress_memory
+        self.device_buffer = device_buffer
+        self.prefetch_sampler = prefetch_sampler and not device_buffer
+        self.scanned_updates = scanned_updates
+        self._scanned_train_step = None
 
         self.get_env_setup()
         self.get_memory_setup()
+        self.act = jax.jit(self.act)
 
     def save_params(self, path):
         save(path, self.params)
@@ -112,15 +144,28 @@ class Q_Network_Family(object):
 
     def get_env_setup(self):
         self.env = self.env_builder(self.num_workers)
-        self.eval_env = self.env_builder(1)
+        self.eval_env = self.env_builder(self.eval_workers, evaluation=True)
 
         print("----------------------env------------------------")
-        if isinstance(self.env, VectorizedEnv):
+        if isinstance(self.env, JaxVectorizedEnv):
+            print("Jax environmet")
+            env_info = self.env.env_info
+            self.observation_space = [list(env_info["observation_space"].shape)]
+            self.action_size = [env_info["action_space"].n]
+            self.worker_size = self.env.worker_num
+            self.env_batch_size = self.env.batch_size
+            self.env_type = "JaxEnv"
+            self._jax_env_steps = jax.jit(
+                self._jax_env_steps, static_argnums=(0,), donate_argnums=(1,)
+            )
+
+        elif isinstance(self.env, VectorizedEnv):
             print("Vectorized environmet")
             env_info = self.env.env_info
             self.observation_space = [list(env_info["observation_space"].shape)]
             self.action_size = [env_info["action_space"].n]
             self.worker_size = self.env.worker_num
+            self.env_batch_size = self.env.batch_size
             self.env_type = "VectorizedEnv"
 
         elif isinstance(self.env, gym.Env) or isinstance(self.env, gym.Wrapper):
@@ -130,14 +175,20 @@ class Q_Network_Family(object):
             self.observation_space = [list(observation_space.shape)]
             self.action_size = [action_space.n]
             self.worker_size = 1
+            self.env_batch_size = 1
             self.env_type = "SingleEnv"
 
         print("observation size : ", self.observation_space)
         print("action size : ", self.action_size)
         print("worker_size : ", self.worker_size)
+        if self.env_batch_size < self.worker_size:
+            print("async env batch size : ", self.env_batch_size)
         print("-------------------------------------------------")
 
     def get_memory_setup(self):
+        if self.device_buffer or self.env_type == "JaxEnv":
+            self.get_device_memory_setup()
+            return
         if self.prioritized_replay:
             if self.n_step_method:
                 self.replay_buffer = PrioritizedNstepReplayBuffer(
@@ -148,7 +199,7 @@ class Q_Network_Family(object):
                     self.n_step,
                     self.gamma,
                     self.prioritized_replay_alpha,
-                    False,
+                    self.compress_memory,
                     self.prioritized_replay_eps,
                 )
             else:
@@ -157,8 +208,9 @@ class Q_Network_Family(object):
                     self.observation_space,
                     self.prioritized_replay_alpha,
                     1,
-                    False,
+                    self.compress_memory,
                     self.prioritized_replay_eps,
+                    self.worker_size,
                 )
 
         else:
@@ -170,9 +222,117 @@ class Q_Network_Family(object):
                     self.worker_size,
                     self.n_step,
                     self.gamma,
+                    self.compress_memory,
                 )
             else:
-                self.replay_buffer = ReplayBuffer(self.buffer_size, self.observation_space, 1)
+                self.replay_buffer = ReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    1,
+                    self.compress_memory,
+                    worker_size=self.worker_size,
+                )
+        self.replay_buffer.memory_report()
+        if self.prefetch_sampler:
+            self.replay_buffer = PrefetchReplayBuffer(
+                self.replay_buffer,
+                self.batch_size * (self.gradient_steps if self.scanned_updates else 1),
+                self.prioritized_replay_beta0 if self.prioritized_replay else None,
+            )
+
+    def get_device_memory_setup(self):
+        assert not self.n_step_method, "device_buffer stores 1 step transitions only"
+        if self.prioritized_replay:
+            self.replay_buffer = JaxPrioritizedReplayBuffer(
+                self.buffer_size,
+                self.observation_space,
+                self.prioritized_replay_alpha,
+                1,
+                self.prioritized_replay_eps,
+                self.seed,
+            )
+        else:
+            self.replay_buffer = JaxReplayBuffer(
+                self.buffer_size, self.observation_space, 1, self.seed
+            )
+        self.replay_buffer.memory_report()
+        self._device_train_step = jax.jit(self._device_train_step, donate_argnums=(0,))
+        self._device_scanned_train_step = jax.jit(
+            self._device_scanned_train_step, static_argnums=(2,), donate_argnums=(0,)
+        )
+
+    def sample_train_step(self, *args):
+        """Sample a batch, run ``_train_step(*args, **batch)`` and update the priorities.
+
+        With device_buffer, sampling and the priority update are traced into the same compiled
+        call as the train step and the buffer state never leaves the device.
+        """
+        if self.device_buffer:
+            self.replay_buffer.state, outputs = self._device_train_step(
+                self.replay_buffer.state, self.prioritized_replay_beta0, *args
+            )
+            return outputs
+        if self.prioritized_replay:
+            data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
+        else:
+            data = self.replay_buffer.sample(self.batch_size)
+        outputs = self._train_step(*args, **data)
+        if self.prioritized_replay:
+            self.replay_buffer.update_priorities(data["indexes"], outputs[-1])
+        return outputs
+
+    def _device_train_step(self, buffer_state, beta, *args):
+        buffer_state, data = self.replay_buffer.sample_fn(buffer_state, self.batch_size, beta)
+        outputs = self._train_step(*args, **data)
+        if self.prioritized_replay:
+            buffer_state = self.replay_buffer.update_priorities_fn(
+                buffer_state, data["indexes"], outputs[-1]
+            )
+        return buffer_state, outputs
+
+    def sample_scanned_train_step(self, gradient_steps, *args):
+        """Sample all batches at once and run gradient_steps train steps in one ``lax.scan``.
+
+        args are the ones of sample_train_step for the first step, the step counter is increased
+        and the key is split every step. The parameters and optimizer states of the last step are
+        returned, the losses and priorities are stacked over the steps. The batches are sampled
+        before the first step, so the priority updates of this call are not seen by its later steps.
+        """
+        if self._scanned_train_step is None:
+            n_state = len(args) - 2
+            self._scanned_train_step = jax.jit(
+                scan_train_step(
+                    self._train_step, dict((i, i) for i in range(n_state)), n_state, n_state + 1
+                )
+            )
+        if self.device_buffer:
+            self.replay_buffer.state, outputs = self._device_scanned_train_step(
+                self.replay_buffer.state, self.prioritized_replay_beta0, gradient_steps, *args
+            )
+            return outputs
+        if self.prioritized_replay:
+            data = self.replay_buffer.sample(
+                gradient_steps * self.batch_size, self.prioritized_replay_beta0
+            )
+        else:
+            data = self.replay_buffer.sample(gradient_steps * self.batch_size)
+        indexes = data.pop("indexes", None)
+        outputs = self._scanned_train_step(*args, **split_batch(data, gradient_steps))
+        if self.prioritized_replay:
+            self.replay_buffer.update_priorities(indexes, np.reshape(outputs[-1], -1))
+        return outputs
+
+    def _device_scanned_train_step(self, buffer_state, beta, gradient_steps, *args):
+        buffer_state, data = self.replay_buffer.sample_fn(
+            buffer_state, gradient_steps * self.batch_size, beta
+        )
+        indexes = data.pop("indexes", None)
+        outputs = self._scanned_train_step(*args, **split_batch(data, gradient_steps))
+        if self.prioritized_replay:
+            buffer_state = self.replay_buffer.update_priorities_fn(
+                buffer_state, indexes, outputs[-1].reshape(-1)
+            )
+        return buffer_state, outputs
 
     def setup_model(self):
         pass
@@ -183,16 +343,37 @@ class Q_Network_Family(object):
     def _get_actions(self, params, obses) -> np.ndarray:
         pass
 
+    def act(self, params, obs, key, epsilon):
+        """Epsilon greedy actions of all envs in one jitted call.
+
+        The greedy actions, the random actions and the per env exploration draw are computed on
+        the device from key, only the final int actions are transferred back.
+
+        :param params: (dict) parameters of the q network
+        :param obs: (list) observations of all envs
+        :param key: (jax.random.PRNGKey) key of this step, split for the noise, actions and draw
+        :param epsilon: (float) probability of a random action
+        :return: (jnp.ndarray) actions of shape [n_envs, 1]
+        """
+        actions_key, random_key, epsilon_key = jax.random.split(key, 3)
+        actions = self._get_actions(params, obs, actions_key if self.param_noise else None)
+        random_actions = jax.random.randint(random_key, actions.shape, 0, self.action_size[0])
+        explore = jax.random.uniform(epsilon_key, (actions.shape[0], 1)) < epsilon
+        return jnp.where(explore, random_actions, actions)
+
+    def acting_agent(self):
+        """The object action selection reads its parameters and keys from.
+
+        :return: (object) the agent, or its CPUActor with the host copy of the parameters
+        """
+        if self.cpu_actor is None:
+            return self
+        self.cpu_actor.update(self.train_steps_count)
+        return self.cpu_actor
+
     def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(
-                self._get_actions(
-                    self.params, obs, next(self.key_seq) if self.param_noise else None
-                )
-            )
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
+        actor = self.acting_agent()
+        return np.asarray(self.act(actor.params, obs, next(actor.key_seq), epsilon))
 
     def discription(self, eval_result=None):
         discription = ""
@@ -250,16 +431,35 @@ class Q_Network_Family(object):
                 final_p=self.exploration_final_eps,
             )
         self.update_eps = 1.0
-        self.eval_freq = ((total_timesteps // 100) // self.worker_size) * self.worker_size
+        self.eval_freq = ((total_timesteps // 100) // self.env_batch_size) * self.env_batch_size
 
-        pbar = trange(0, total_timesteps, self.worker_size, miniters=log_interval)
+        if self.env_type == "JaxEnv":
+            # one compiled call steps the envs from one evaluation to the next
+            pbar = trange(0, total_timesteps, self.eval_freq)
+        else:
+            pbar = trange(0, total_timesteps, self.env_batch_size, miniters=log_interval)
         self.logger = TensorboardLogger(run_name, experiment_name, self.log_dir, self)
         with self.logger as self.logger_run:
+            if self.async_eval:
+                self.async_evaluator = AsyncEvaluator(self)
+            if self.cpu_actor_update_freq > 0 and self.env_type != "JaxEnv":
+                self.cpu_actor = CPUActor(self, self.cpu_actor_update_freq)
             if self.env_type == "SingleEnv":
                 self.learn_SingleEnv(pbar, callback, log_interval)
             if self.env_type == "VectorizedEnv":
                 self.learn_VectorizedEnv(pbar, callback, log_interval)
-
+            if self.env_type == "JaxEnv":
+                self.learn_JaxEnv(pbar, callback, log_interval)
+
+            if self.async_evaluator is not None:
+                self.async_evaluator.close()
+                self.async_evaluator = None
+            if self.cpu_actor is not None:
+                self.cpu_actor.close()
+                self.cpu_actor = None
+            if isinstance(self.replay_buffer, PrefetchReplayBuffer):
+                # stops the sampler thread, the next learn starts a new one
+                self.replay_buffer.close()
             self.eval(total_timesteps)
 
             self.save_params(self.logger_run.get_local_path("params"))
@@ -303,7 +503,7 @@ class Q_Network_Family(object):
             self.env.step(actions)
 
             if steps > self.learning_starts and steps % self.train_freq == 0:
-                for idx in range(self.worker_size):
+                for idx in range(self.env_batch_size):
                     loss = self.train_step(steps + idx, self.gradient_steps)
                     self.lossque.append(loss)
 
@@ -315,7 +515,14 @@ class Q_Network_Family(object):
                 infos,
             ) = self.env.get_result()
 
-            self.replay_buffer.add([obs], actions, rewards, [next_obses], terminateds, truncateds)
+            env_ids = None
+            if self.env.async_step:
+                # the results are of the envs which finished first, not of the obs stepped above
+                obs, actions = self.env.result_obs, self.env.result_actions
+                env_ids = self.env.env_ids
+            self.replay_buffer.add(
+                [obs], actions, rewards, [next_obses], terminateds, truncateds, env_ids=env_ids
+            )
 
             if steps % self.eval_freq == 0:
                 eval_result = self.eval(steps)
@@ -323,49 +530,177 @@ class Q_Network_Family(object):
             if steps % log_interval == 0 and eval_result is not None and len(self.lossque) > 0:
                 pbar.set_description(self.discription(eval_result))
 
-    def eval(self, steps):
-        original_rewards = []
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
+    def learn_JaxEnv(self, pbar, callback=None, log_interval=1000):
+        """Training loop of a JaxVectorizedEnv, compiled as a whole.
 
-        obs, info = self.eval_env.reset()
-        obs = [np.expand_dims(obs, axis=0)]
-        have_original_reward = "original_reward" in info.keys()
-        have_lives = "lives" in info.keys()
-        if have_original_reward:
-            original_reward = info["original_reward"]
-        terminated = False
-        truncated = False
-        eplen = 0
-
-        for ep in range(self.eval_eps):
-            while not terminated and not truncated:
-                actions = self.actions(obs, 0.001)
-                observation, reward, terminated, truncated, info = self.eval_env.step(actions[0][0])
-                obs = [np.expand_dims(observation, axis=0)]
-                if have_original_reward:
-                    original_reward += info["original_reward"]
-                total_reward[ep] += reward
-                eplen += 1
+        Action selection, the env step, the insert into the device replay buffer and the train
+        steps of ``eval_freq`` env steps run in one ``lax.scan``, Python only evaluates and logs in
+        between. Every ``train_freq`` env steps train ``gradient_steps`` steps, so one vector step
+        of the envs trains ``worker_size // train_freq * gradient_steps`` steps.
+        """
+        self.lossque = deque(maxlen=10)
+        eval_result = None
+        self.jax_env_train_steps = max(self.worker_size // self.train_freq, 1) * self.gradient_steps
+        n_steps = self.eval_freq // self.worker_size
+        carry = (
+            self.params,
+            self.target_params,
+            self.opt_state,
+            self.replay_buffer.state,
+            self.env.state,
+            self.env.obs,
+            next(self.key_seq),
+            jnp.asarray(self.train_steps_count, dtype=jnp.int32),
+        )
 
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
-            if have_original_reward:
-                if have_lives:
-                    if info["lives"] == 0:
-                        original_rewards.append(original_reward)
-                        original_reward = 0
-                else:
-                    original_rewards.append(original_reward)
-                    original_reward = 0
+        for steps in pbar:
+            carry, (losses, trained) = self._jax_env_steps(n_steps, carry, steps)
+            (
+                self.params,
+                self.target_params,
+                self.opt_state,
+                self.replay_buffer.state,
+                self.env.state,
+                self.env.obs,
+                _,
+                train_steps_count,
+            ) = carry
+            self.train_steps_count = int(train_steps_count)
+            self.replay_buffer.sync_size()
+            self.update_eps = float(self.jax_epsilon(steps + self.eval_freq))
+            trained = np.asarray(trained)
+            if trained.any():
+                loss = np.mean(np.asarray(losses)[trained])
+                self.lossque.append(loss)
+                if self.logger_run:
+                    self.logger_run.log_metric("loss/qloss", loss, steps + self.eval_freq)
+
+            eval_result = self.eval(steps + self.eval_freq)
+            if eval_result is not None and len(self.lossque) > 0:
+                pbar.set_description(self.discription(eval_result))
+
+    def jax_epsilon(self, steps):
+        if self.param_noise:
+            return 0.0
+        fraction = jnp.minimum(steps / self.exploration.schedule_timesteps, 1.0)
+        return self.exploration.initial_p + fraction * (
+            self.exploration.final_p - self.exploration.initial_p
+        )
+
+    def _jax_env_steps(self, n_steps, carry, steps):
+        def train(inputs):
+            params, target_params, opt_state, buffer_state, key, train_steps = inputs
+
+            def f(updates, key):
+                params, target_params, opt_state, buffer_state, train_steps = updates
+                train_steps = train_steps + 1
+                buffer_state, outputs = self._device_train_step(
+                    buffer_state,
+                    self.prioritized_replay_beta0,
+                    params,
+                    target_params,
+                    opt_state,
+                    train_steps,
+                    key if self.param_noise else None,
+                )
+                params, target_params, opt_state, loss = outputs[:4]
+                return (params, target_params, opt_state, buffer_state, train_steps), loss
+
+            updates, loss = jax.lax.scan(
+                f,
+                (params, target_params, opt_state, buffer_state, train_steps),
+                jax.random.split(key, self.jax_env_train_steps),
+            )
+            return updates, jnp.mean(loss)
+
+        def no_train(inputs):
+            params, target_params, opt_state, buffer_state, key, train_steps = inputs
+            return (params, target_params, opt_state, buffer_state, train_steps), jnp.zeros(())
+
+        def env_step(carry, steps):
+            params, target_params, opt_state, buffer_state, env_state, obs, key, train_steps = carry
+            key, actions_key, env_key, train_key = jax.random.split(key, 4)
+            actions = self.act(params, [obs], actions_key, self.jax_epsilon(steps))
+            env_state, next_obs, end_obs, rewards, terminateds, _ = self.env.step_fn(
+                env_key, env_state, actions
+            )
+            buffer_state = self.replay_buffer.add_fn(
+                buffer_state, [obs], actions, rewards, [end_obs], terminateds
+            )
+            trained = steps > self.learning_starts
+            (params, target_params, opt_state, buffer_state, train_steps), loss = jax.lax.cond(
+                trained,
+                train,
+                no_train,
+                (params, target_params, opt_state, buffer_state, train_key, train_steps),
+            )
+            carry = (
+                params,
+                target_params,
+                opt_state,
+                buffer_state,
+                env_state,
+                next_obs,
+                key,
+                train_steps,
+            )
+            return carry, (loss, trained)
+
+        return jax.lax.scan(env_step, carry, steps + jnp.arange(n_steps) * self.worker_size)
+
+    def eval(self, steps):
+        if self.async_evaluator is not None:
+            return self.async_evaluator.submit(steps)
+        if self.eval_workers > 1:
+            total_reward, total_ep_len, total_truncated, original_rewards = vectorized_eval(
+                self.eval_env, lambda obs: self.actions([obs], 0.001), self.eval_eps
+            )
+            have_original_reward = original_rewards is not None
+        else:
+            original_rewards = []
+            total_reward = np.zeros(self.eval_eps)
+            total_ep_len = np.zeros(self.eval_eps)
+            total_truncated = np.zeros(self.eval_eps)
 
             obs, info = self.eval_env.reset()
             obs = [np.expand_dims(obs, axis=0)]
+            have_original_reward = "original_reward" in info.keys()
+            have_lives = "lives" in info.keys()
+            if have_original_reward:
+                original_reward = info["original_reward"]
             terminated = False
             truncated = False
             eplen = 0
 
+            for ep in range(self.eval_eps):
+                while not terminated and not truncated:
+                    actions = self.actions(obs, 0.001)
+                    observation, reward, terminated, truncated, info = self.eval_env.step(
+                        actions[0][0]
+                    )
+                    obs = [np.expand_dims(observation, axis=0)]
+                    if have_original_reward:
+                        original_reward += info["original_reward"]
+                    total_reward[ep] += reward
+                    eplen += 1
+
+                total_ep_len[ep] = eplen
+                total_truncated[ep] = float(truncated)
+                if have_original_reward:
+                    if have_lives:
+                        if info["lives"] == 0:
+                            original_rewards.append(original_reward)
+                            original_reward = 0
+                    else:
+                        original_rewards.append(original_reward)
+                        original_reward = 0
+
+                obs, info = self.eval_env.reset()
+                obs = [np.expand_dims(obs, axis=0)]
+                terminated = False
+                truncated = False
+                eplen = 0
+
         if have_original_reward:
             mean_original_score = np.mean(original_rewards)
         mean_reward = np.mean(total_reward)
@@ -43,6 +43,12 @@ class DQN(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_buffer=False,
+        prefetch_sampler=False,
+        scanned_updates=False,
+        eval_workers=1,
+        async_eval=False,
+        cpu_actor_update_freq=0,
     ):
         super().__init__(
             env_builder,
@@ -77,6 +83,12 @@ class DQN(Q_Network_Family):
             seed,
             optimizer,
             compress_memory,
+            device_buffer,
+            prefetch_sampler,
+            scanned_updates,
+            eval_workers,
+            async_eval,
+            cpu_actor_update_freq,
         )
 
         self.name = "DQN"
@@ -113,13 +125,7 @@ class DQN(Q_Network_Family):
 
     def train_step(self, steps, gradient_steps):
         # Sample a batch from the replay buffer
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
+        if self.scanned_updates:
             (
                 self.params,
                 self.target_params,
@@ -127,17 +133,33 @@ class DQN(Q_Network_Family):
                 loss,
                 t_mean,
                 new_priorities,
-            ) = self._train_step(
+            ) = self.sample_scanned_train_step(
+                gradient_steps,
                 self.params,
                 self.target_params,
                 self.opt_state,
-                self.train_steps_count,
+                self.train_steps_count + 1,
                 next(self.key_seq) if self.param_noise else None,
-                **data
             )
-
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+            self.train_steps_count += gradient_steps
+            loss, t_mean = jnp.mean(loss), jnp.mean(t_mean)
+        else:
+            for _ in range(gradient_steps):
+                self.train_steps_count += 1
+                (
+                    self.params,
+                    self.target_params,
+                    self.opt_state,
+                    loss,
+                    t_mean,
+                    new_priorities,
+                ) = self.sample_train_step(
+                    self.params,
+                    self.target_params,
+                    self.opt_state,
+                    self.train_steps_count,
+                    next(self.key_seq) if self.param_noise else None,
+                )
 
         if self.logger_run and steps % self.log_interval == 0:
             self.logger_run.log_metric("loss/qloss", loss, steps)
@@ -52,6 +52,12 @@ class FQF(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_buffer=False,
+        prefetch_sampler=False,
+        scanned_updates=False,
+        eval_workers=1,
+        async_eval=False,
+        cpu_actor_update_freq=0,
     ):
         super().__init__(
             env_builder,
@@ -86,6 +92,12 @@ class FQF(Q_Network_Family):
             seed,
             optimizer,
             compress_memory,
+            device_buffer,
+            prefetch_sampler,
+            scanned_updates,
+            eval_workers,
+            async_eval,
+            cpu_actor_update_freq,
         )
 
         self.name = "FQF"
@@ -125,19 +137,20 @@ class FQF(Q_Network_Family):
         self._target = jax.jit(self._target)
         self._train_step = jax.jit(self._train_step)
 
+    def act(self, params, fqf_params, obs, key, epsilon):
+        actions_key, random_key, epsilon_key = jax.random.split(key, 3)
+        actions = self._get_actions(
+            params, fqf_params, obs, actions_key if self.param_noise else None
+        )
+        random_actions = jax.random.randint(random_key, actions.shape, 0, self.action_size[0])
+        explore = jax.random.uniform(epsilon_key, (actions.shape[0], 1)) < epsilon
+        return jnp.where(explore, random_actions, actions)
+
     def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(
-                self._get_actions(
-                    self.params,
-                    self.fqf_params,
-                    obs,
-                    next(self.key_seq) if self.param_noise else None,
-                )
-            )
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
+        actor = self.acting_agent()
+        return np.asarray(
+            self.act(actor.params, actor.fqf_params, obs, next(actor.key_seq), epsilon)
+        )
 
     def _get_actions(self, params, fqf_params, obses, key=None) -> jnp.ndarray:
         feature = self.preproc(params, key, convert_jax(obses))
@@ -159,13 +172,7 @@ class FQF(Q_Network_Family):
         return jnp.sum(q, axis=2)
 
     def train_step(self, steps, gradient_steps):
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
+        if self.scanned_updates:
             (
                 self.params,
                 self.fqf_params,
@@ -178,19 +185,47 @@ class FQF(Q_Network_Family):
                 t_std,
                 tau,
                 new_priorities,
-            ) = self._train_step(
+            ) = self.sample_scanned_train_step(
+                gradient_steps,
                 self.params,
                 self.fqf_params,
                 self.target_params,
                 self.opt_state,
                 self.fqf_opt_state,
-                self.train_steps_count,
+                self.train_steps_count + 1,
                 next(self.key_seq),
-                **data
             )
-
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+            self.train_steps_count += gradient_steps
+            loss, fqf_loss, t_mean, t_std = (
+                jnp.mean(loss),
+                jnp.mean(fqf_loss),
+                jnp.mean(t_mean),
+                jnp.mean(t_std),
+            )
+        else:
+            for _ in range(gradient_steps):
+                self.train_steps_count += 1
+                (
+                    self.params,
+                    self.fqf_params,
+                    self.target_params,
+                    self.opt_state,
+                    self.fqf_opt_state,
+                    loss,
+                    fqf_loss,
+                    t_mean,
+                    t_std,
+                    tau,
+                    new_priorities,
+                ) = self.sample_train_step(
+                    self.params,
+                    self.fqf_params,
+                    self.target_params,
+                    self.opt_state,
+                    self.fqf_opt_state,
+                    self.train_steps_count,
+                    next(self.key_seq),
+                )
 
         if self.logger_run and steps % self.log_interval == 0:
             self.logger_run.log_metric("loss/qloss", loss, steps)
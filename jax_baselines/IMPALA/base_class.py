@@ -1,6 +1,8 @@
 import multiprocessing as mp
 import time
 from collections import deque
+from functools import partial
+from itertools import repeat
 
 import gymnasium as gym
 import jax
@@ -11,7 +13,9 @@ from gymnasium import spaces
 from tqdm.auto import trange
 
 from jax_baselines.common.base_classes import TensorboardWriter, restore, save
+from jax_baselines.common.inference_server import Inference_server
 from jax_baselines.common.optimizer import select_optimizer
+from jax_baselines.common.param_channel import ParamChannel
 from jax_baselines.common.utils import convert_jax, key_gen
 from jax_baselines.IMPALA.cpprb_buffers import ImpalaBuffer
 
@@ -39,6 +43,7 @@ class IMPALA_Family(object):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        inference_server=False,
     ):
         self.name = "IMPALA_Family"
         self.workers = workers
@@ -68,6 +73,7 @@ class IMPALA_Family(object):
         self.optimizer = select_optimizer(optimizer, self.learning_rate, 1e-3 / self.batch_size)
         self.model_builder = None
         self.actor_builder = None
+        self.inference_server = inference_server
 
         self.get_env_setup()
         self.get_memory_setup()
@@ -144,6 +150,7 @@ class IMPALA_Family(object):
             discrete=(self.action_type == "discrete"),
             action_space=self.action_size,
             sample_size=self.sample_size,
+            length=self.batch_size,
         )
 
     def setup_model(self):
@@ -201,6 +208,17 @@ class IMPALA_Family(object):
 
         return builder
 
+    def get_inference_builder(self):
+        model_builder = self.model_builder
+        actor_builder = self.actor_builder
+
+        def builder():
+            preproc, actor_model, _ = model_builder()
+            actor, _, _ = actor_builder()
+            return partial(actor, actor_model, preproc), None, repeat(None)
+
+        return builder
+
     def discription(self):
         return "loss : {:.3f} |".format(np.mean(self.lossque))
 
@@ -230,35 +248,38 @@ class IMPALA_Family(object):
 
     def learn_SingleEnv(self, pbar, callback, log_interval):
         stop = self.m.Event()
-        update = [self.m.Event() for i in range(self.worker_num)]
         stop.clear()
-        for u in update:
-            u.set()
 
-        cpu_param = jax.device_put(self.params, jax.devices("cpu")[0])
-        param_server = Param_server.remote(ray.put(cpu_param))
+        param_channel = ParamChannel(self.params)
+        inference_server = None
+        if self.inference_server:
+            inference_server = Inference_server.remote(
+                self.get_inference_builder(), param_channel, self.worker_num
+            )
 
         jobs = []
         for idx in range(self.worker_num):
             jobs.append(
                 self.workers[idx].run.remote(
                     self.batch_size,
-                    self.buffer.queue_info(),
+                    self.buffer.buffer_info(idx),
                     self.model_builder,
                     self.actor_builder,
-                    param_server,
-                    update[idx],
+                    param_channel,
                     self.logger_server,
                     stop,
+                    inference_server,
                 )
             )
 
         print("Start Warmup")
-        while self.buffer.queue_is_empty():
+        while self.buffer.is_empty():
             time.sleep(1)
             if stop.is_set():
                 print("Stop Training")
                 _, still_running = ray.wait(jobs, timeout=300)
+                param_channel.close()
+                self.buffer.close()
                 self.m.shutdown()
                 return
 
@@ -274,31 +295,24 @@ class IMPALA_Family(object):
                 pbar.set_description(self.discription())
 
             if steps % self.update_freq == 0:
-                cpu_param = jax.device_put(self.params, jax.devices("cpu")[0])
-                param_server.update_params.remote(ray.put(cpu_param))
-                for u in update:
-                    u.set()
+                param_channel.publish(self.params)
+        print("------------------param channel------------------")
+        print(f"versions : {param_channel.version}, size : {param_channel.nbytes / 2**20:.2f} MB")
+        print("-------------------------------------------------")
+        if inference_server is not None:
+            stats = ray.get(inference_server.get_stats.remote())
+            print("-------------------inference---------------------")
+            print(f"batches : {stats['batches']}, mean batch : {stats['mean_batch']:.2f}")
+            print("-------------------------------------------------")
         self.logger_server.last_update.remote()
         stop.set()
-        while not self.buffer.queue.empty():
-            self.buffer.queue.get()
         _, still_running = ray.wait(jobs, timeout=300)
+        param_channel.close()
+        self.buffer.close()
         time.sleep(1)
         self.m.shutdown()
 
 
-@ray.remote
-class Param_server(object):
-    def __init__(self, params) -> None:
-        self.params = params
-
-    def get_params(self):
-        return self.params
-
-    def update_params(self, params):
-        self.params = params
-
-
 @ray.remote
 class Logger_server(object):
     def __init__(self, log_dir, log_name) -> None:
@@ -1,88 +1,181 @@
-import random
-from collections import deque, namedtuple
+import os
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
 
-import cpprb
 import numpy as np
-import ray
-from ray.util.queue import Queue
+
+from model_builder.flax.Module import get_obs_dtypes
 
 batch = namedtuple(
     "batch_tuple",
     ["obses", "actions", "mu_log_prob", "rewards", "nxtobses", "terminateds", "truncateds"],
 )
 
+FREE, WRITING, READY = 0, 1, 2
+
+
+class TrajectoryStore(object):
+    def __init__(self, slots_per_actor: int, actor_num: int, length: int, env_dict: dict):
+        """Trajectories in fixed shared memory slots, preallocated as ``[slots, T, ...]`` arrays.
+
+        Every actor owns ``slots_per_actor`` slots and writes its trajectories step by step
+        into a free one, the learner takes the ready slots. A slot has a state (free, writing,
+        ready), a version which is odd while the slot is written and the time it became ready.
+        As every slot has one writer and one reader, no lock is needed: an actor only writes
+        free slots, or with ``overwrite`` its oldest ready slot, and the learner checks the
+        version of the slots it copied.
+
+        The store is created by the learner and pickled to the actors, which attach to the
+        block by name. The learner frees the block with ``close``.
+
+        :param slots_per_actor: (int) slots of every actor
+        :param actor_num: (int) number of actors
+        :param length: (int) steps T of a trajectory
+        :param env_dict: (dict) cpprb style layout of a transition
+        """
+        self.slots_per_actor = slots_per_actor
+        self.slots = slots_per_actor * actor_num
+        self.length = length
+        self.layout = {}
+        offset = 3 * 8 * self.slots
+        for k, v in env_dict.items():
+            shape = v.get("shape", 1)
+            shape = (shape,) if isinstance(shape, int) else tuple(shape)
+            dtype = np.dtype(v.get("dtype", np.float32))
+            offset = (offset + 63) // 64 * 64
+            self.layout[k] = ((self.slots, length) + shape, dtype, offset)
+            offset += int(np.prod((self.slots, length) + shape)) * dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=offset)
+        self.owner = True
+        self.pid = os.getpid()
+        self._attach()
+        self.state[:] = FREE
+        self.version[:] = 0
+        self.ready_time[:] = 0
+
+    def __getstate__(self):
+        return (self.shm.name, self.pid, self.slots_per_actor, self.slots, self.length, self.layout)
+
+    def __setstate__(self, state):
+        name, self.pid, self.slots_per_actor, self.slots, self.length, self.layout = state
+        self.shm = shared_memory.SharedMemory(name=name)
+        if os.getpid() != self.pid:
+            # the block belongs to the learner, the tracker of an actor must not unlink it on exit
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.owner = False
+        self._attach()
+
+    def _attach(self):
+        header = np.ndarray((3, self.slots), dtype=np.int64, buffer=self.shm.buf)
+        self.state, self.version, self.ready_time = header
+        self.arrays = {
+            k: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            for k, (shape, dtype, offset) in self.layout.items()
+        }
 
-class EpochBuffer:
-    def __init__(self, size: int, env_dict: dict):
-        self.max_size = size
-        self.env_dict = env_dict
-        self.obsdict = dict((o, s) for o, s in env_dict.items() if o.startswith("obs"))
-        self.nextobsdict = dict((o, s) for o, s in env_dict.items() if o.startswith("next_obs"))
-        self.buffer = cpprb.ReplayBuffer(size, env_dict=env_dict)
+    @property
+    def nbytes(self):
+        return self.shm.size
 
-    def __len__(self):
-        return self.buffer.get_stored_size()
+    def ready(self):
+        return np.flatnonzero(self.state == READY)
 
-    def add(self, obs_t, action, log_prob, reward, nxtobs_t, terminated, truncted=False):
-        obsdict = dict(zip(self.obsdict.keys(), [o for o in obs_t]))
-        nextobsdict = dict(zip(self.nextobsdict.keys(), [no for no in nxtobs_t]))
-        self.buffer.add(
-            **obsdict,
-            action=action,
-            log_prob=log_prob,
-            reward=reward,
-            **nextobsdict,
-            terminated=terminated,
-            truncted=truncted
-        )
-        if terminated or terminated:
-            self.buffer.on_episode_end()
-
-    def get_buffer(self):
-        trans = self.buffer.get_all_transitions()
-        transitions = batch(
-            [trans[o] for o in self.obsdict.keys()],
-            trans["action"],
-            trans["log_prob"],
-            trans["reward"],
-            [trans[o] for o in self.nextobsdict.keys()],
-            trans["terminated"],
-            trans["truncted"],
-        )
-        return transitions
+    def take(self, n: int, replay=False):
+        """Copies ``n`` ready slots into one contiguous batch, waits until they are ready.
 
+        :param n: (int) number of trajectories
+        :param replay: (bool) sample random ready slots and keep them, instead of taking and
+            freeing the oldest ones
+        :return: (dict) ``[n, T, ...]`` arrays
+        """
+        while True:
+            ready = self.ready()
+            if len(ready) < n:
+                time.sleep(0.001)
+                continue
+            if replay:
+                idxs = np.random.choice(ready, n, replace=False)
+            else:
+                idxs = ready[np.argsort(self.ready_time[ready], kind="stable")[:n]]
+            versions = self.version[idxs].copy()
+            data = {k: v[idxs] for k, v in self.arrays.items()}
+            # with overwrite an actor can start to write a ready slot while it is copied
+            if np.all(versions % 2 == 0) and np.all(self.version[idxs] == versions):
+                break
+        if not replay:
+            self.state[idxs] = FREE
+        return data
+
+    def writer(self, actor: int, overwrite=False):
+        return TrajectoryWriter(self, actor, overwrite)
+
+    def close(self):
+        del self.state, self.version, self.ready_time, self.arrays
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class TrajectoryWriter(object):
+    def __init__(self, store: TrajectoryStore, actor: int, overwrite=False):
+        """An actor's handle to its slots of the ``TrajectoryStore``, a drop in for the
+        ``EpochBuffer`` of the actors which writes the steps in place.
+
+        :param store: (TrajectoryStore) the shared store
+        :param actor: (int) index of the actor
+        :param overwrite: (bool) reuse the oldest ready slot when no slot is free (replay)
+        """
+        self.store = store
+        self.own = np.arange(actor * store.slots_per_actor, (actor + 1) * store.slots_per_actor)
+        self.overwrite = overwrite
+        self.slot = None
+        self.t = 0
 
-@ray.remote(num_cpus=1)
-class Buffer_getter:
-    def __init__(self, queue, env_dict, actor_num, size, sample_size):
-        self.queue = queue
-        self.env_dict = env_dict
-        self.actor_num = actor_num
-        self.size = size
-        self.replay = size > 0
-        self.sample_size = sample_size
-        if self.replay:
-            self.replay_buffer = deque(maxlen=size)
-            self._sample = self.replay_sample
-        else:
-            self._sample = self.queue_sample
-
-    def sample(self):
-        return self._sample()
-
-    def queue_sample(self):
-        gets = [self.queue.get() for idx in range(self.sample_size)]
-        transitions = batch(*zip(*gets))
-        return transitions
+    def __len__(self):
+        return self.t
 
-    def replay_sample(self):
+    def acquire(self, stop=None):
+        """Waits for a free slot of this actor, returns False if ``stop`` is set meanwhile."""
+        store = self.store
         while True:
-            self.replay_buffer.extend(self.queue.get_nowait_batch(self.queue.size()))
-            if len(self.replay_buffer) >= self.sample_size:
+            free = self.own[store.state[self.own] == FREE]
+            if len(free) > 0:
+                self.slot = free[0]
                 break
-        gets = random.sample(self.replay_buffer, self.sample_size)
-        transitions = batch(*zip(*gets))
-        return transitions
+            if self.overwrite:
+                self.slot = self.own[np.argmin(store.ready_time[self.own])]
+                break
+            if stop is not None and stop.is_set():
+                return False
+            time.sleep(0.001)
+        store.state[self.slot] = WRITING
+        store.version[self.slot] += 1
+        self.t = 0
+        return True
+
+    def add(self, obs_t, action, log_prob, reward, nxtobs_t, terminated, truncted=False):
+        arrays, slot, t = self.store.arrays, self.slot, self.t
+        for idx, o in enumerate(obs_t):
+            arrays[f"obs{idx}"][slot, t] = o[0]
+        for idx, no in enumerate(nxtobs_t):
+            arrays[f"next_obs{idx}"][slot, t] = no[0]
+        arrays["action"][slot, t] = np.reshape(action, -1)
+        arrays["log_prob"][slot, t] = np.reshape(log_prob, -1)
+        arrays["reward"][slot, t] = reward
+        arrays["terminated"][slot, t] = terminated
+        arrays["truncted"][slot, t] = truncted
+        self.t += 1
+
+    def commit(self):
+        store = self.store
+        store.version[self.slot] += 1
+        store.ready_time[self.slot] = time.monotonic_ns()
+        store.state[self.slot] = READY
+        self.slot = None
+
+    def close(self):
+        self.store.close()
 
 
 class ImpalaBuffer:
@@ -94,26 +187,23 @@ class ImpalaBuffer:
         discrete=True,
         action_space=1,
         sample_size=32,
+        length=1024,
     ):
         self.max_size = replay_size
         self.actor_num = actor_num
+        self.replay = replay_size > 0
+        self.sample_size = sample_size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
         self.nextobsdict = dict(
-            (
-                "next_obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
 
         self.env_dict = {
@@ -126,22 +216,32 @@ class ImpalaBuffer:
             "truncted": {},
         }
 
-        self.queue = Queue(maxsize=max(actor_num * 2, replay_size))
-        self.getter = Buffer_getter.remote(
-            self.queue, self.env_dict, actor_num, replay_size, sample_size
-        )
-        self.get = self.getter.sample.remote()
+        # as many trajectories in flight as the queue held, max(actor_num * 2, replay_size), and
+        # at least one slot per actor more than a sample takes, so the actors can not all block
+        # on full slots while the learner waits for a sample
+        slots_per_actor = max(2, -(-replay_size // actor_num), -(-sample_size // actor_num) + 1)
+        self.store = TrajectoryStore(slots_per_actor, actor_num, length, self.env_dict)
 
-    def queue_info(self):
-        return self.queue, self.env_dict, self.actor_num
+    def buffer_info(self, actor):
+        return self.store.writer(actor, self.replay), self.env_dict, self.actor_num
 
     def __len__(self):
-        return len(self.queue)
+        return len(self.store.ready())
 
-    def queue_is_empty(self):
-        return self.queue.empty()
+    def is_empty(self):
+        return len(self) == 0
 
     def sample(self):
-        out = ray.get(self.get)
-        self.get = self.getter.sample.remote()
-        return out
+        data = self.store.take(self.sample_size, self.replay)
+        return batch(
+            [data[o] for o in self.obsdict.keys()],
+            data["action"],
+            data["log_prob"],
+            data["reward"],
+            [data[o] for o in self.nextobsdict.keys()],
+            data["terminated"],
+            data["truncted"],
+        )
+
+    def close(self):
+        self.store.close()
@@ -7,7 +7,7 @@ import jax
 import numpy as np
 import ray
 
-from jax_baselines.IMPALA.cpprb_buffers import EpochBuffer
+from jax_baselines.common.inference_server import remote_inference
 
 
 @ray.remote(num_cpus=1)
@@ -38,19 +38,26 @@ class Impala_Worker(object):
         buffer_info,
         model_builder,
         actor_builder,
-        param_server,
-        update,
+        param_channel,
         logger_server,
         stop,
+        inference_server=None,
     ):
         try:
-            queue, env_dict, actor_num = buffer_info
-            local_buffer = EpochBuffer(local_size, env_dict)
-            preproc, actor_model, _ = model_builder()
+            local_buffer, env_dict, actor_num = buffer_info
             actor, get_action_prob, convert_action = actor_builder()
 
-            actor = jax.jit(partial(actor, actor_model, preproc))
+            if inference_server is None:
+                preproc, actor_model, _ = model_builder()
+                actor = jax.jit(partial(actor, actor_model, preproc))
+            else:
+                # the server runs the model, the worker only steps the env
+                actor, _ = remote_inference(inference_server)
             get_action_prob = partial(get_action_prob, actor)
+            if inference_server is None:
+                version, params = param_channel.read()
+            else:
+                version, params = param_channel.version, None
 
             obs, info = self.env.reset()
             have_original_reward = "original_reward" in info.keys()
@@ -68,9 +75,15 @@ class Impala_Worker(object):
             to_label = "env/time_over"
 
             while not stop.is_set():
-                if update.is_set():
-                    params = ray.get(param_server.get_params.remote())
-                    update.clear()
+                if param_channel.version != version:
+                    # polls the shared memory header, the parameters are only read when they change
+                    if inference_server is None:
+                        version, params = param_channel.read()
+                    else:
+                        version = param_channel.version
+                # the steps are written in place into a free slot of the shared trajectory store
+                if not local_buffer.acquire(stop):
+                    break
                 for i in range(local_size):
                     eplen += 1
                     actions, log_prob = get_action_prob(params, obs)
@@ -113,10 +126,12 @@ class Impala_Worker(object):
                         episode += 1
                         obs, info = self.env.reset()
                         obs = [np.expand_dims(obs, axis=0)]
-                queue.put(local_buffer.get_buffer())
+                local_buffer.commit()
         except Exception as e:
             print(f"worker {mp.current_process().name} error : {e}")
         finally:
+            param_channel.close()
+            local_buffer.close()
             if stop.is_set():
                 print("worker stoped")
             else:
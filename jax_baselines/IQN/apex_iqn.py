@@ -44,6 +44,9 @@ class APE_X_IQN(Ape_X_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        inference_server=False,
+        replay_shards=0,
+        pipeline_batches=0,
     ):
         super().__init__(
             workers,
@@ -74,6 +77,9 @@ class APE_X_IQN(Ape_X_Family):
             seed,
             optimizer,
             compress_memory,
+            inference_server,
+            replay_shards,
+            pipeline_batches,
         )
 
         self.n_support = n_support
@@ -2,7 +2,6 @@ from copy import deepcopy
 
 import jax
 import jax.numpy as jnp
-import numpy as np
 import optax
 
 from jax_baselines.common.losses import QuantileHuberLosses
@@ -48,6 +47,12 @@ class IQN(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_buffer=False,
+        prefetch_sampler=False,
+        scanned_updates=False,
+        eval_workers=1,
+        async_eval=False,
+        cpu_actor_update_freq=0,
     ):
         super().__init__(
             env_builder,
@@ -82,6 +87,12 @@ class IQN(Q_Network_Family):
             seed,
             optimizer,
             compress_memory,
+            device_buffer,
+            prefetch_sampler,
+            scanned_updates,
+            eval_workers,
+            async_eval,
+            cpu_actor_update_freq,
         )
 
         self.name = "IQN"
@@ -117,15 +128,15 @@ class IQN(Q_Network_Family):
     def get_q(self, params, obses, tau, key=None) -> jnp.ndarray:
         return self.model(params, key, self.preproc(params, key, obses), tau)
 
-    def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(self._get_actions(self.params, obs, next(self.key_seq)))
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
+    def act(self, params, obs, key, epsilon):
+        actions_key, random_key, epsilon_key = jax.random.split(key, 3)
+        actions = self._get_actions(params, obs, actions_key)  # the key samples tau
+        random_actions = jax.random.randint(random_key, actions.shape, 0, self.action_size[0])
+        explore = jax.random.uniform(epsilon_key, (actions.shape[0], 1)) < epsilon
+        return jnp.where(explore, random_actions, actions)
 
     def _get_actions(self, params, obses, key=None) -> jnp.ndarray:
-        tau = jax.random.uniform(key, (self.worker_size, self.n_support)) * self.CVaR
+        tau = jax.random.uniform(key, (obses[0].shape[0], self.n_support)) * self.CVaR
         return jnp.expand_dims(
             jnp.argmax(
                 jnp.mean(self.get_q(params, convert_jax(obses), tau, key), axis=2),
@@ -135,13 +146,7 @@ class IQN(Q_Network_Family):
         )
 
     def train_step(self, steps, gradient_steps):
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
+        if self.scanned_updates:
             (
                 self.params,
                 self.target_params,
@@ -150,17 +155,34 @@ class IQN(Q_Network_Family):
                 t_mean,
                 t_std,
                 new_priorities,
-            ) = self._train_step(
+            ) = self.sample_scanned_train_step(
+                gradient_steps,
                 self.params,
                 self.target_params,
                 self.opt_state,
-                self.train_steps_count,
+                self.train_steps_count + 1,
                 next(self.key_seq),
-                **data
             )
-
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+            self.train_steps_count += gradient_steps
+            loss, t_mean, t_std = jnp.mean(loss), jnp.mean(t_mean), jnp.mean(t_std)
+        else:
+            for _ in range(gradient_steps):
+                self.train_steps_count += 1
+                (
+                    self.params,
+                    self.target_params,
+                    self.opt_state,
+                    loss,
+                    t_mean,
+                    t_std,
+                    new_priorities,
+                ) = self.sample_train_step(
+                    self.params,
+                    self.target_params,
+                    self.opt_state,
+                    self.train_steps_count,
+                    next(self.key_seq),
+                )
 
         if self.logger_run and steps % self.log_interval == 0:
             self.logger_run.log_metric("loss/qloss", loss, steps)
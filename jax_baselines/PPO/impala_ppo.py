@@ -31,6 +31,7 @@ class IMPALA_PPO(IMPALA_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        inference_server=False,
     ):
         super().__init__(
             workers,
@@ -53,6 +54,7 @@ class IMPALA_PPO(IMPALA_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            inference_server,
         )
 
         self.name = "IMPALA_PPO"
@@ -129,14 +131,7 @@ class IMPALA_PPO(IMPALA_Family):
         terminateds,
         truncteds,
     ):
-        # ((b x h x w x c), (b x n)) x worker -> (worker x b x h x w x c), (worker x b x n)
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        mu_log_prob = jnp.stack(mu_log_prob)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncteds = jnp.stack(truncteds)
+        # the trajectory store samples (sample x b x h x w x c), (sample x b x n) batches
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         feature = jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, obses)
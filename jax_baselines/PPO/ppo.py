@@ -31,6 +31,10 @@ class PPO(Actor_Critic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="rmsprop",
+        compress_memory=False,
+        device_buffer=False,
+        eval_workers=1,
+        async_eval=False,
     ):
         super().__init__(
             env_builder,
@@ -49,6 +53,10 @@ class PPO(Actor_Critic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            compress_memory,
+            device_buffer,
+            eval_workers,
+            async_eval,
         )
 
         self.name = "PPO"
@@ -104,12 +112,6 @@ class PPO(Actor_Critic_Policy_Gradient_Family):
         return critic_loss
 
     def _preprocess(self, params, key, obses, actions, rewards, nxtobses, terminateds, truncateds):
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncateds = jnp.stack(truncateds)
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         feature = jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, obses)
@@ -45,6 +45,9 @@ class APE_X_QRDQN(Ape_X_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        inference_server=False,
+        replay_shards=0,
+        pipeline_batches=0,
     ):
         super().__init__(
             workers,
@@ -76,6 +79,9 @@ class APE_X_QRDQN(Ape_X_Family):
             seed,
             optimizer,
             compress_memory,
+            inference_server,
+            replay_shards,
+            pipeline_batches,
         )
 
         self.n_support = n_support
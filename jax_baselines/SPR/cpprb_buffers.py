@@ -1,6 +1,8 @@
 import cpprb
 import numpy as np
 
+from model_builder.flax.Module import get_obs_dtypes
+
 
 class TransitionRoller(object):
     def __init__(self, obsdict, action_space, prediction_depth=5):
@@ -78,14 +80,10 @@ class TransitionReplayBuffer(object):
     ):
         self.max_size = size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {
-                    "shape": (prediction_depth + 1, *o),
-                    "dtype": np.uint8 if len(o) >= 3 else np.float32,
-                },
+            ("obs{}".format(idx), {"shape": (prediction_depth + 1, *o), "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
 
         if isinstance(action_space, int):
@@ -154,14 +152,10 @@ class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
     ):
         self.max_size = size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {
-                    "shape": (prediction_depth + 1, *o),
-                    "dtype": np.uint8 if len(o) >= 3 else np.float32,
-                },
+            ("obs{}".format(idx), {"shape": (prediction_depth + 1, *o), "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
 
         if isinstance(action_space, int):
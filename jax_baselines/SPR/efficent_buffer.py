@@ -1,25 +1,87 @@
-import random
+import os
+import shutil
+import tempfile
+import weakref
 
 import numpy as np
 
+from model_builder.flax.Module import get_obs_dtypes
+
+
+def get_memmap_dir(memmap_buffer: bool, log_dir: str = None):
+    """Directory of the memmap files of a learner's buffer, None keeps the buffer in RAM.
+
+    Without a log_dir the files go to the temporary directory, so memmap storage never falls back
+    to RAM.
+    """
+    if not memmap_buffer:
+        return None
+    return log_dir if log_dir is not None else tempfile.gettempdir()
+
 
 class Buffer(object):
-    def __init__(self, size: int, obs_dict: dict, env_dict: dict):
+    def __init__(
+        self,
+        size: int,
+        obs_dict: dict,
+        env_dict: dict,
+        memmap_dir: str = None,
+        frame_stack: int = 1,
+        stack_padding: str = "edge",
+    ):
+        """Trajectory storage of the SPR/BBF replay buffers.
+
+        :param memmap_dir: (str) if given, observation arrays are stored in np.memmap files under a
+            fresh subdirectory of this path instead of RAM, and the OS page cache does the caching.
+            The subdirectory is removed when the buffer is garbage collected.
+        :param frame_stack: (int) number of frames stacked on the last axis of image observations.
+            If > 1, only the newest frame is stored per slot and stacks are rebuilt at sample time.
+        :param stack_padding: (str) "edge" repeats the first frame of the episode for the frames
+            before the episode start (as FrameStack does on reset), "zero" fills them with zeros.
+            Frames already overwritten by the ring are padded the same way.
+        """
+        assert stack_padding in ("edge", "zero"), "stack_padding must be 'edge' or 'zero'"
         self.max_size = size
         self._idx = -1
         self.ep_idx = 0
         self.obs_dict = obs_dict
         self.env_dict = env_dict
+        self.frame_stack = frame_stack
+        self.stack_padding = stack_padding
+        self.stacked_obs = [
+            k
+            for k, data in obs_dict.items()
+            if frame_stack > 1 and len(data["shape"]) == 3 and data["shape"][-1] % frame_stack == 0
+        ]
+        self.memmap_dir = None
+        if memmap_dir is not None:
+            os.makedirs(memmap_dir, exist_ok=True)
+            self.memmap_dir = tempfile.mkdtemp(prefix="replay_buffer_", dir=memmap_dir)
+            weakref.finalize(self, shutil.rmtree, self.memmap_dir, True)
         self.buffer = self.creat_buffer(size, obs_dict, env_dict)
 
     def creat_buffer(self, size: int, obs_dict: dict, env_dict: dict):
         buffer = {}
         for name, data in obs_dict.items():
-            buffer[name] = np.zeros((size, *data["shape"]), dtype=data["dtype"])
+            shape = data["shape"]
+            if name in self.stacked_obs:
+                shape = (*shape[:-1], shape[-1] // self.frame_stack)
+            if self.memmap_dir is not None:
+                buffer[name] = np.memmap(
+                    os.path.join(self.memmap_dir, f"{name}.dat"),
+                    dtype=data["dtype"],
+                    mode="w+",
+                    shape=(size, *shape),
+                )
+            else:
+                buffer[name] = np.zeros((size, *shape), dtype=data["dtype"])
         for name, data in env_dict.items():
             buffer[name] = np.zeros((size, *data["shape"]), dtype=data["dtype"])
         buffer["terminated"] = np.ones((size, 1), dtype=np.bool_)
         buffer["ep_idx"] = np.ones((size, 1), dtype=np.int32) * -1
+        if self.stacked_obs:
+            # number of earlier frames of the same episode in the stack of each slot
+            buffer["frame_offset"] = np.zeros((size,), dtype=np.int8)
         return buffer
 
     def get_stored_size(self):
@@ -32,14 +94,51 @@ class Buffer(object):
         self.update_idx()
         if self.buffer["ep_idx"][self.roll_idx_m1] != self.ep_idx:
             for idx, k in enumerate(self.obs_dict.keys()):
-                self.buffer[k][self.roll_idx] = obs[idx]
+                self.store_obs(k, self.roll_idx, obs[idx])
+            if self.stacked_obs:
+                self.buffer["frame_offset"][self.roll_idx] = 0
         for idx, k in enumerate(self.obs_dict.keys()):
-            self.buffer[k][self.next_roll_idx] = next_obs[idx]
+            self.store_obs(k, self.next_roll_idx, next_obs[idx])
+        # the slot of the last next_obs has no transition yet, it must not keep the old episode
+        self.buffer["ep_idx"][self.next_roll_idx] = -1
+        if self.stacked_obs:
+            self.buffer["frame_offset"][self.next_roll_idx] = min(
+                self.buffer["frame_offset"][self.roll_idx] + 1, self.frame_stack - 1
+            )
         for k, data in kwargs.items():
             self.buffer[k][self.roll_idx] = data
         self.buffer["ep_idx"][self.roll_idx] = self.ep_idx
         return self.roll_idx
 
+    def store_obs(self, k, idx, obs):
+        if k in self.stacked_obs:
+            # keep only the newest frame of the stack
+            obs = obs[..., -self.buffer[k].shape[-1] :]
+        self.buffer[k][idx] = obs
+
+    def stack_offsets(self, idxs, ep_idx):
+        """Earlier frames of the episode ep_idx in the stacks of the slots in idxs.
+
+        After the ring wraps, the slots just behind the write head hold frames of a newer episode,
+        so the frames before a slot only count while their slots still belong to ep_idx.
+        """
+        offsets = self.buffer["frame_offset"][idxs].astype(np.int64)
+        before = (np.expand_dims(idxs, axis=-1) - np.arange(1, self.frame_stack)) % self.max_size
+        same_episode = np.equal(self.buffer["ep_idx"][before, 0], np.expand_dims(ep_idx, axis=-1))
+        return np.minimum(offsets, np.sum(np.cumprod(same_episode, axis=-1), axis=-1))
+
+    def stack_obs(self, k, idxs, offsets):
+        # rebuild the stacks of all slots in idxs with one gather
+        back = np.arange(self.frame_stack - 1, -1, -1)
+        offsets = np.expand_dims(offsets, axis=-1)
+        stack_idxs = (np.expand_dims(idxs, axis=-1) - np.minimum(back, offsets)) % self.max_size
+        frames = np.asarray(self.buffer[k][stack_idxs])  # B x K x frame_stack x H x W x C
+        if self.stack_padding == "zero":
+            before_start = np.greater(back, offsets)
+            frames = np.where(before_start[..., None, None, None], 0, frames).astype(frames.dtype)
+        frames = np.moveaxis(frames, -4, -2)  # B x K x H x W x frame_stack x C
+        return np.reshape(frames, (*frames.shape[:-2], -1))
+
     def on_episode_end(self, truncated):
         if truncated:
             self.update_idx()
@@ -55,8 +154,13 @@ class Buffer(object):
         ) % self.max_size
         traj_idxs = (idxs + np.reshape(np.arange(traj_len), (1, traj_len))) % self.max_size
         obs = []
+        if self.stacked_obs:
+            offsets = self.stack_offsets(obs_traj_idxs, self.buffer["ep_idx"][idxs, 0])
         for k in self.obs_dict:
-            obs.append(self.buffer[k][obs_traj_idxs])
+            if k in self.stacked_obs:
+                obs.append(self.stack_obs(k, obs_traj_idxs, offsets))
+            else:
+                obs.append(np.asarray(self.buffer[k][obs_traj_idxs]))
         data = {}
         for k in self.env_dict:
             data[k] = self.buffer[k][traj_idxs]
@@ -154,6 +258,63 @@ class SumTree:
         return (idx, self.tree[idx], self.data[dataIdx])
 
 
+class VectorizedSumTree(SumTree):
+    """Drop-in replacement of SumTree with batched sampling and priority updates.
+
+    Uses the same array layout as SumTree, so tree indexes returned by `get_batch`
+    can be passed back to `update_batch` (or to the scalar `update`).
+    """
+
+    # find samples on leaf nodes, descending one tree level per iteration for the whole batch
+    def _retrieve_batch(self, s):
+        idx = np.zeros(len(s), dtype=np.int64)
+        tree_len = len(self.tree)
+        while True:
+            left = 2 * idx + 1
+            internal = left < tree_len
+            if not np.any(internal):
+                return idx
+            left_value = self.tree[np.where(internal, left, 0)]
+            go_left = s <= left_value
+            s = np.where(internal & ~go_left, s - left_value, s)
+            idx = np.where(internal, np.where(go_left, left, left + 1), idx)
+
+    # recompute parents from their children, level by level up to the root
+    def _propagate_batch(self, idxs):
+        while True:
+            idxs = idxs[idxs > 0]
+            if len(idxs) == 0:
+                return
+            idxs = np.unique((idxs - 1) // 2)
+            self.tree[idxs] = self.tree[2 * idxs + 1] + self.tree[2 * idxs + 2]
+
+    # update priorities of many leaves at once, the last value wins for duplicate indexes
+    def update_batch(self, idxs, ps, minmax_decay=1e-4):
+        idxs = np.asarray(idxs, dtype=np.int64).reshape(-1)
+        ps = np.asarray(ps, dtype=np.float64).reshape(-1)
+        # same running max/min as calling `update` once per element
+        n = len(ps)
+        age = np.arange(n - 1, -1, -1)
+        self.max_priority = max(
+            np.max(ps * np.power(1.0 - minmax_decay, age)),
+            self.max_priority * (1.0 - minmax_decay) ** n,
+        )
+        self.min_priority = min(
+            np.min(ps * np.power(1.0 + minmax_decay, age)),
+            self.min_priority * (1.0 + minmax_decay) ** n,
+        )
+        idxs, last = np.unique(idxs[::-1], return_index=True)
+        self.tree[idxs] = ps[::-1][last]
+        self._propagate_batch(idxs)
+
+    # get priorities and samples of many prefix sums at once
+    def get_batch(self, s):
+        idxs = self._retrieve_batch(np.asarray(s, dtype=np.float64))
+        dataIdxs = idxs - self.capacity + 1
+
+        return (idxs, self.tree[idxs], self.data[dataIdxs])
+
+
 class TransitionReplayBuffer(object):
     def __init__(
         self,
@@ -161,18 +322,16 @@ class TransitionReplayBuffer(object):
         observation_space: list = [],
         action_space=1,
         prediction_depth=5,
+        memmap_dir=None,
+        frame_stack=1,
     ):
         self.max_size = size
         self.prediction_depth = prediction_depth
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {
-                    "shape": o,
-                    "dtype": np.uint8 if len(o) >= 3 else np.float32,
-                },
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
 
         if isinstance(action_space, int):
@@ -185,6 +344,8 @@ class TransitionReplayBuffer(object):
                 "actions": {"shape": action_space, "dtype": np.float32},
                 "rewards": {"shape": (), "dtype": np.float32},
             },
+            memmap_dir=memmap_dir,
+            frame_stack=frame_stack,
         )
 
     def __len__(self) -> int:
@@ -230,9 +391,13 @@ class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
         prediction_depth=5,
         alpha: float = 0.6,
         eps: float = 1e-4,
+        memmap_dir=None,
+        frame_stack=1,
     ):
-        super().__init__(size, observation_space, action_space, prediction_depth)
-        self.tree = SumTree(size)
+        super().__init__(
+            size, observation_space, action_space, prediction_depth, memmap_dir, frame_stack
+        )
+        self.tree = VectorizedSumTree(size)
         self.alpha = alpha
         self.eps = eps
 
@@ -249,17 +414,9 @@ class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
             self.buffer.on_episode_end(terminated)
 
     def sample(self, batch_size: int, beta=0.4):
-        idxs = np.zeros((batch_size), dtype=np.int32)
-        priorities = np.zeros((batch_size), dtype=np.float32)
-        buffer_idxs = np.zeros((batch_size), dtype=np.int32)
         segment = self.tree.total() / batch_size
-        for i in range(batch_size):
-            a, b = segment * i, segment * (i + 1)
-            s = random.uniform(a, b)
-            idx, p, buffer_idx = self.tree.get(s)
-            idxs[i] = idx
-            priorities[i] = p
-            buffer_idxs[i] = buffer_idx
+        s = (np.arange(batch_size) + np.random.uniform(0, 1, size=batch_size)) * segment
+        idxs, priorities, buffer_idxs = self.tree.get_batch(s)
         obs, data, terminated, filled, _ = self.buffer.sample(
             buffer_idxs, traj_len=self.prediction_depth
         )
@@ -276,9 +433,8 @@ class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
         }
 
     def update_priorities(self, indexes, priorities):
-        priorities = np.power(priorities + self.eps, self.alpha)
-        for idx, p in zip(indexes, priorities):
-            self.tree.update(idx, p)
+        priorities = np.power(np.asarray(priorities) + self.eps, self.alpha)
+        self.tree.update_batch(indexes, priorities)
 
 
 if __name__ == "__main__":
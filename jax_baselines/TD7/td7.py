@@ -5,6 +5,7 @@ import jax.numpy as jnp
 import numpy as np
 import optax
 
+from jax_baselines.common.evaluator import vectorized_eval
 from jax_baselines.common.losses import hubberloss
 from jax_baselines.common.utils import convert_jax, hard_update, scaled_by_reset
 from jax_baselines.DDPG.base_class import Deteministic_Policy_Gradient_Family
@@ -29,6 +30,7 @@ class TD7(Deteministic_Policy_Gradient_Family):
         learning_starts=1000,
         target_network_update_freq=250,
         prioritized_replay_alpha=0.4,
+        scaled_by_reset=False,
         simba=False,
         log_interval=200,
         log_dir=None,
@@ -37,6 +39,12 @@ class TD7(Deteministic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        compress_memory=False,
+        prefetch_sampler=False,
+        scanned_updates=False,
+        eval_workers=1,
+        async_eval=False,
+        cpu_actor_update_freq=0,
     ):
         super().__init__(
             env_builder,
@@ -65,6 +73,12 @@ class TD7(Deteministic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            compress_memory,
+            prefetch_sampler,
+            scanned_updates,
+            eval_workers,
+            async_eval,
+            cpu_actor_update_freq,
         )
 
         self.name = "TD7"
@@ -130,7 +144,13 @@ class TD7(Deteministic_Policy_Gradient_Family):
         zs = self.encoder(encoder_params, key, feature)
         return self.actor(policy_params, key, feature, zs)
 
+    def act(self, encoder_params, policy_params, obs, key, noise_scale):
+        actions = self._get_actions(encoder_params, policy_params, obs, None)
+        noise = jax.random.normal(key, actions.shape)
+        return jnp.clip(actions + noise_scale * noise, -1, 1)
+
     def actions(self, obs, steps, use_checkpoint=False, exploration=True):
+        actor = self.acting_agent()
         if self.simba:
             if exploration:
                 self.obs_rms.update(obs)
@@ -138,25 +158,23 @@ class TD7(Deteministic_Policy_Gradient_Family):
 
         if self.learning_starts < steps:
             if use_checkpoint:
-                actions = np.asarray(
-                    self._get_actions(
-                        self.checkpoint_encoder_params, self.checkpoint_policy_params, obs, None
-                    )
+                encoder_params, policy_params = (
+                    actor.checkpoint_encoder_params,
+                    actor.checkpoint_policy_params,
                 )
             else:
-                actions = np.asarray(
-                    self._get_actions(self.fixed_encoder_params, self.policy_params, obs, None)
-                )
-            if exploration:
-                actions = np.clip(
-                    actions
-                    + self.action_noise
-                    * np.random.normal(0, 1, size=(self.worker_size, self.action_size[0])),
-                    -1,
-                    1,
+                encoder_params, policy_params = actor.fixed_encoder_params, actor.policy_params
+            actions = np.asarray(
+                self.act(
+                    encoder_params,
+                    policy_params,
+                    obs,
+                    next(actor.key_seq),
+                    self.action_noise if exploration else 0.0,
                 )
+            )
         else:
-            actions = np.random.uniform(-1.0, 1.0, size=(self.worker_size, self.action_size[0]))
+            actions = np.random.uniform(-1.0, 1.0, size=(len(obs[0]), self.action_size[0]))
         return actions
 
     def end_episode(self, steps, score, eplen):
@@ -193,17 +211,7 @@ class TD7(Deteministic_Policy_Gradient_Family):
         repr_losses = []
         losses = []
         targets = []
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
-            if self.simba:
-                data["obses"] = self.obs_rms.normalize(data["obses"])
-                data["nxtobses"] = self.obs_rms.normalize(data["nxtobses"])
-
+        if self.scanned_updates:
             (
                 self.encoder_params,
                 self.policy_params,
@@ -219,27 +227,76 @@ class TD7(Deteministic_Policy_Gradient_Family):
                 loss,
                 t_mean,
                 new_priorities,
-            ) = self._train_step(
-                self.encoder_params,
-                self.policy_params,
-                self.critic_params,
-                self.fixed_encoder_params,
-                self.fixed_encoder_target_params,
-                self.target_policy_params,
-                self.target_critic_params,
-                self.encoder_opt_state,
-                self.opt_policy_state,
-                self.opt_critic_state,
-                next(self.key_seq),
-                self.train_steps_count,
-                **data,
+            ) = self.sample_scanned_train_step(
+                gradient_steps,
+                (
+                    self.encoder_params,
+                    self.policy_params,
+                    self.critic_params,
+                    self.fixed_encoder_params,
+                    self.fixed_encoder_target_params,
+                    self.target_policy_params,
+                    self.target_critic_params,
+                    self.encoder_opt_state,
+                    self.opt_policy_state,
+                    self.opt_critic_state,
+                    next(self.key_seq),
+                    self.train_steps_count + 1,
+                ),
+                {0: 0, 1: 1, 2: 2, 3: 3, 4: 4, 5: 5, 6: 6, 7: 7, 8: 8, 9: 9},
+                step_arg=11,
+                key_arg=10,
             )
-            repr_losses.append(repr_loss)
-            losses.append(loss)
-            targets.append(t_mean)
+            self.train_steps_count += gradient_steps
+            repr_losses, losses, targets = repr_loss, loss, t_mean
+        else:
+            for _ in range(gradient_steps):
+                self.train_steps_count += 1
+                if self.prioritized_replay:
+                    data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
+                else:
+                    data = self.replay_buffer.sample(self.batch_size)
+
+                if self.simba:
+                    data["obses"] = self.obs_rms.normalize(data["obses"])
+                    data["nxtobses"] = self.obs_rms.normalize(data["nxtobses"])
+
+                (
+                    self.encoder_params,
+                    self.policy_params,
+                    self.critic_params,
+                    self.fixed_encoder_params,
+                    self.fixed_encoder_target_params,
+                    self.target_policy_params,
+                    self.target_critic_params,
+                    self.encoder_opt_state,
+                    self.opt_policy_state,
+                    self.opt_critic_state,
+                    repr_loss,
+                    loss,
+                    t_mean,
+                    new_priorities,
+                ) = self._train_step(
+                    self.encoder_params,
+                    self.policy_params,
+                    self.critic_params,
+                    self.fixed_encoder_params,
+                    self.fixed_encoder_target_params,
+                    self.target_policy_params,
+                    self.target_critic_params,
+                    self.encoder_opt_state,
+                    self.opt_policy_state,
+                    self.opt_critic_state,
+                    next(self.key_seq),
+                    self.train_steps_count,
+                    **data,
+                )
+                repr_losses.append(repr_loss)
+                losses.append(loss)
+                targets.append(t_mean)
 
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+                if self.prioritized_replay:
+                    self.replay_buffer.update_priorities(data["indexes"], new_priorities)
 
         mean_repr_loss = jnp.mean(jnp.array(repr_losses))
         mean_loss = jnp.mean(jnp.array(losses))
@@ -348,7 +405,7 @@ class TD7(Deteministic_Policy_Gradient_Family):
             encoder_params, fixed_encoder_params, step, self.target_network_update_freq
         )
         if self.scaled_by_reset:
-            policy_params = scaled_by_reset(
+            policy_params, opt_policy_state = scaled_by_reset(
                 policy_params,
                 opt_policy_state,
                 self.optimizer,
@@ -357,7 +414,7 @@ class TD7(Deteministic_Policy_Gradient_Family):
                 self.reset_freq,
                 0.1,  # tau = 0.1 is softreset, but original paper uses 1.0
             )
-            critic_params = scaled_by_reset(
+            critic_params, opt_critic_state = scaled_by_reset(
                 critic_params,
                 opt_critic_state,
                 self.optimizer,
@@ -514,25 +571,34 @@ class TD7(Deteministic_Policy_Gradient_Family):
                 pbar.set_description(self.discription(eval_result))
 
     def eval(self, steps):
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
-        for ep in range(self.eval_eps):
-            obs, info = self.eval_env.reset()
-            obs = [np.expand_dims(obs, axis=0)]
-            terminated = False
-            truncated = False
-            eplen = 0
-            while not terminated and not truncated:
-                actions = self.actions(obs, steps, use_checkpoint=True, exploration=False)
-                next_obs, reward, terminated, truncated, info = self.eval_env.step(actions[0])
-                next_obs = [np.expand_dims(next_obs, axis=0)]
-                # self.replay_buffer.add(obs, actions[0], reward, next_obs, terminated, truncated)
-                total_reward[ep] += reward
-                obs = next_obs
-                eplen += 1
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
+        if self.async_evaluator is not None:
+            return self.async_evaluator.submit(steps)
+        if self.eval_workers > 1:
+            total_reward, total_ep_len, total_truncated, _ = vectorized_eval(
+                self.eval_env,
+                lambda obs: self.actions([obs], steps, use_checkpoint=True, exploration=False),
+                self.eval_eps,
+            )
+        else:
+            total_reward = np.zeros(self.eval_eps)
+            total_ep_len = np.zeros(self.eval_eps)
+            total_truncated = np.zeros(self.eval_eps)
+            for ep in range(self.eval_eps):
+                obs, info = self.eval_env.reset()
+                obs = [np.expand_dims(obs, axis=0)]
+                terminated = False
+                truncated = False
+                eplen = 0
+                while not terminated and not truncated:
+                    actions = self.actions(obs, steps, use_checkpoint=True, exploration=False)
+                    next_obs, reward, terminated, truncated, info = self.eval_env.step(actions[0])
+                    next_obs = [np.expand_dims(next_obs, axis=0)]
+                    # self.replay_buffer.add(obs, actions[0], reward, next_obs, terminated, truncated)
+                    total_reward[ep] += reward
+                    obs = next_obs
+                    eplen += 1
+                total_ep_len[ep] = eplen
+                total_truncated[ep] = float(truncated)
 
         mean_reward = np.mean(total_reward)
         mean_ep_len = np.mean(total_ep_len)
@@ -38,6 +38,7 @@ class IMPALA_TPPO(IMPALA_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        inference_server=False,
     ):
         super().__init__(
             workers,
@@ -60,6 +61,7 @@ class IMPALA_TPPO(IMPALA_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            inference_server,
         )
         self.mu_ratio = mu_ratio
         self.minibatch_size = 256
@@ -138,14 +140,7 @@ class IMPALA_TPPO(IMPALA_Family):
         terminateds,
         truncteds,
     ):
-        # ((b x h x w x c), (b x n)) x worker -> (worker x b x h x w x c), (worker x b x n)
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        mu_log_prob = jnp.stack(mu_log_prob)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncteds = jnp.stack(truncteds)
+        # the trajectory store samples (sample x b x h x w x c), (sample x b x n) batches
         obses = jax.vmap(convert_jax)(obses)
         nxtobses = jax.vmap(convert_jax)(nxtobses)
         feature = jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, obses)
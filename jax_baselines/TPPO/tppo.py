@@ -37,6 +37,10 @@ class TPPO(Actor_Critic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="rmsprop",
+        compress_memory=False,
+        device_buffer=False,
+        eval_workers=1,
+        async_eval=False,
     ):
         super().__init__(
             env_builder,
@@ -55,6 +59,10 @@ class TPPO(Actor_Critic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            compress_memory,
+            device_buffer,
+            eval_workers,
+            async_eval,
         )
 
         self.name = "TPPO"
@@ -113,12 +121,6 @@ class TPPO(Actor_Critic_Policy_Gradient_Family):
         return critic_loss
 
     def _preprocess(self, params, key, obses, actions, rewards, nxtobses, terminateds, truncateds):
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncateds = jnp.stack(truncateds)
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         feature = jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, obses)
@@ -1,6 +1,6 @@
 import os
 import re
-from collections import defaultdict, deque
+from collections import defaultdict
 
 import ale_py
 import cv2
@@ -8,6 +8,8 @@ import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
 
+from jax_baselines.common.env_builer import VectorizedEnv
+
 gym.register_envs(ale_py)
 os.environ.setdefault("PATH", "")
 cv2.ocl.setUseOpenCL(False)
@@ -156,6 +158,46 @@ class MaxAndSkipEnv(gym.Wrapper):
         return self.env.reset(**kwargs)
 
 
+class RawSkipEnv(gym.Wrapper):
+    def __init__(self, env, skip=4):
+        """Frameskipping as MaxAndSkipEnv, but returns the last two raw frames unpooled.
+
+        The observations are [2, H, W, C], the max pooling, grayscale and resize are left to
+        BatchedAtariPreprocessing, which runs them for all envs of a vectorized env at once.
+
+        :param env: (Gym Environment) the environment
+        :param skip: (int) number of `skip`-th frame
+        """
+        gym.Wrapper.__init__(self, env)
+        self._obs_buffer = np.zeros(
+            (2,) + env.observation_space.shape, dtype=env.observation_space.dtype
+        )
+        self._skip = skip
+        self.observation_space = spaces.Box(
+            low=0, high=255, shape=self._obs_buffer.shape, dtype=env.observation_space.dtype
+        )
+
+    def step(self, action):
+        total_reward = 0.0
+        terminated = None
+        for i in range(self._skip):
+            obs, reward, terminated, truncated, info = self.env.step(action)
+            if i >= self._skip - 2:
+                self._obs_buffer[i - self._skip + 2] = obs
+            total_reward += reward
+            if terminated or truncated:
+                break
+        if self._skip == 1:
+            self._obs_buffer[0] = self._obs_buffer[1]
+        # a copy, the workers keep the end observation over the reset of the env
+        return self._obs_buffer.copy(), total_reward, terminated, truncated, info
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        self._obs_buffer[:] = obs
+        return self._obs_buffer.copy(), info
+
+
 class ClipRewardEnv(gym.RewardWrapper):
     def __init__(self, env):
         """clips the reward to {+1, 0, -1} by its sign.
@@ -212,83 +254,56 @@ class WarpFrame(gym.ObservationWrapper):
 
 
 class FrameStack(gym.Wrapper):
-    def __init__(self, env, n_frames):
+    def __init__(self, env, n_frames, copy_obs=True):
         """Stack n_frames last frames.
-        Returns lazy array, which is much more memory efficient.
-        See Also
-        --------
-        stable_baselines.common.atari_wrappers.LazyFrames
+
+        The stacks are preallocated, a step shifts the previous stack into the other of two
+        buffers and writes the new frame in place, so no array is concatenated per step. The
+        returned observation is one contiguous copy of the stack. With ``copy_obs=False`` it is a
+        view of the stack instead, which stays valid until the second next step or reset, for
+        consumers which copy the observation right away.
+
         :param env: (Gym Environment) the environment
         :param n_frames: (int) the number of frames to stack
+        :param copy_obs: (bool) return a copy of the stack instead of a view
         """
         gym.Wrapper.__init__(self, env)
         self.n_frames = n_frames
-        self.frames = deque([], maxlen=n_frames)
+        self.copy_obs = copy_obs
         shp = env.observation_space.shape
+        self.channels = shp[2]
         self.observation_space = spaces.Box(
             low=0,
             high=255,
             shape=(shp[0], shp[1], shp[2] * n_frames),
             dtype=env.observation_space.dtype,
         )
+        self.stacks = np.zeros(
+            (2, *self.observation_space.shape), dtype=self.observation_space.dtype
+        )
+        self.slot = 0
 
     def reset(self, **kwargs):
         obs, info = self.env.reset(**kwargs)
-        for _ in range(self.n_frames):
-            self.frames.append(obs)
+        self.slot = 1 - self.slot
+        stack = self.stacks[self.slot]
+        for i in range(self.n_frames):
+            stack[..., i * self.channels : (i + 1) * self.channels] = obs
         return self._get_ob(), info
 
     def step(self, action):
         obs, reward, terminated, truncated, info = self.env.step(action)
-        self.frames.append(obs)
+        prev = self.stacks[self.slot]
+        self.slot = 1 - self.slot
+        stack = self.stacks[self.slot]
+        # one contiguous copy shifts every pixel by a frame, the last frame is overwritten after
+        stack.reshape(-1)[: -self.channels] = prev.reshape(-1)[self.channels :]
+        stack[..., -self.channels :] = obs
         return self._get_ob(), reward, terminated, truncated, info
 
     def _get_ob(self):
-        assert len(self.frames) == self.n_frames
-        return LazyFrames(list(self.frames))
-
-
-class ScaledFloatFrame(gym.ObservationWrapper):
-    def __init__(self, env):
-        gym.ObservationWrapper.__init__(self, env)
-        self.observation_space = spaces.Box(
-            low=0, high=1.0, shape=env.observation_space.shape, dtype=np.float32
-        )
-
-    def observation(self, observation):
-        # careful! This undoes the memory optimization, use
-        # with smaller replay buffers only.
-        return np.array(observation).astype(np.float32) / 255.0
-
-
-class LazyFrames(object):
-    def __init__(self, frames):
-        """This object ensures that common frames between the observations are only stored once. It exists purely
-        to optimize memory usage which can be huge for DQN's 1M frames replay buffers. This object should only be
-        converted to np.ndarray before being passed to the model.
-
-        :param frames: ([int] or [float]) environment frames
-        """
-        self._frames = frames
-        self._out = None
-
-    def _force(self):
-        if self._out is None:
-            self._out = np.concatenate(self._frames, axis=2)
-            self._frames = None
-        return self._out
-
-    def __array__(self, dtype=None):
-        out = self._force()
-        if dtype is not None:
-            out = out.astype(dtype)
-        return out
-
-    def __len__(self):
-        return len(self._force())
-
-    def __getitem__(self, i):
-        return self._force()[i]
+        ob = self.stacks[self.slot]
+        return ob.copy() if self.copy_obs else ob
 
 
 def make_atari(env_id, max_episode_steps=None):
@@ -305,32 +320,194 @@ def wrap_deepmind(
     kill_on_life_loss=False,
     clip_rewards=True,
     frame_stack=True,
-    scale=False,
+    copy_obs=True,
 ):
-    """Configure environment for DeepMind-style Atari."""
+    """Configure environment for DeepMind-style Atari.
+
+    The frames stay uint8, PreProcess scales them to [0, 1] on the device.
+    """
     if episode_life:
         env = EpisodicLifeEnv(env, kill_on_life_loss)
     print("Action meaning : ", env.unwrapped.get_action_meanings())
     if "FIRE" in env.unwrapped.get_action_meanings():
         env = FireResetEnv(env)
     env = WarpFrame(env)
-    if scale:
-        env = ScaledFloatFrame(env)
     if clip_rewards:
         env = ClipRewardEnv(env)
     if frame_stack:
-        env = FrameStack(env, 4)
+        env = FrameStack(env, 4, copy_obs)
     return env
 
 
-def make_wrap_atari(env_id="Breakout-v0", clip_rewards=False):
+def make_wrap_atari(env_id="Breakout-v0", clip_rewards=False, copy_obs=True):
     # env = gym.make(env_id)
     env = make_atari(env_id)
     env = gym.wrappers.TimeLimit(env, max_episode_steps=10000)
-    env = wrap_deepmind(env, clip_rewards=clip_rewards, frame_stack=True)
+    env = wrap_deepmind(env, clip_rewards=clip_rewards, frame_stack=True, copy_obs=copy_obs)
+    return env
+
+
+def make_raw_atari(env_id="Breakout-v0", clip_rewards=False):
+    """Atari env of make_wrap_atari without the per frame processing.
+
+    Returns the last two raw frames of every step as [2, H, W, C], the max pooling, grayscale,
+    resize and frame stack of wrap_deepmind are done by BatchedAtariPreprocessing.
+    """
+    env = gym.make(env_id, render_mode="rgb_array")
+    env = NoopResetEnv(env, noop_max=30)
+    env = RawSkipEnv(env, skip=4 if "NoFrameskip" in env.spec.id else 1)
+    env = gym.wrappers.TimeLimit(env, max_episode_steps=10000)
+    env = EpisodicLifeEnv(env)
+    print("Action meaning : ", env.unwrapped.get_action_meanings())
+    if "FIRE" in env.unwrapped.get_action_meanings():
+        env = FireResetEnv(env)
+    if clip_rewards:
+        env = ClipRewardEnv(env)
     return env
 
 
+def _area_weights(in_size, out_size):
+    # weights of cv2.INTER_AREA for a downscale, each output pixel averages the input it covers
+    scale = in_size / out_size
+    weights = np.zeros((out_size, in_size), dtype=np.float32)
+    for o in range(out_size):
+        start, end = o * scale, (o + 1) * scale
+        for i in range(int(np.floor(start)), min(int(np.ceil(end)), in_size)):
+            weights[o, i] = (min(end, i + 1) - max(start, i)) / scale
+    return weights
+
+
+class BatchedAtariPreprocessing(object):
+    def __init__(self, n_envs, frame_shape, width=84, height=84, n_frames=4, use_jax=False):
+        """Max pooling, grayscale, resize and frame stack of wrap_deepmind for a batch of envs.
+
+        The raw frames [n_envs, 2, H, W, C] of make_raw_atari are pooled, converted to grayscale
+        with the weights of cv2.COLOR_RGB2GRAY and resized by two matmuls with the weights of
+        cv2.INTER_AREA, so the output matches WarpFrame up to rounding. With ``use_jax`` the whole
+        step runs as one jitted function on the default device.
+
+        :param n_envs: (int) number of envs
+        :param frame_shape: (tuple) shape of one raw frame (H, W, C)
+        :param width: (int) width of the resized frames
+        :param height: (int) height of the resized frames
+        :param n_frames: (int) number of stacked frames
+        :param use_jax: (bool) run the preprocessing with JAX instead of NumPy
+        """
+        self.n_envs = n_envs
+        self.n_frames = n_frames
+        self.use_jax = use_jax
+        self.observation_space = spaces.Box(
+            low=0, high=255, shape=(height, width, n_frames), dtype=np.uint8
+        )
+        self.gray_weights = np.asarray([0.299, 0.587, 0.114], dtype=np.float32)[: frame_shape[2]]
+        self.row_weights = _area_weights(frame_shape[0], height)
+        self.col_weights = _area_weights(frame_shape[1], width).T.copy()
+        self.stacks = np.zeros((n_envs, *self.observation_space.shape), dtype=np.uint8)
+        if use_jax:
+            import jax
+            import jax.numpy as jnp
+
+            self.xp = jnp
+            self._step = jax.jit(self._step)
+            self._reset = jax.jit(self._reset)
+        else:
+            self.xp = np
+
+    def process(self, raw):
+        xp = self.xp
+        frames = xp.maximum(raw[:, 0], raw[:, 1]).astype(xp.float32)
+        if frames.shape[-1] == 1:
+            gray = frames[..., 0]
+        else:
+            gray = xp.round(frames @ self.gray_weights)
+        resized = self.row_weights @ gray @ self.col_weights
+        return xp.clip(xp.round(resized), 0, 255).astype(xp.uint8)[..., None]
+
+    def _reset(self, raw):
+        return self.xp.tile(self.process(raw), (1, 1, 1, self.n_frames))
+
+    def _step(self, stacks, end_raw, raw, dones):
+        xp = self.xp
+        next_stacks = xp.concatenate([stacks[..., 1:], self.process(end_raw)], axis=-1)
+        reset_stacks = self._reset(raw)
+        stacks = xp.where(dones[:, None, None, None], reset_stacks, next_stacks)
+        return next_stacks, stacks
+
+    def reset(self, raw):
+        self.stacks = self._reset(raw)
+        return np.asarray(self.stacks)
+
+    def step(self, end_raw, raw, dones):
+        """Stacks the end frames of a step, the stacks of the done envs restart from ``raw``.
+
+        :param end_raw: (np.ndarray) raw frames of the step, the end frames for the done envs
+        :param raw: (np.ndarray) raw frames after the auto reset of the done envs
+        :param dones: (np.ndarray) terminated or truncated envs
+        :return: (np.ndarray, np.ndarray) next observations and current observations
+        """
+        if self.use_jax:
+            next_stacks, self.stacks = self._step(self.stacks, end_raw, raw, dones)
+            return np.asarray(next_stacks), np.asarray(self.stacks)
+        done_idxs = np.where(dones)[0]
+        next_stacks = np.concatenate([self.stacks[..., 1:], self.process(end_raw)], axis=-1)
+        if len(done_idxs) > 0:
+            self.stacks = next_stacks.copy()
+            self.stacks[done_idxs] = self._reset(raw[done_idxs])
+        else:
+            self.stacks = next_stacks
+        return next_stacks, self.stacks
+
+
+class BatchedAtariEnv(VectorizedEnv):
+    def __init__(self, env, use_jax=False):
+        """Vectorized env of make_raw_atari envs with one BatchedAtariPreprocessing for all envs.
+
+        The workers only step the emulator and ship raw frames, the observations are the frame
+        stacks of wrap_deepmind.
+
+        :param env: (VectorizedEnv) synchronous vectorized env of raw Atari envs
+        :param use_jax: (bool) run the preprocessing with JAX instead of NumPy
+        """
+        assert not env.async_step, "the batched preprocessing needs the frames of all envs"
+        self.env = env
+        self.worker_num = env.worker_num
+        self.batch_size = env.batch_size
+        self.env_ids = np.arange(self.worker_num)
+        raw_space = env.env_info["observation_space"]
+        self.preprocessing = BatchedAtariPreprocessing(
+            self.worker_num, raw_space.shape[1:], use_jax=use_jax
+        )
+        self.env_info = {
+            **env.env_info,
+            "observation_space": self.preprocessing.observation_space,
+        }
+        self.obs = self.preprocessing.reset(env.current_obs())
+
+    def get_info(self):
+        return self.env_info
+
+    def reset(self):
+        raw, infos = self.env.reset()
+        self.obs = self.preprocessing.reset(raw)
+        return self.obs, infos
+
+    def current_obs(self):
+        return self.obs
+
+    def step(self, actions):
+        self.env.step(actions)
+
+    def get_result(self):
+        end_raw, rewards, terminateds, truncateds, infos = self.env.get_result()
+        next_obs, self.obs = self.preprocessing.step(
+            end_raw, self.env.current_obs(), np.logical_or(terminateds, truncateds)
+        )
+        return next_obs, rewards, terminateds, truncateds, infos
+
+    def close(self):
+        self.env.close()
+
+
 def get_env_type(env_id):
     _game_envs = defaultdict(set)
 
@@ -1,79 +1,212 @@
 import cpprb
+import jax
 import numpy as np
 
+from model_builder.flax.Module import get_obs_dtypes
+
+
+def get_compress_setup(obsdict, nextobsdict, compress_memory, n_step=False, worker_size=1):
+    """Memory compression of image observations for cpprb buffers.
+
+    Image observations are stack compressed. One step buffers also share the memory of the next
+    observations with the observations through ``next_of``. N-step next observations are n steps
+    ahead, so cpprb can not share or stack compress them, and N-step buffers keep them as they are.
+    Both need the transitions of one env in order, so compression is only possible with one worker.
+
+    :param obsdict: (dict) observation entries of env_dict
+    :param nextobsdict: (dict) next observation entries of env_dict
+    :param compress_memory: (bool) compress image observations
+    :param n_step: (bool) the buffer stores N-step transitions
+    :param worker_size: (int) number of workers adding to the buffer
+    :return: (list, list, dict) stack_compress names, next_of names and the next observation entries
+        which have to be stored in env_dict
+    """
+    assert not (compress_memory and worker_size > 1), (
+        "compress_memory needs the transitions of one env in order, the steps of several workers "
+        "are interleaved in the buffer"
+    )
+    if not compress_memory:
+        return None, None, nextobsdict
+    stackcompress = [k for k, v in obsdict.items() if len(v["shape"]) >= 3]
+    if n_step or len(stackcompress) == 0:
+        return stackcompress or None, None, nextobsdict
+    storednextobsdict = dict(
+        (k, v) for k, v in nextobsdict.items() if k[len("next_") :] not in stackcompress
+    )
+    return stackcompress, stackcompress, storednextobsdict
+
+
+def get_transition_nbytes(env_dict: dict, stack_compress=None):
+    """Bytes per transition of a cpprb buffer, stack compressed entries keep one frame per slot."""
+    nbytes = 0
+    for k, v in env_dict.items():
+        shape = v.get("shape", 1)
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        n = int(np.prod(shape))
+        if stack_compress is not None and k in stack_compress:
+            n = n // shape[-1]
+        nbytes += n * np.dtype(v.get("dtype", np.float32)).itemsize
+    return nbytes
+
+
+def print_memory_report(size: int, transition_nbytes: int, local_nbytes: int = 0):
+    print("----------------------memory---------------------")
+    print("buffer size : ", size)
+    print(f"transition size : {transition_nbytes / 1024:.2f} KiB")
+    print(f"buffer memory : {size * transition_nbytes / 2**30:.2f} GiB")
+    if local_nbytes > 0:
+        print(f"local buffers memory : {local_nbytes / 2**30:.2f} GiB")
+    print(f"1M transitions : {1e6 * transition_nbytes / 2**30:.2f} GiB")
+    print("-------------------------------------------------")
+
 
 class EpochBuffer(object):
-    def __init__(self, epoch_size: int, observation_space: list, worker_size=1, action_space=1):
+    def __init__(
+        self,
+        epoch_size: int,
+        observation_space: list,
+        worker_size=1,
+        action_space=1,
+        compress_memory=False,
+        device=False,
+    ):
+        """Rollout storage of the on-policy algorithms, preallocated as ``[worker, epoch_size, ...]``.
+
+        Every add writes one step of all workers with a single slice assignment, and get_buffer
+        returns the arrays in the ``[worker, time, ...]`` layout the train steps vmap over, without
+        copying them. The returned arrays are overwritten by the next epoch.
+
+        With ``device`` the arrays are JAX arrays updated by a jitted, donated write, so the rollout
+        is already on the device when the train step runs. With ``compress_memory`` (host arrays
+        only) image next observations are the observations shifted by one step, the next
+        observations of the steps ending an episode are kept apart and put back by get_buffer.
+
+        :param epoch_size: (int) number of steps of every worker in one epoch
+        :param observation_space: (list) observation shapes
+        :param worker_size: (int) number of workers
+        :param action_space: (int or list) action shape
+        :param compress_memory: (bool) share the memory of image observations and next observations
+        :param device: (bool) keep the arrays on the default JAX device
+        """
         self.epoch_size = epoch_size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
         self.nextobsdict = dict(
-            (
-                "next_obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
-        self.obscompress = None
+        self.device = device
+        _, obscompress, storednextobsdict = get_compress_setup(
+            self.obsdict, self.nextobsdict, compress_memory and not device
+        )
+        self.obscompress = obscompress or []
+        action_shape = [action_space] if isinstance(action_space, int) else list(action_space)
+        self.env_dict = {
+            **self.obsdict,
+            "action": {"shape": action_shape},
+            "reward": {},
+            **storednextobsdict,
+            "terminated": {},
+            "truncated": {},
+        }
         self.worker_size = worker_size
-        self.local_buffers = [
-            cpprb.ReplayBuffer(
-                epoch_size,
-                env_dict={
-                    **self.obsdict,
-                    "action": {"shape": action_space},
-                    "reward": {},
-                    **self.nextobsdict,
-                    "terminated": {},
-                    "truncated": {},
-                },
+        self.pos = 0
+        self.end_obs = []
+        # shared observations keep one more step for the next observation of the last step
+        self.storage = dict(
+            (
+                k,
+                np.zeros(
+                    (
+                        worker_size,
+                        epoch_size + 1 if k in self.obscompress else epoch_size,
+                        *v.get("shape", [1]),
+                    ),
+                    dtype=v.get("dtype", np.float32),
+                ),
             )
-            for _ in range(worker_size)
-        ]
+            for k, v in self.env_dict.items()
+        )
+        if device:
+            self.storage = jax.device_put(self.storage)
+            self._write = jax.jit(self._write, donate_argnums=(0,))
+
+    def _write(self, storage, t, transition):
+        return dict(
+            (k, jax.lax.dynamic_update_index_in_dim(storage[k], v.astype(storage[k].dtype), t, 1))
+            for k, v in transition.items()
+        )
 
     def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated):
-        for w in range(self.worker_size):
-            obsdict = dict(zip(self.obsdict.keys(), [o[w] for o in obs_t]))
-            nextobsdict = dict(zip(self.nextobsdict.keys(), [no[w] for no in nxtobs_t]))
-            self.local_buffers[w].add(
-                **obsdict,
-                action=action[w],
-                reward=reward[w],
-                **nextobsdict,
-                terminated=terminated[w],
-                truncated=truncated[w],
-            )
-            if terminated[w] or truncated[w]:
-                self.local_buffers[w].on_episode_end()
+        w = self.worker_size
+        transition = {
+            **dict(
+                (k, np.reshape(o, (w, *v["shape"])))
+                for (k, v), o in zip(self.obsdict.items(), obs_t)
+            ),
+            "action": np.reshape(action, (w, *self.env_dict["action"]["shape"])),
+            "reward": np.reshape(reward, (w, 1)),
+            **dict(
+                (k, np.reshape(no, (w, *v["shape"])))
+                for (k, v), no in zip(self.nextobsdict.items(), nxtobs_t)
+                if k in self.env_dict
+            ),
+            "terminated": np.reshape(terminated, (w, 1)),
+            "truncated": np.reshape(truncated, (w, 1)),
+        }
+        if self.device:
+            self.storage = self._write(self.storage, self.pos, transition)
+        else:
+            for k, v in transition.items():
+                self.storage[k][:, self.pos] = v
+            if len(self.obscompress) > 0:
+                ended = np.nonzero(np.logical_or(terminated, truncated))[0]
+                for o, no in zip(self.obsdict.keys(), nxtobs_t):
+                    if o in self.obscompress:
+                        no = np.reshape(no, (w, *self.obsdict[o]["shape"]))
+                        self.storage[o][:, self.pos + 1] = no
+                        if len(ended) > 0:
+                            self.end_obs.append((o, self.pos, ended, no[ended]))
+        self.pos += 1
+
+    def steps(self, k, t):
+        # full epochs are handed over as they are, slicing device arrays would copy them
+        return self.storage[k] if self.storage[k].shape[1] == t else self.storage[k][:, :t]
 
     def get_buffer(self):
-        transitions = {
-            "obses": [],
-            "actions": [],
-            "rewards": [],
-            "nxtobses": [],
-            "terminateds": [],
-            "truncateds": [],
+        t = self.pos
+        self.pos = 0
+        nxtobses = []
+        for o, k in zip(self.obsdict.keys(), self.nextobsdict.keys()):
+            if o in self.obscompress:
+                nxtobs = self.storage[o][:, 1 : t + 1].copy()
+                for eo, et, ended, value in self.end_obs:
+                    if eo == o:
+                        nxtobs[ended, et] = value
+                nxtobses.append(nxtobs)
+            else:
+                nxtobses.append(self.steps(k, t))
+        self.end_obs = []
+        return {
+            "obses": [self.steps(o, t) for o in self.obsdict.keys()],
+            "actions": self.steps("action", t),
+            "rewards": self.steps("reward", t),
+            "nxtobses": nxtobses,
+            "terminateds": self.steps("terminated", t),
+            "truncateds": self.steps("truncated", t),
         }
-        for w in range(self.worker_size):
-            trans = self.local_buffers[w].get_all_transitions()
-            transitions["obses"].append([trans[o] for o in self.obsdict.keys()])
-            transitions["actions"].append(trans["action"])
-            transitions["rewards"].append(trans["reward"])
-            transitions["nxtobses"].append([trans[o] for o in self.nextobsdict.keys()])
-            transitions["terminateds"].append(trans["terminated"])
-            transitions["truncateds"].append(trans["truncated"])
-            self.local_buffers[w].clear()
-        return transitions
+
+    def memory_report(self):
+        print_memory_report(
+            self.epoch_size * self.worker_size,
+            get_transition_nbytes(self.env_dict),
+        )
 
 
 class ReplayBuffer(object):
@@ -85,50 +218,45 @@ class ReplayBuffer(object):
         compress_memory=False,
         env_dict=None,
         n_s=None,
+        worker_size=1,
     ):
         self.max_size = size
         if env_dict is None:
             self.obsdict = dict(
-                (
-                    "obs{}".format(idx),
-                    {"shape": o, "dtype": np.uint8}
-                    if len(o) >= 3
-                    else {"shape": o, "dtype": np.float32},
+                ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+                for idx, (o, dtype) in enumerate(
+                    zip(observation_space, get_obs_dtypes(observation_space))
                 )
-                for idx, o in enumerate(observation_space)
             )
             self.nextobsdict = dict(
-                (
-                    "next_obs{}".format(idx),
-                    {"shape": o, "dtype": np.uint8}
-                    if len(o) >= 3
-                    else {"shape": o, "dtype": np.float32},
+                ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+                for idx, (o, dtype) in enumerate(
+                    zip(observation_space, get_obs_dtypes(observation_space))
                 )
-                for idx, o in enumerate(observation_space)
             )
-            self.obscompress = None
-            if compress_memory:
-                self.obscompress = []
-                for k in self.obsdict:
-                    if len(self.obsdict[k]["shape"]) >= 3:
-                        self.obscompress.append(k)
-                        del self.nextobsdict[f"next_{k}"]
-
+            self.stackcompress, self.obscompress, storednextobsdict = get_compress_setup(
+                self.obsdict, self.nextobsdict, compress_memory, worker_size=worker_size
+            )
+            self.episode_end_on_add = worker_size == 1
+            self.env_dict = {
+                **self.obsdict,
+                "action": {"shape": action_space},
+                "reward": {},
+                **storednextobsdict,
+                "done": {},
+            }
             self.buffer = cpprb.ReplayBuffer(
                 size,
-                env_dict={
-                    **self.obsdict,
-                    "action": {"shape": action_space},
-                    "reward": {},
-                    **self.nextobsdict,
-                    "done": {},
-                },
+                env_dict=self.env_dict,
                 next_of=self.obscompress,
-                stack_compress=self.obscompress,
+                stack_compress=self.stackcompress,
             )
         else:
             self.obsdict = dict((o, None) for o in env_dict.keys() if o.startswith("obs"))
             self.nextobsdict = dict((o, None) for o in env_dict.keys() if o.startswith("next_obs"))
+            self.stackcompress = None
+            self.episode_end_on_add = False
+            self.env_dict = env_dict
             self.buffer = cpprb.ReplayBuffer(size, env_dict=env_dict, Nstep=n_s)
 
     def __len__(self) -> int:
@@ -148,10 +276,13 @@ class ReplayBuffer(object):
     def is_full(self) -> int:
         return len(self) == self.max_size
 
-    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False):
+    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False, env_ids=None):
         obsdict = dict(zip(self.obsdict.keys(), obs_t))
         nextobsdict = dict(zip(self.nextobsdict.keys(), nxtobs_t))
         self.buffer.add(**obsdict, action=action, reward=reward, **nextobsdict, done=terminated)
+        if self.episode_end_on_add and (terminated or truncated):
+            # next_of and stack_compress need the episode boundaries
+            self.buffer.on_episode_end()
 
     def episode_end(self):
         self.buffer.on_episode_end()
@@ -181,6 +312,100 @@ class ReplayBuffer(object):
     def clear(self):
         self.buffer.clear()
 
+    def memory_report(self):
+        print_memory_report(
+            self.max_size,
+            get_transition_nbytes(self.env_dict, self.stackcompress),
+            self.local_buffer_nbytes(),
+        )
+
+    def local_buffer_nbytes(self):
+        if not hasattr(self, "nstep_accumulator"):
+            return 0
+        return self.nstep_accumulator.nbytes()
+
+
+class NstepAccumulator(object):
+    def __init__(
+        self,
+        worker_size: int,
+        n_step: int,
+        gamma: float,
+        obsdict: dict,
+        nextobsdict: dict,
+        action_space=1,
+    ):
+        """Builds the N-step transitions of many workers with ring arrays of their last n steps.
+
+        Every add writes one step of all workers (or of ``env_ids`` for partial batches of
+        asynchronous envs) into ``[worker, n_step, ...]`` arrays and returns the transitions it
+        completed, computed for all workers in one pass: the oldest step of every worker with n
+        steps in its ring, and all pending steps of the workers whose episode ended. Returns, next
+        observations and done flags are the ones of the cpprb Nstep buffers.
+
+        :param worker_size: (int) number of workers
+        :param n_step: (int) number of steps of the returns
+        :param gamma: (float) discount factor
+        :param obsdict: (dict) observation entries of env_dict
+        :param nextobsdict: (dict) next observation entries of env_dict
+        :param action_space: (int or list) action shape
+        """
+        self.worker_size = worker_size
+        self.n_step = n_step
+        self.obsdict = obsdict
+        self.nextobsdict = nextobsdict
+        action_shape = [action_space] if isinstance(action_space, int) else list(action_space)
+        self.obs = [
+            np.zeros((worker_size, n_step, *v["shape"]), dtype=v["dtype"]) for v in obsdict.values()
+        ]
+        self.action = np.zeros((worker_size, n_step, *action_shape), dtype=np.float32)
+        self.reward = np.zeros((worker_size, n_step), dtype=np.float32)
+        self.count = np.zeros(worker_size, dtype=np.int64)
+        self.pos = np.zeros(worker_size, dtype=np.int64)
+        # discount[i, j] = gamma ** (j - i) for j >= i, so reward @ discount.T is the return of every
+        # position of the ring ordered from the oldest to the newest step
+        k = np.arange(n_step)
+        self.discount = np.where(
+            k[None, :] >= k[:, None], gamma ** np.maximum(k[None, :] - k[:, None], 0), 0.0
+        ).astype(np.float32)
+
+    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated, env_ids=None):
+        # rows of the stepped workers, all of them unless the env returned a partial batch
+        rows = np.arange(self.worker_size) if env_ids is None else np.asarray(env_ids)
+        pos = self.pos[rows]
+        for ring, o in zip(self.obs, obs_t):
+            ring[rows, pos] = o
+        self.action[rows, pos] = np.reshape(action, self.action[rows, pos].shape)
+        self.reward[rows, pos] = np.reshape(reward, -1)
+        count = np.minimum(self.count[rows] + 1, self.n_step)
+        order = (pos[:, None] + 1 + np.arange(self.n_step)[None, :]) % self.n_step
+        self.pos[rows] = (pos + 1) % self.n_step
+
+        valid = np.arange(self.n_step)[None, :] >= (self.n_step - count)[:, None]
+        returns = (np.take_along_axis(self.reward[rows], order, axis=1) * valid) @ self.discount.T
+        terminated = np.reshape(terminated, -1)
+        ended = np.logical_or(terminated, np.reshape(truncated, -1))
+        emit = valid & ended[:, None]
+        emit[:, 0] |= count == self.n_step
+        count[ended] = 0
+        self.count[rows] = count
+
+        widx, pidx = np.nonzero(emit)
+        wrows, ridx = rows[widx], order[widx, pidx]
+        return {
+            **dict((k, ring[wrows, ridx]) for k, ring in zip(self.obsdict.keys(), self.obs)),
+            "action": self.action[wrows, ridx],
+            "reward": returns[widx, pidx],
+            **dict((k, np.asarray(no)[widx]) for k, no in zip(self.nextobsdict.keys(), nxtobs_t)),
+            "done": terminated[widx].astype(np.float32),
+        }
+
+    def clear(self):
+        self.count[:] = 0
+
+    def nbytes(self) -> int:
+        return sum(ring.nbytes for ring in self.obs) + self.action.nbytes + self.reward.nbytes
+
 
 class NstepReplayBuffer(ReplayBuffer):
     def __init__(
@@ -195,32 +420,30 @@ class NstepReplayBuffer(ReplayBuffer):
     ):
         self.max_size = size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
         self.nextobsdict = dict(
-            (
-                "next_obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
-        self.obscompress = None
-        if compress_memory:
-            self.obscompress = []
-            for k in self.obsdict:
-                if len(self.obsdict[k]["shape"]) >= 3:
-                    self.obscompress.append(k)
-                    del self.nextobsdict[f"next_{k}"]
+        self.stackcompress, _, storednextobsdict = get_compress_setup(
+            self.obsdict, self.nextobsdict, compress_memory, n_step=True, worker_size=worker_size
+        )
+        self.env_dict = {
+            **self.obsdict,
+            "action": {"shape": action_space},
+            "reward": {},
+            **storednextobsdict,
+            "done": {},
+        }
 
         self.worker_size = worker_size
+        self.episode_end_on_add = worker_size == 1
         n_s = {
             "size": n_step,
             "rew": "reward",
@@ -231,66 +454,34 @@ class NstepReplayBuffer(ReplayBuffer):
         if worker_size > 1:
             self.buffer = cpprb.ReplayBuffer(
                 size,
-                env_dict={
-                    **self.obsdict,
-                    "action": {"shape": action_space},
-                    "reward": {},
-                    **self.nextobsdict,
-                    "done": {},
-                },
-                next_of=self.obscompress,
-                stack_compress=self.obscompress,
+                env_dict=self.env_dict,
+                stack_compress=self.stackcompress,
+            )
+            self.nstep_accumulator = NstepAccumulator(
+                worker_size, n_step, gamma, self.obsdict, self.nextobsdict, action_space
             )
-            self.local_buffers = [
-                cpprb.ReplayBuffer(
-                    2000,
-                    env_dict={
-                        **self.obsdict,
-                        "action": {"shape": action_space},
-                        "reward": {},
-                        **self.nextobsdict,
-                        "done": {},
-                    },
-                    Nstep=n_s,
-                )
-                for _ in range(worker_size)
-            ]
             self.add = self.multiworker_add
         else:
             self.buffer = cpprb.ReplayBuffer(
                 size,
-                env_dict={
-                    **self.obsdict,
-                    "action": {"shape": action_space},
-                    "reward": {},
-                    **self.nextobsdict,
-                    "done": {},
-                },
+                env_dict=self.env_dict,
                 Nstep=n_s,
-                next_of=self.obscompress,
-                stack_compress=self.obscompress,
+                stack_compress=self.stackcompress,
             )
 
-    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False):
-        super().add(obs_t, action, reward, nxtobs_t, terminated, truncated)
-        if terminated or truncated:
-            self.buffer.on_episode_end()
+    def multiworker_add(
+        self, obs_t, action, reward, nxtobs_t, terminated, truncated=False, env_ids=None
+    ):
+        transitions = self.nstep_accumulator.add(
+            obs_t, action, reward, nxtobs_t, terminated, truncated, env_ids
+        )
+        if len(transitions["done"]) > 0:
+            self.buffer.add(**transitions)
 
-    def multiworker_add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False):
-        for w in range(self.worker_size):
-            obsdict = dict(zip(self.obsdict.keys(), [o[w] for o in obs_t]))
-            nextobsdict = dict(zip(self.nextobsdict.keys(), [no[w] for no in nxtobs_t]))
-            self.local_buffers[w].add(
-                **obsdict,
-                action=action[w],
-                reward=reward[w],
-                **nextobsdict,
-                done=terminated[w],
-            )
-            if terminated[w] or truncated[w]:
-                self.local_buffers[w].on_episode_end()
-                self.buffer.add(**self.local_buffers[w].get_all_transitions())
-                self.local_buffers[w].clear()
+    def clear(self):
+        self.buffer.clear()
+        if hasattr(self, "nstep_accumulator"):
+            self.nstep_accumulator.clear()
 
 
 class PrioritizedReplayBuffer(ReplayBuffer):
@@ -302,47 +493,40 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         action_space=1,
         compress_memory=False,
         eps=1e-4,
+        worker_size=1,
     ):
         self.max_size = size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
         self.nextobsdict = dict(
-            (
-                "next_obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
-        self.obscompress = None
-        if compress_memory:
-            self.obscompress = []
-            for k in self.obsdict:
-                if len(self.obsdict[k]["shape"]) >= 3:
-                    self.obscompress.append(k)
-                    del self.nextobsdict[f"next_{k}"]
+        self.stackcompress, self.obscompress, storednextobsdict = get_compress_setup(
+            self.obsdict, self.nextobsdict, compress_memory, worker_size=worker_size
+        )
+        self.episode_end_on_add = worker_size == 1
+        self.env_dict = {
+            **self.obsdict,
+            "action": {"shape": action_space},
+            "reward": {},
+            **storednextobsdict,
+            "done": {},
+        }
 
         self.buffer = cpprb.PrioritizedReplayBuffer(
             size,
-            env_dict={
-                **self.obsdict,
-                "action": {"shape": action_space},
-                "reward": {},
-                **self.nextobsdict,
-                "done": {},
-            },
+            env_dict=self.env_dict,
             alpha=alpha,
             eps=eps,
             next_of=self.obscompress,
-            stack_compress=self.obscompress,
+            stack_compress=self.stackcompress,
         )
 
     def sample(self, batch_size: int, beta=0.5):
@@ -376,32 +560,30 @@ class PrioritizedNstepReplayBuffer(NstepReplayBuffer):
     ):
         self.max_size = size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
         self.nextobsdict = dict(
-            (
-                "next_obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
-        self.obscompress = None
-        if compress_memory:
-            self.obscompress = []
-            for k in self.obsdict:
-                if len(self.obsdict[k]["shape"]) >= 3:
-                    self.obscompress.append(k)
-                    del self.nextobsdict[f"next_{k}"]
+        self.stackcompress, _, storednextobsdict = get_compress_setup(
+            self.obsdict, self.nextobsdict, compress_memory, n_step=True, worker_size=worker_size
+        )
+        self.env_dict = {
+            **self.obsdict,
+            "action": {"shape": action_space},
+            "reward": {},
+            **storednextobsdict,
+            "done": {},
+        }
 
         self.worker_size = worker_size
+        self.episode_end_on_add = worker_size == 1
         n_s = {
             "size": n_step,
             "rew": "reward",
@@ -412,48 +594,23 @@ class PrioritizedNstepReplayBuffer(NstepReplayBuffer):
         if worker_size > 1:
             self.buffer = cpprb.PrioritizedReplayBuffer(
                 size,
-                env_dict={
-                    **self.obsdict,
-                    "action": {"shape": action_space},
-                    "reward": {},
-                    **self.nextobsdict,
-                    "done": {},
-                },
+                env_dict=self.env_dict,
                 alpha=alpha,
                 eps=eps,
-                next_of=self.obscompress,
-                stack_compress=self.obscompress,
+                stack_compress=self.stackcompress,
+            )
+            self.nstep_accumulator = NstepAccumulator(
+                worker_size, n_step, gamma, self.obsdict, self.nextobsdict, action_space
             )
-            self.local_buffers = [
-                cpprb.ReplayBuffer(
-                    2000,
-                    env_dict={
-                        **self.obsdict,
-                        "action": {"shape": action_space},
-                        "reward": {},
-                        **self.nextobsdict,
-                        "done": {},
-                    },
-                    Nstep=n_s,
-                )
-                for _ in range(worker_size)
-            ]
             self.add = self.multiworker_add
         else:
             self.buffer = cpprb.PrioritizedReplayBuffer(
                 size,
-                env_dict={
-                    **self.obsdict,
-                    "action": {"shape": action_space},
-                    "reward": {},
-                    **self.nextobsdict,
-                    "done": {},
-                },
+                env_dict=self.env_dict,
                 alpha=alpha,
                 eps=eps,
                 Nstep=n_s,
-                next_of=self.obscompress,
-                stack_compress=self.obscompress,
+                stack_compress=self.stackcompress,
             )
 
     def sample(self, batch_size: int, beta=0.5):
@@ -487,31 +644,21 @@ class MultiPrioritizedReplayBuffer:
     ):
         self.max_size = size
         self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
         self.nextobsdict = dict(
-            (
-                "next_obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
             )
-            for idx, o in enumerate(observation_space)
         )
-        self.obscompress = None
-        if compress_memory:
-            self.obscompress = []
-            for k in self.obsdict:
-                if len(self.obsdict[k]["shape"]) >= 3:
-                    self.obscompress.append(k)
-                    del self.nextobsdict[f"next_{k}"]
-
+        # Ape-X workers flush parts of episodes from many actors into the same buffer, so the
+        # frames of neighbouring slots are not from the same episode and can not be stack compressed
+        assert not compress_memory, "compress_memory is not supported by the Ape-X replay buffer"
+        self.stackcompress = None
         self.env_dict = {
             **self.obsdict,
             "action": {"shape": action_space},
@@ -558,3 +705,6 @@ class MultiPrioritizedReplayBuffer:
 
     def update_priorities(self, indexes, priorities):
         self.buffer.update_priorities(indexes, priorities)
+
+    def memory_report(self):
+        print_memory_report(self.max_size, get_transition_nbytes(self.env_dict))
@@ -0,0 +1,65 @@
+import jax
+
+
+class CPUActor(object):
+    def __init__(self, agent, update_freq, device=None):
+        """Holds a host copy of the agent's parameters for action selection.
+
+        On an accelerator, acting on a handful of observations costs a launch and a sync every
+        env step, while the same forward pass on the host is cheap. ``update`` copies every
+        ``*params`` attribute of the agent to the host device every ``update_freq`` train steps.
+        The copy is dispatched without waiting and replaces the acting parameters once it has
+        arrived, so neither the learner nor the actor waits for the transfer. The acting
+        parameters lag the learner by at most ``update_freq`` train steps plus one copy.
+
+        The jitted policy runs where its parameters and key are committed. On a CPU only host the
+        actor uses the last CPU device, so with ``XLA_FLAGS=--xla_force_host_platform_device_count=2``
+        the learner and the actor run on different devices.
+
+        :param agent: (object) agent whose ``*params`` attributes are copied, with a ``seed``
+        :param update_freq: (int) train steps between the copies
+        :param device: (jax.Device) device of the acting parameters, the last CPU device by default
+        """
+        self.agent = agent
+        self.update_freq = update_freq
+        self.device = jax.devices("cpu")[-1] if device is None else device
+        self.key_seq = self._key_gen(agent.seed)
+        self.copies = self._copy()
+        jax.block_until_ready(self.copies)
+        self.pending = None
+        self.last_update = 0
+        self.updates = 1
+
+    def __getattr__(self, name):
+        # the acting parameters are read like the attributes of the agent
+        copies = self.__dict__.get("copies", {})
+        if name in copies:
+            return copies[name]
+        raise AttributeError(name)
+
+    def _key_gen(self, seed):
+        # keys committed to the actor device, folded so they differ from the learner's keys
+        key = jax.device_put(jax.random.fold_in(jax.random.PRNGKey(seed), 1), self.device)
+        while True:
+            key, subkey = jax.random.split(key)
+            yield subkey
+
+    def _copy(self):
+        return {
+            k: jax.device_put(v, self.device)
+            for k, v in vars(self.agent).items()
+            if k.endswith("params")
+        }
+
+    def update(self, train_steps):
+        if self.pending is not None and all(x.is_ready() for x in jax.tree.leaves(self.pending)):
+            self.copies, self.pending = self.pending, None
+            self.updates += 1
+        if self.pending is None and train_steps - self.last_update >= self.update_freq:
+            self.pending = self._copy()
+            self.last_update = train_steps
+
+    def close(self):
+        print("--------------------cpu actor--------------------")
+        print(f"device : {self.device}, parameter updates : {self.updates}")
+        print("-------------------------------------------------")
@@ -1,4 +1,7 @@
+import atexit
+import multiprocessing as mp
 from abc import ABC, abstractmethod
+from multiprocessing import shared_memory
 
 import gymnasium as gym
 import numpy as np
@@ -6,10 +9,52 @@ import ray
 from gymnasium import spaces
 
 
-def get_env_builder(env_name, **kwargs):
-    def env_builder(worker=1, render_mode=None):
+def get_env_builder(
+    env_name,
+    vectorized_env="ray",
+    envs_per_actor=1,
+    env_batch_size=None,
+    atari_preprocessing="worker",
+    **kwargs,
+):
+    """Builder of the training and evaluation environments.
+
+    :param env_name: (str) gym or atari environment id
+    :param vectorized_env: (str) backend of the vectorized environments, "ray" for one Ray actor per
+        env, "multiprocessing" for subprocesses writing into shared memory, "jax" for the JAX
+        implementation of the env stepped inside the jitted training loop (a single evaluation
+        env stays the gym env)
+    :param envs_per_actor: (int) number of environments stepped by one Ray actor
+    :param env_batch_size: (int) number of environments returned by an asynchronous Ray step, None
+        for synchronous steps
+    :param atari_preprocessing: (str) where the frames of vectorized Atari envs are preprocessed,
+        "worker" for the wrappers in every env, "numpy" or "jax" for raw frames from the workers
+        and one batched preprocessing of all envs
+    """
+
+    def env_builder(worker=1, render_mode=None, evaluation=False):
+        # evaluation envs are always stepped synchronously, one actor per env
         if worker > 1:
-            return rayVectorizedGymEnv(env_name, worker_num=worker)
+            if vectorized_env == "jax":
+                from jax_baselines.common.jax_envs import JaxVectorizedEnv
+
+                return JaxVectorizedEnv(env_name, worker_num=worker)
+            raw_atari = atari_preprocessing != "worker"
+            if vectorized_env == "multiprocessing":
+                env = mpVectorizedGymEnv(env_name, worker_num=worker, raw_atari=raw_atari)
+            else:
+                env = rayVectorizedGymEnv(
+                    env_name,
+                    worker_num=worker,
+                    envs_per_actor=1 if evaluation else envs_per_actor,
+                    batch_size=None if evaluation else env_batch_size,
+                    raw_atari=raw_atari,
+                )
+            if raw_atari and env.env_info["env_type"] == "atari_env":
+                from jax_baselines.common.atari_wrappers import BatchedAtariEnv
+
+                env = BatchedAtariEnv(env, use_jax=atari_preprocessing == "jax")
+            return env
         else:
             from jax_baselines.common.atari_wrappers import (
                 get_env_type,
@@ -18,7 +63,8 @@ def get_env_builder(env_name, **kwargs):
 
             env_type, env_id = get_env_type(env_name)
             if env_type == "atari_env":
-                env = make_wrap_atari(env_name, clip_rewards=True)
+                # the learners add the observations to their buffers before the next step
+                env = make_wrap_atari(env_name, clip_rewards=True, copy_obs=evaluation)
             else:
                 env = gym.make(env_name, render_mode=render_mode)
             return env
@@ -82,87 +128,357 @@ class VectorizedEnv(Env):
 
     env_info = None
     num_workers = None
+    batch_size = None
+    async_step = False
 
 
 class rayVectorizedGymEnv(VectorizedEnv):
-    def __init__(self, env_id, worker_num=8, render=False):
-        ray.init(num_cpus=worker_num)
+    def __init__(
+        self,
+        env_id,
+        worker_num=8,
+        render=False,
+        envs_per_actor=1,
+        batch_size=None,
+        raw_atari=False,
+    ):
+        """Vectorized environment on Ray actors, every actor steps ``envs_per_actor`` envs.
+
+        With ``batch_size`` smaller than ``worker_num`` the env steps asynchronously: get_result
+        returns the first ``batch_size`` envs which finished their step while the others keep
+        stepping, ``env_ids`` are the envs of the returned results and of the next current_obs,
+        ``result_obs`` and ``result_actions`` the observations and actions of the returned steps.
+
+        :param env_id: (str) gym or atari environment id
+        :param worker_num: (int) number of environments, actors x envs_per_actor
+        :param render: (bool) render the first environment
+        :param envs_per_actor: (int) number of environments stepped in a loop by one actor
+        :param batch_size: (int) number of environments returned by get_result, None for all
+        :param raw_atari: (bool) Atari envs return raw frames, see make_raw_atari
+        """
+        assert worker_num % envs_per_actor == 0, "worker_num has to be a multiple of envs_per_actor"
         self.env_id = env_id
         self.worker_num = worker_num
+        self.envs_per_actor = envs_per_actor
+        self.actor_num = worker_num // envs_per_actor
+        self.batch_size = worker_num if batch_size is None else batch_size
+        assert (
+            self.batch_size % envs_per_actor == 0 and self.batch_size <= worker_num
+        ), "batch_size has to be a multiple of envs_per_actor and at most worker_num"
+        self.async_step = self.batch_size < worker_num
+        # the train and eval envs share one Ray session, the env which started it shuts it down
+        self.owns_ray = not ray.is_initialized()
+        if self.owns_ray:
+            ray.init(num_cpus=self.actor_num)
         self.workers = [
-            gymRayworker.remote(env_id, render=(w == 0) if render else False)
-            for w in range(worker_num)
+            gymRayworker.remote(
+                env_id, envs_per_actor, render=(w == 0) if render else False, raw_atari=raw_atari
+            )
+            for w in range(self.actor_num)
         ]
         self.env_info = ray.get(self.workers[0].get_info.remote())
         resets = ray.get([w.get_reset.remote() for w in self.workers])
-        obs_list, self.reset_info = zip(*resets)
-        self.obs = np.stack(obs_list, axis=0)
+        obs_list, reset_infos = zip(*resets)
+        self.reset_info = sum(reset_infos, [])
+        self.obs = np.concatenate(obs_list, axis=0)
+        self.actor_ids = np.arange(self.actor_num)
+        self.env_ids = np.arange(worker_num)
+        self.pending = {}
 
     def get_info(self):
         return self.env_info
 
+    def reset(self):
+        assert len(self.pending) == 0, "reset of an env with steps in flight"
+        resets = ray.get([w.get_reset.remote() for w in self.workers])
+        obs_list, reset_infos = zip(*resets)
+        self.reset_info = sum(reset_infos, [])
+        self.obs = np.concatenate(obs_list, axis=0)
+        self.actor_ids = np.arange(self.actor_num)
+        self.env_ids = np.arange(self.worker_num)
+        return self.obs, self.reset_info
+
     def current_obs(self):
         return self.obs
 
     def step(self, actions):
-        self.steps = [w.step.remote(a) for w, a in zip(self.workers, actions)]
+        actions = np.reshape(
+            actions, (len(self.actor_ids), self.envs_per_actor, *np.shape(actions)[1:])
+        )
+        if not self.async_step:
+            self.steps = [w.step.remote(a) for w, a in zip(self.workers, actions)]
+            return
+        obs = np.reshape(self.obs, (len(self.actor_ids), self.envs_per_actor, *self.obs.shape[1:]))
+        for actor, o, a in zip(self.actor_ids, obs, actions):
+            self.pending[self.workers[actor].step.remote(a)] = (actor, o, a)
 
     def get_result(self):
-        steps = ray.get(self.steps)
-        next_obs, end_states, rewards, terminateds, truncateds, dones, infos = zip(*steps)
-        next_obs = np.stack(next_obs, axis=0)
-        rewards = np.stack(rewards, axis=0)
-        terminateds = np.stack(terminateds, axis=0)
-        truncateds = np.stack(truncateds, axis=0)
-        if any(dones):
-            self.obs = np.copy(next_obs)
-            for idx, done in enumerate(dones):
-                if done:
-                    next_obs[idx] = end_states[idx]
+        if self.async_step:
+            refs, _ = ray.wait(
+                list(self.pending.keys()), num_returns=self.batch_size // self.envs_per_actor
+            )
+            steps = ray.get(refs)
+            self.actor_ids, result_obs, result_actions = zip(*[self.pending.pop(r) for r in refs])
+            self.actor_ids = np.asarray(self.actor_ids)
+            self.env_ids = (
+                self.actor_ids[:, None] * self.envs_per_actor + np.arange(self.envs_per_actor)
+            ).reshape(-1)
+            self.result_obs = np.concatenate(result_obs, axis=0)
+            self.result_actions = np.concatenate(result_actions, axis=0)
+        else:
+            steps = ray.get(self.steps)
+        obs, end_idxs, end_states, rewards, terminateds, truncateds, infos = zip(*steps)
+        self.obs = np.concatenate(obs, axis=0)
+        rewards = np.concatenate(rewards, axis=0)
+        terminateds = np.concatenate(terminateds, axis=0)
+        truncateds = np.concatenate(truncateds, axis=0)
+        infos = sum(infos, [])
+        if any(len(idxs) > 0 for idxs in end_idxs):
+            next_obs = np.copy(self.obs)
+            for a, (idxs, states) in enumerate(zip(end_idxs, end_states)):
+                if len(idxs) > 0:
+                    next_obs[a * self.envs_per_actor + idxs] = np.stack(states, axis=0)
         else:
-            self.obs = next_obs
+            next_obs = self.obs
         return next_obs, rewards, terminateds, truncateds, infos
 
     def close(self):
-        ray.shutdown()
+        for w in self.workers:
+            ray.kill(w)
+        if self.owns_ray:
+            ray.shutdown()
 
 
 @ray.remote
 class gymRayworker:
-    def __init__(self, env_name_, render=False):
-        from jax_baselines.common.atari_wrappers import get_env_type, make_wrap_atari
-
-        self.env_type, self.env_id = get_env_type(env_name_)
-        if self.env_type == "atari_env":
-            self.env = make_wrap_atari(env_name_, clip_rewards=True)
-        else:
-            self.env = gym.make(env_name_)
-        if not isinstance(self.env.action_space, spaces.Box):
+    def __init__(self, env_name_, env_num=1, render=False, raw_atari=False):
+        envs = [_make_gym_env(env_name_, raw_atari) for _ in range(env_num)]
+        self.envs = [env for env, _, _ in envs]
+        _, self.env_type, self.env_id = envs[0]
+        if not isinstance(self.envs[0].action_space, spaces.Box):
             self.action_conv = lambda a: a[0]
         else:
             self.action_conv = lambda a: a
         self.render = render
 
     def get_reset(self):
-        obs, info = self.env.reset()
-        return obs, info
+        obs, infos = zip(*[env.reset() for env in self.envs])
+        return np.stack(obs, axis=0), list(infos)
 
     def get_info(self):
         return {
-            "observation_space": self.env.observation_space,
-            "action_space": self.env.action_space,
+            "observation_space": self.envs[0].observation_space,
+            "action_space": self.envs[0].action_space,
             "env_type": self.env_type,
             "env_id": self.env_id,
         }
 
-    def step(self, action):
+    def step(self, actions):
         if self.render:
-            self.env.render()
-        obs, reward, terminated, truncated, info = self.env.step(self.action_conv(action))
-        done = terminated or truncated
-        if done:
-            done_obs = obs
-            obs, _ = self.env.reset()
+            self.envs[0].render()
+        obs, end_idxs, end_states, infos = [], [], [], []
+        rewards = np.zeros(len(self.envs))
+        terminateds = np.zeros(len(self.envs), dtype=np.bool_)
+        truncateds = np.zeros(len(self.envs), dtype=np.bool_)
+        for idx, (env, action) in enumerate(zip(self.envs, actions)):
+            o, reward, terminated, truncated, info = env.step(self.action_conv(action))
+            if terminated or truncated:
+                end_idxs.append(idx)
+                end_states.append(o)
+                o, _ = env.reset()
+            obs.append(o)
+            rewards[idx] = reward
+            terminateds[idx] = terminated
+            truncateds[idx] = truncated
+            infos.append(info)
+        return (
+            np.stack(obs, axis=0),
+            np.asarray(end_idxs, dtype=np.int64),
+            end_states,
+            rewards,
+            terminateds,
+            truncateds,
+            infos,
+        )
+
+
+def _make_gym_env(env_name_, raw_atari=False):
+    from jax_baselines.common.atari_wrappers import (
+        get_env_type,
+        make_raw_atari,
+        make_wrap_atari,
+    )
+
+    env_type, env_id = get_env_type(env_name_)
+    if env_type == "atari_env":
+        if raw_atari:
+            env = make_raw_atari(env_name_, clip_rewards=True)
         else:
-            done_obs = None
-        return obs, done_obs, reward, terminated, truncated, done, info
+            # the workers copy the observations into their results before the next step
+            env = make_wrap_atari(env_name_, clip_rewards=True, copy_obs=False)
+    else:
+        env = gym.make(env_name_)
+    return env, env_type, env_id
+
+
+class mpVectorizedGymEnv(VectorizedEnv):
+    def __init__(self, env_id, worker_num=8, render=False, raw_atari=False):
+        """Vectorized environment on multiprocessing subprocesses and shared memory.
+
+        Every worker writes its observation, end state, reward and flags straight into shared
+        NumPy arrays, only the actions and the info dicts go through pipes. The returned arrays are
+        views of the shared memory: ``get_result`` arrays are overwritten by the next ``step`` and
+        ``current_obs`` alternates between two buffers, so it stays valid until the step after next.
+
+        :param env_id: (str) gym or atari environment id
+        :param worker_num: (int) number of environments
+        :param render: (bool) render the first environment
+        :param raw_atari: (bool) Atari envs return raw frames, see make_raw_atari
+        """
+        self.env_id = env_id
+        self.worker_num = worker_num
+        self.batch_size = worker_num
+        self.slot = 0
+        ctx = mp.get_context(
+            "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        )
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(worker_num)])
+        self.processes = [
+            ctx.Process(
+                target=_mp_gym_worker,
+                args=(env_id, work_remote, w, render and w == 0, raw_atari),
+                daemon=True,
+            )
+            for w, work_remote in enumerate(work_remotes)
+        ]
+        for process in self.processes:
+            process.start()
+        for work_remote in work_remotes:
+            work_remote.close()
+
+        self.remotes[0].send(("get_info", None))
+        self.env_info = self.remotes[0].recv()
+        observation_space = self.env_info["observation_space"]
+        specs = {
+            "obs": ((2, worker_num, *observation_space.shape), observation_space.dtype),
+            "end_obs": ((worker_num, *observation_space.shape), observation_space.dtype),
+            "rewards": ((worker_num,), np.float64),
+            "terminateds": ((worker_num,), np.bool_),
+            "truncateds": ((worker_num,), np.bool_),
+        }
+        self.shms = dict(
+            (
+                k,
+                shared_memory.SharedMemory(
+                    create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+                ),
+            )
+            for k, (shape, dtype) in specs.items()
+        )
+        self.arrays = dict(
+            (k, np.ndarray(shape, dtype=dtype, buffer=self.shms[k].buf))
+            for k, (shape, dtype) in specs.items()
+        )
+        shm_info = dict(
+            (k, (self.shms[k].name, shape, dtype)) for k, (shape, dtype) in specs.items()
+        )
+        for remote in self.remotes:
+            remote.send(("reset", (shm_info, self.slot)))
+        self.reset_info = [remote.recv() for remote in self.remotes]
+        self.closed = False
+        atexit.register(self.close)
+
+    def get_info(self):
+        return self.env_info
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(("reset", (None, self.slot)))
+        self.reset_info = [remote.recv() for remote in self.remotes]
+        return self.current_obs(), self.reset_info
+
+    def current_obs(self):
+        return self.arrays["obs"][self.slot]
+
+    def step(self, actions):
+        self.slot = 1 - self.slot
+        for remote, a in zip(self.remotes, actions):
+            remote.send(("step", (a, self.slot)))
+
+    def get_result(self):
+        infos = tuple(remote.recv() for remote in self.remotes)
+        return (
+            self.arrays["end_obs"],
+            self.arrays["rewards"],
+            self.arrays["terminateds"],
+            self.arrays["truncateds"],
+            infos,
+        )
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.arrays.clear()
+        for shm in self.shms.values():
+            shm.close()
+            shm.unlink()
+
+
+def _mp_gym_worker(env_name_, remote, w, render=False, raw_atari=False):
+    env, env_type, env_id = _make_gym_env(env_name_, raw_atari)
+    discrete = not isinstance(env.action_space, spaces.Box)
+    shms = []
+    arrays = {}
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                action, slot = data
+                if render:
+                    env.render()
+                obs, reward, terminated, truncated, info = env.step(
+                    action[0] if discrete else action
+                )
+                # end_obs is the next observation of this step, obs the first one of the next step
+                arrays["end_obs"][w] = obs
+                if terminated or truncated:
+                    obs, _ = env.reset()
+                arrays["obs"][slot, w] = obs
+                arrays["rewards"][w] = reward
+                arrays["terminateds"][w] = terminated
+                arrays["truncateds"][w] = truncated
+                remote.send(info)
+            elif cmd == "reset":
+                # the shared memory is attached by the first reset
+                shm_info, slot = data
+                if shm_info is not None:
+                    for k, (name, shape, dtype) in shm_info.items():
+                        shm = shared_memory.SharedMemory(name=name)
+                        shms.append(shm)
+                        arrays[k] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                obs, info = env.reset()
+                arrays["obs"][slot, w] = obs
+                remote.send(info)
+            elif cmd == "get_info":
+                remote.send(
+                    {
+                        "observation_space": env.observation_space,
+                        "action_space": env.action_space,
+                        "env_type": env_type,
+                        "env_id": env_id,
+                    }
+                )
+            elif cmd == "close":
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        arrays.clear()
+        for shm in shms:
+            shm.close()
+        env.close()
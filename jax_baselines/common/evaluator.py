@@ -0,0 +1,164 @@
+import copy
+import threading
+from collections import deque
+
+import jax
+import numpy as np
+
+from jax_baselines.common.utils import key_gen
+
+
+def vectorized_eval(eval_env, actions, eval_eps):
+    """Runs the evaluation episodes on all envs of a vectorized evaluation env at once.
+
+    Every env runs an even share of the episodes, so short episodes are not over represented in
+    the mean. The rewards, lengths and truncations of these episodes are returned in the same
+    layout as the sequential evaluation. ``original_reward`` is summed per env and recorded when
+    the game is over (``lives == 0``, or at every episode end when the env has no lives), an env
+    keeps running after its share of episodes until its game is over.
+
+    :param eval_env: (VectorizedEnv) synchronous vectorized evaluation env
+    :param actions: (callable) maps the observations of all envs to their actions
+    :param eval_eps: (int) number of evaluation episodes
+    :return: (np.ndarray, np.ndarray, np.ndarray, list) episode rewards, episode lengths,
+        episode truncations and the original rewards of the finished games, None if the env has
+        no original reward
+    """
+    worker_num = eval_env.worker_num
+    quota = np.full(worker_num, eval_eps // worker_num)
+    quota[: eval_eps % worker_num] += 1
+    offsets = np.cumsum(quota) - quota
+
+    total_reward = np.zeros(eval_eps)
+    total_ep_len = np.zeros(eval_eps)
+    total_truncated = np.zeros(eval_eps)
+    original_rewards = []
+
+    obs, infos = eval_env.reset()
+    have_original_reward = "original_reward" in infos[0].keys()
+    have_lives = "lives" in infos[0].keys()
+    original_reward = np.asarray(
+        [info["original_reward"] if have_original_reward else 0.0 for info in infos],
+        dtype=np.float64,
+    )
+    ep_reward = np.zeros(worker_num)
+    ep_len = np.zeros(worker_num)
+    finished = np.zeros(worker_num, dtype=np.int64)
+    active = quota > 0
+
+    while np.any(active):
+        eval_env.step(actions(obs))
+        _, rewards, terminateds, truncateds, infos = eval_env.get_result()
+        obs = eval_env.current_obs()
+        for w in np.where(active)[0]:
+            info = infos[w]
+            if have_original_reward:
+                original_reward[w] += info["original_reward"]
+            ep_reward[w] += rewards[w]
+            ep_len[w] += 1
+            if not (terminateds[w] or truncateds[w]):
+                continue
+            if finished[w] < quota[w]:
+                ep = offsets[w] + finished[w]
+                total_reward[ep] = ep_reward[w]
+                total_ep_len[ep] = ep_len[w]
+                total_truncated[ep] = float(truncateds[w])
+            finished[w] += 1
+            ep_reward[w] = 0
+            ep_len[w] = 0
+            game_over = not have_lives or info["lives"] == 0
+            if have_original_reward and game_over:
+                original_rewards.append(original_reward[w])
+                original_reward[w] = 0
+            if finished[w] >= quota[w] and (game_over or truncateds[w]):
+                active[w] = False
+
+    return (
+        total_reward,
+        total_ep_len,
+        total_truncated,
+        original_rewards if have_original_reward else None,
+    )
+
+
+class AsyncEvaluator(object):
+    def __init__(self, agent, max_backlog=1):
+        """Evaluates snapshots of the agent's parameters on a background thread.
+
+        ``submit`` copies the parameters of the agent to the CPU and returns at once with the
+        result of the latest finished evaluation. The thread runs the agent's own ``eval`` on a
+        shallow copy of the agent which holds the snapshot, so the results are logged to the run
+        at the step of the snapshot while the learner keeps training. At most ``max_backlog``
+        snapshots wait for evaluation, a new snapshot on a full backlog replaces the oldest
+        waiting one, so the learner never waits for the evaluation.
+
+        :param agent: (object) agent with an ``eval(steps)`` method and an ``async_evaluator``
+            attribute
+        :param max_backlog: (int) number of snapshots waiting for evaluation
+        """
+        self.agent = agent
+        self.max_backlog = max_backlog
+        self.cpu = jax.devices("cpu")[0]
+        self.condition = threading.Condition()
+        self.backlog = deque()
+        self.result = None
+        self.error = None
+        self.evaluated = 0
+        self.dropped = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def snapshot(self, steps):
+        shadow = copy.copy(self.agent)
+        for k, v in vars(self.agent).items():
+            if k.endswith("params") and "target" not in k:
+                # a copy, the buffers of the learner can be donated to its next update
+                setattr(shadow, k, jax.tree.map(lambda x: jax.device_put(np.array(x), self.cpu), v))
+        if hasattr(self.agent, "obs_rms"):
+            shadow.obs_rms = copy.deepcopy(self.agent.obs_rms)
+        shadow.key_seq = key_gen(int(steps))
+        shadow.async_evaluator = None
+        shadow.cpu_actor = None
+        return shadow
+
+    def submit(self, steps):
+        if self.error is not None:
+            raise self.error
+        shadow = self.snapshot(steps)
+        with self.condition:
+            if len(self.backlog) >= self.max_backlog:
+                self.backlog.popleft()
+                self.dropped += 1
+            self.backlog.append((steps, shadow))
+            self.condition.notify_all()
+        return self.result
+
+    def close(self):
+        # the waiting snapshots are still evaluated, so the run logs the last parameters
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        print("----------------------eval-----------------------")
+        print(f"async evaluations : {self.evaluated}, dropped snapshots : {self.dropped}")
+        print("-------------------------------------------------")
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while len(self.backlog) == 0 and not self.closed:
+                    self.condition.wait()
+                if len(self.backlog) == 0:
+                    return
+                steps, shadow = self.backlog.popleft()
+            try:
+                result = shadow.eval(steps)
+            except Exception as e:
+                self.error = e
+                return
+            with self.condition:
+                self.result = result
+                self.evaluated += 1
@@ -0,0 +1,120 @@
+import asyncio
+
+import jax
+import numpy as np
+import ray
+
+
+@ray.remote
+class Inference_server(object):
+    def __init__(self, builder, param_channel, max_batch=64) -> None:
+        """Runs the policy of all actors in batched forward passes (SEED style).
+
+        The actors call ``forward`` with their observations instead of running their own copy of
+        the model. Calls that arrive while a batch is running wait together and are run as the
+        next batch, so the batch grows with the number of actors and one compiled model and one
+        copy of the parameters serve all of them. The server reads the parameters the learner
+        publishes to ``param_channel`` when their version changes.
+
+        :param builder: (callable) returns ``(actor, get_abs_td_error, key_seq)``, where
+            ``actor(params, obses, key)`` is the batched policy, ``get_abs_td_error(params,
+            **transitions, key=key)`` the initial priorities of Ape-X (None for IMPALA) and
+            ``key_seq`` the keys of the forward passes
+        :param param_channel: (ParamChannel) channel the learner publishes the parameters to
+        :param max_batch: (int) maximum number of observations in one forward pass
+        """
+        actor, get_abs_td_error, self.key_seq = builder()
+        self.actor = jax.jit(actor)
+        self.get_abs_td_error = None if get_abs_td_error is None else jax.jit(get_abs_td_error)
+        self.param_channel = param_channel
+        self.version, self.params = param_channel.read()
+        self.max_batch = max_batch
+        self.requests = []
+        self.pending = None
+        self.serving = None
+        self.batches = 0
+        self.served = 0
+
+    async def forward(self, obses):
+        """Policy output of one actor, computed in a batch with the other waiting actors.
+
+        :param obses: (list) observations of the actor with a batch dimension of 1
+        :return: the output of ``actor`` for these observations
+        """
+        if self.serving is None:
+            self.pending = asyncio.Event()
+            self.serving = asyncio.get_running_loop().create_task(self._serve())
+        future = asyncio.get_running_loop().create_future()
+        self.requests.append((obses, future))
+        self.pending.set()
+        return await future
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.pending.wait()
+            await asyncio.sleep(0)  # let the calls that already arrived join the batch
+            batch = self.requests[: self.max_batch]
+            self.requests = self.requests[self.max_batch :]
+            if len(self.requests) == 0:
+                self.pending.clear()
+            # padded to a power of two, so the batch sizes compile only log2(max_batch) times
+            size = min(1 << (len(batch) - 1).bit_length(), self.max_batch)
+            obses = [
+                np.concatenate(o + (np.zeros((size - len(o),) + o[0].shape[1:], o[0].dtype),))
+                for o in zip(*[obs for obs, _ in batch])
+            ]
+            try:
+                # the forward pass runs off the event loop, so the next calls keep arriving
+                outputs = await loop.run_in_executor(None, self._forward, obses, next(self.key_seq))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for idx, (_, future) in enumerate(batch):
+                future.set_result(jax.tree.map(lambda x: x[idx : idx + 1], outputs))
+            self.batches += 1
+            self.served += len(batch)
+
+    def _sync_params(self):
+        if self.param_channel.version != self.version:
+            self.version, self.params = self.param_channel.read()
+        return self.params
+
+    def _forward(self, obses, key):
+        return jax.device_get(self.actor(self._sync_params(), obses, key))
+
+    async def priorities(self, transitions):
+        """Initial priorities of the transitions of an Ape-X actor's local buffer."""
+        key = next(self.key_seq)
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: np.asarray(self.get_abs_td_error(self._sync_params(), **transitions, key=key)),
+        )
+
+    async def get_stats(self):
+        return {
+            "batches": self.batches,
+            "served": self.served,
+            "mean_batch": self.served / max(self.batches, 1),
+            "version": self.version,
+        }
+
+
+def remote_inference(inference_server):
+    """Stand ins for the jitted functions of a worker that call the inference server.
+
+    The parameters and keys passed to them are ignored, the server uses its own.
+
+    :param inference_server: (Inference_server) handle of the server
+    :return: (callable, callable) ``actor(params, obses, key)`` and
+        ``get_abs_td_error(params, key, **transitions)``
+    """
+
+    def actor(params, obses, key=None):
+        return ray.get(inference_server.forward.remote(obses))
+
+    def get_abs_td_error(params, key=None, **transitions):
+        return ray.get(inference_server.priorities.remote(transitions))
+
+    return actor, get_abs_td_error
@@ -0,0 +1,266 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import get_transition_nbytes, print_memory_report
+from model_builder.flax.Module import get_obs_dtypes
+
+
+class JaxReplayBuffer(object):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list,
+        action_space=1,
+        seed=0,
+    ):
+        """Replay buffer whose storage is preallocated JAX arrays on the default device.
+
+        The whole buffer is a pytree (``self.state``) carrying the storage, the write position,
+        the stored size and a PRNG key. ``add`` writes rows with ``dynamic_update_slice`` and
+        ``sample_fn``/``update_priorities_fn`` are pure functions of the state, so sampling can be
+        traced into the jitted train step and one step runs as a single compiled call. ``sample``
+        and ``update_priorities`` keep the interface of the cpprb buffers for host side use.
+
+        :param size: (int) buffer size
+        :param observation_space: (list) observation shapes
+        :param action_space: (int or list) action shape
+        :param seed: (int) seed of the carried sampling key
+        """
+        self.max_size = size
+        self.obsdict = dict(
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
+            )
+        )
+        self.nextobsdict = dict(
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
+            )
+        )
+        action_shape = [action_space] if isinstance(action_space, int) else list(action_space)
+        self.env_dict = {
+            **self.obsdict,
+            "action": {"shape": action_shape},
+            "reward": {},
+            **self.nextobsdict,
+            "done": {},
+        }
+        self.stored_size = 0
+        self.state = self.init_state(jax.random.PRNGKey(seed))
+        self._add = jax.jit(self._add, donate_argnums=(0,))
+        self._sample = jax.jit(self.sample_fn, static_argnums=(1,), donate_argnums=(0,))
+        self._update_priorities = jax.jit(self.update_priorities_fn, donate_argnums=(0,))
+
+    def init_state(self, key):
+        # reward and done are stored as [size, 1] like cpprb returns them
+        state = {
+            k: jnp.zeros((self.max_size, *v.get("shape", [1])), dtype=v.get("dtype", jnp.float32))
+            for k, v in self.env_dict.items()
+        }
+        state["pos"] = jnp.zeros((), dtype=jnp.int32)
+        state["size"] = jnp.zeros((), dtype=jnp.int32)
+        state["key"] = key
+        return state
+
+    def __len__(self) -> int:
+        return self.stored_size
+
+    @property
+    def storage(self):
+        return self.state
+
+    @property
+    def buffer_size(self) -> int:
+        return self.max_size
+
+    def can_sample(self, n_samples: int) -> bool:
+        return len(self) >= n_samples
+
+    def is_full(self) -> int:
+        return len(self) == self.max_size
+
+    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False, env_ids=None):
+        # one row per worker, observations always carry the leading worker axis
+        n = np.shape(obs_t[0])[0]
+        transitions = {
+            **dict(
+                (k, np.asarray(o, dtype=v["dtype"]).reshape(n, *v["shape"]))
+                for (k, v), o in zip(self.obsdict.items(), obs_t)
+            ),
+            "action": np.asarray(action, dtype=np.float32).reshape(n, -1),
+            "reward": np.asarray(reward, dtype=np.float32).reshape(n, 1),
+            **dict(
+                (k, np.asarray(no, dtype=v["dtype"]).reshape(n, *v["shape"]))
+                for (k, v), no in zip(self.nextobsdict.items(), nxtobs_t)
+            ),
+            "done": np.asarray(terminated, dtype=np.float32).reshape(n, 1),
+        }
+        self.state = self._add(self.state, transitions)
+        self.stored_size = min(self.stored_size + n, self.max_size)
+
+    def add_fn(self, state, obs_t, action, reward, nxtobs_t, terminated):
+        """Pure version of add on the state, to insert transitions inside jit.
+
+        The host side stored size is not updated, ``sync_size`` reads it back from the state.
+        """
+        n = obs_t[0].shape[0]
+        transitions = {
+            **dict(
+                (k, jnp.reshape(o, (n, *v["shape"])).astype(v["dtype"]))
+                for (k, v), o in zip(self.obsdict.items(), obs_t)
+            ),
+            "action": jnp.reshape(action, (n, -1)).astype(jnp.float32),
+            "reward": jnp.reshape(reward, (n, 1)).astype(jnp.float32),
+            **dict(
+                (k, jnp.reshape(no, (n, *v["shape"])).astype(v["dtype"]))
+                for (k, v), no in zip(self.nextobsdict.items(), nxtobs_t)
+            ),
+            "done": jnp.reshape(terminated, (n, 1)).astype(jnp.float32),
+        }
+        return self._add(state, transitions)
+
+    def sync_size(self):
+        self.stored_size = int(self.state["size"])
+
+    def _add(self, state, transitions):
+        n = transitions["done"].shape[0]
+        pos = state["pos"]
+        idxs = (pos + jnp.arange(n)) % self.max_size
+        # the rows of one add never wrap onto each other, the scatter updates the donated storage
+        state = {**state, **dict((k, state[k].at[idxs].set(v)) for k, v in transitions.items())}
+        state = self._on_add(state, idxs)
+        state["pos"] = (pos + n) % self.max_size
+        state["size"] = jnp.minimum(state["size"] + n, self.max_size)
+        return state
+
+    def _on_add(self, state, idxs):
+        return state
+
+    def _sample_idxs(self, state, key, batch_size, beta):
+        idxs = jax.random.randint(key, (batch_size,), 0, state["size"])
+        return idxs, {}
+
+    def sample_fn(self, state, batch_size: int, beta=0.5):
+        """Samples a batch inside jit, returns the state with the split key and the batch."""
+        key, subkey = jax.random.split(state["key"])
+        state = {**state, "key": key}
+        idxs, extra = self._sample_idxs(state, subkey, batch_size, beta)
+        return state, {
+            "obses": [state[o][idxs] for o in self.obsdict.keys()],
+            "actions": state["action"][idxs],
+            "rewards": state["reward"][idxs],
+            "nxtobses": [state[no][idxs] for no in self.nextobsdict.keys()],
+            "terminateds": state["done"][idxs],
+            **extra,
+        }
+
+    def update_priorities_fn(self, state, indexes, priorities):
+        return state
+
+    def sample(self, batch_size: int, beta=0.5):
+        self.state, data = self._sample(self.state, batch_size, beta)
+        return data
+
+    def update_priorities(self, indexes, priorities):
+        self.state = self._update_priorities(self.state, indexes, priorities)
+
+    def get_buffer(self):
+        return dict((k, np.asarray(self.state[k][: len(self)])) for k in self.env_dict)
+
+    def clear(self):
+        self.stored_size = 0
+        self.state = self.init_state(self.state["key"])
+
+    def memory_report(self):
+        print_memory_report(self.max_size, get_transition_nbytes(self.env_dict))
+
+
+class JaxPrioritizedReplayBuffer(JaxReplayBuffer):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list,
+        alpha: float,
+        action_space=1,
+        eps=1e-4,
+        seed=0,
+    ):
+        """Prioritized version of JaxReplayBuffer.
+
+        Priorities are kept in array based sum and min trees (root at 1, leaves at
+        ``capacity + idx``), stratified sampling descends the sum tree for the whole batch at
+        once and importance weights are normalized by the minimum stored priority, as cpprb does.
+
+        :param alpha: (float) how much prioritization is used
+        :param eps: (float) added to the priorities before they are stored
+        """
+        self.alpha = alpha
+        self.eps = eps
+        self.tree_capacity = 1
+        while self.tree_capacity < size:
+            self.tree_capacity *= 2
+        self.tree_depth = int(np.log2(self.tree_capacity))
+        super().__init__(size, observation_space, action_space, seed)
+
+    def init_state(self, key):
+        state = super().init_state(key)
+        state["sum_tree"] = jnp.zeros((2 * self.tree_capacity,), dtype=jnp.float32)
+        state["min_tree"] = jnp.full((2 * self.tree_capacity,), jnp.inf, dtype=jnp.float32)
+        state["max_priority"] = jnp.ones((), dtype=jnp.float32)
+        return state
+
+    def _set_leaves(self, state, idxs, leaf_values):
+        def propagate(_, carry):
+            sum_tree, min_tree, nodes = carry
+            nodes = nodes // 2
+            sum_tree = sum_tree.at[nodes].set(sum_tree[2 * nodes] + sum_tree[2 * nodes + 1])
+            min_tree = min_tree.at[nodes].set(
+                jnp.minimum(min_tree[2 * nodes], min_tree[2 * nodes + 1])
+            )
+            return sum_tree, min_tree, nodes
+
+        # a loop instead of unrolled levels, so XLA updates the trees in place
+        nodes = idxs + self.tree_capacity
+        sum_tree = state["sum_tree"].at[nodes].set(leaf_values)
+        min_tree = state["min_tree"].at[nodes].set(leaf_values)
+        sum_tree, min_tree, _ = jax.lax.fori_loop(
+            0, self.tree_depth, propagate, (sum_tree, min_tree, nodes)
+        )
+        return {**state, "sum_tree": sum_tree, "min_tree": min_tree}
+
+    def _on_add(self, state, idxs):
+        leaf_values = jnp.full(idxs.shape, state["max_priority"] ** self.alpha)
+        return self._set_leaves(state, idxs, leaf_values)
+
+    def _retrieve(self, sum_tree, values):
+        def descend(_, carry):
+            nodes, values = carry
+            left = 2 * nodes
+            left_sum = sum_tree[left]
+            # never step into an empty right subtree because of float rounding
+            go_right = (values >= left_sum) & (sum_tree[left + 1] > 0)
+            values = jnp.where(go_right, values - left_sum, values)
+            nodes = jnp.where(go_right, left + 1, left)
+            return nodes, values
+
+        nodes = jnp.ones(values.shape, dtype=jnp.int32)
+        nodes, _ = jax.lax.fori_loop(0, self.tree_depth, descend, (nodes, values))
+        return nodes - self.tree_capacity
+
+    def _sample_idxs(self, state, key, batch_size, beta):
+        sum_tree = state["sum_tree"]
+        segment = sum_tree[1] / batch_size
+        values = (jnp.arange(batch_size) + jax.random.uniform(key, (batch_size,))) * segment
+        idxs = self._retrieve(sum_tree, values)
+        leaf_values = sum_tree[idxs + self.tree_capacity]
+        weights = (leaf_values / state["min_tree"][1]) ** (-beta)
+        return idxs, {"weights": weights, "indexes": idxs}
+
+    def update_priorities_fn(self, state, indexes, priorities):
+        priorities = jnp.reshape(priorities, (-1,)) + self.eps
+        state = self._set_leaves(state, indexes, priorities**self.alpha)
+        state["max_priority"] = jnp.maximum(state["max_priority"], jnp.max(priorities))
+        return state
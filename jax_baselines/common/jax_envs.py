@@ -0,0 +1,323 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+from gymnasium import spaces
+
+from jax_baselines.common.env_builer import VectorizedEnv
+
+
+class JaxEnv(object):
+    """Environment written as pure JAX functions of an explicit state.
+
+    ``reset(key)`` returns ``(state, obs)`` and ``step(key, state, action)`` returns
+    ``(state, obs, reward, terminated, truncated)`` for one environment, so both can be jitted,
+    vmapped over environments and scanned over time. Discrete actions are ``[1]`` arrays like the
+    actions of the Q networks, the state carries the step count for the time limit.
+    """
+
+    observation_space = None
+    action_space = None
+    max_episode_steps = None
+
+    def reset(self, key):
+        raise NotImplementedError
+
+    def step(self, key, state, action):
+        raise NotImplementedError
+
+    def time_limit(self, state):
+        state = {**state, "t": state["t"] + 1}
+        return state, state["t"] >= self.max_episode_steps
+
+
+class CartPole(JaxEnv):
+    """CartPole-v1 of gymnasium."""
+
+    max_episode_steps = 500
+
+    def __init__(self):
+        self.gravity = 9.8
+        self.masspole = 0.1
+        self.total_mass = 1.0 + self.masspole
+        self.length = 0.5
+        self.polemass_length = self.masspole * self.length
+        self.force_mag = 10.0
+        self.tau = 0.02
+        self.theta_threshold_radians = 12 * 2 * np.pi / 360
+        self.x_threshold = 2.4
+        high = np.array(
+            [self.x_threshold * 2, np.inf, self.theta_threshold_radians * 2, np.inf],
+            dtype=np.float32,
+        )
+        self.observation_space = spaces.Box(-high, high, dtype=np.float32)
+        self.action_space = spaces.Discrete(2)
+
+    def reset(self, key):
+        s = jax.random.uniform(key, (4,), minval=-0.05, maxval=0.05)
+        return {"s": s, "t": jnp.zeros((), dtype=jnp.int32)}, s
+
+    def step(self, key, state, action):
+        x, x_dot, theta, theta_dot = state["s"]
+        force = jnp.where(action[0] == 1, self.force_mag, -self.force_mag)
+        costheta = jnp.cos(theta)
+        sintheta = jnp.sin(theta)
+        temp = (force + self.polemass_length * theta_dot**2 * sintheta) / self.total_mass
+        thetaacc = (self.gravity * sintheta - costheta * temp) / (
+            self.length * (4.0 / 3.0 - self.masspole * costheta**2 / self.total_mass)
+        )
+        xacc = temp - self.polemass_length * thetaacc * costheta / self.total_mass
+        s = jnp.stack(
+            [
+                x + self.tau * x_dot,
+                x_dot + self.tau * xacc,
+                theta + self.tau * theta_dot,
+                theta_dot + self.tau * thetaacc,
+            ]
+        )
+        terminated = (jnp.abs(s[0]) > self.x_threshold) | (
+            jnp.abs(s[2]) > self.theta_threshold_radians
+        )
+        state, truncated = self.time_limit({**state, "s": s})
+        return state, s, jnp.ones(()), terminated, truncated
+
+
+class Acrobot(JaxEnv):
+    """Acrobot-v1 of gymnasium, book dynamics integrated with one rk4 step."""
+
+    max_episode_steps = 500
+
+    def __init__(self):
+        self.dt = 0.2
+        self.link_length_1 = 1.0
+        self.link_mass_1 = 1.0
+        self.link_mass_2 = 1.0
+        self.link_com_pos_1 = 0.5
+        self.link_com_pos_2 = 0.5
+        self.link_moi = 1.0
+        self.max_vel_1 = 4 * np.pi
+        self.max_vel_2 = 9 * np.pi
+        self.avail_torque = jnp.array([-1.0, 0.0, 1.0])
+        high = np.array([1.0, 1.0, 1.0, 1.0, self.max_vel_1, self.max_vel_2], dtype=np.float32)
+        self.observation_space = spaces.Box(-high, high, dtype=np.float32)
+        self.action_space = spaces.Discrete(3)
+
+    def get_obs(self, s):
+        return jnp.stack([jnp.cos(s[0]), jnp.sin(s[0]), jnp.cos(s[1]), jnp.sin(s[1]), s[2], s[3]])
+
+    def reset(self, key):
+        s = jax.random.uniform(key, (4,), minval=-0.1, maxval=0.1)
+        return {"s": s, "t": jnp.zeros((), dtype=jnp.int32)}, self.get_obs(s)
+
+    def dsdt(self, s, a):
+        m1, m2 = self.link_mass_1, self.link_mass_2
+        l1 = self.link_length_1
+        lc1, lc2 = self.link_com_pos_1, self.link_com_pos_2
+        i1 = i2 = self.link_moi
+        g = 9.8
+        theta1, theta2, dtheta1, dtheta2 = s
+        d1 = m1 * lc1**2 + m2 * (l1**2 + lc2**2 + 2 * l1 * lc2 * jnp.cos(theta2)) + i1 + i2
+        d2 = m2 * (lc2**2 + l1 * lc2 * jnp.cos(theta2)) + i2
+        phi2 = m2 * lc2 * g * jnp.cos(theta1 + theta2 - np.pi / 2.0)
+        phi1 = (
+            -m2 * l1 * lc2 * dtheta2**2 * jnp.sin(theta2)
+            - 2 * m2 * l1 * lc2 * dtheta2 * dtheta1 * jnp.sin(theta2)
+            + (m1 * lc1 + m2 * l1) * g * jnp.cos(theta1 - np.pi / 2)
+            + phi2
+        )
+        ddtheta2 = (a + d2 / d1 * phi1 - m2 * l1 * lc2 * dtheta1**2 * jnp.sin(theta2) - phi2) / (
+            m2 * lc2**2 + i2 - d2**2 / d1
+        )
+        ddtheta1 = -(d2 * ddtheta2 + phi1) / d1
+        return jnp.stack([dtheta1, dtheta2, ddtheta1, ddtheta2])
+
+    def step(self, key, state, action):
+        s = state["s"]
+        torque = self.avail_torque[action[0]]
+        k1 = self.dsdt(s, torque)
+        k2 = self.dsdt(s + self.dt / 2.0 * k1, torque)
+        k3 = self.dsdt(s + self.dt / 2.0 * k2, torque)
+        k4 = self.dsdt(s + self.dt * k3, torque)
+        s = s + self.dt / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+        s = jnp.stack(
+            [
+                (s[0] + np.pi) % (2 * np.pi) - np.pi,
+                (s[1] + np.pi) % (2 * np.pi) - np.pi,
+                jnp.clip(s[2], -self.max_vel_1, self.max_vel_1),
+                jnp.clip(s[3], -self.max_vel_2, self.max_vel_2),
+            ]
+        )
+        terminated = -jnp.cos(s[0]) - jnp.cos(s[1] + s[0]) > 1.0
+        state, truncated = self.time_limit({**state, "s": s})
+        return state, self.get_obs(s), jnp.where(terminated, 0.0, -1.0), terminated, truncated
+
+
+class Pendulum(JaxEnv):
+    """Pendulum-v1 of gymnasium."""
+
+    max_episode_steps = 200
+
+    def __init__(self):
+        self.max_speed = 8.0
+        self.max_torque = 2.0
+        self.dt = 0.05
+        self.g = 10.0
+        self.m = 1.0
+        self.length = 1.0
+        high = np.array([1.0, 1.0, self.max_speed], dtype=np.float32)
+        self.observation_space = spaces.Box(-high, high, dtype=np.float32)
+        self.action_space = spaces.Box(-self.max_torque, self.max_torque, (1,), dtype=np.float32)
+
+    def get_obs(self, s):
+        return jnp.stack([jnp.cos(s[0]), jnp.sin(s[0]), s[1]])
+
+    def reset(self, key):
+        s = jax.random.uniform(key, (2,), minval=-1.0, maxval=1.0) * jnp.array([np.pi, 1.0])
+        return {"s": s, "t": jnp.zeros((), dtype=jnp.int32)}, self.get_obs(s)
+
+    def step(self, key, state, action):
+        th, thdot = state["s"]
+        u = jnp.clip(action[0], -self.max_torque, self.max_torque)
+        angle = (th + np.pi) % (2 * np.pi) - np.pi
+        costs = angle**2 + 0.1 * thdot**2 + 0.001 * u**2
+        thdot = (
+            thdot
+            + (3 * self.g / (2 * self.length) * jnp.sin(th) + 3.0 / (self.m * self.length**2) * u)
+            * self.dt
+        )
+        thdot = jnp.clip(thdot, -self.max_speed, self.max_speed)
+        s = jnp.stack([th + thdot * self.dt, thdot])
+        state, truncated = self.time_limit({**state, "s": s})
+        return state, self.get_obs(s), -costs, jnp.zeros((), dtype=jnp.bool_), truncated
+
+
+class MountainCar(JaxEnv):
+    """MountainCar-v0 of gymnasium."""
+
+    max_episode_steps = 200
+
+    def __init__(self):
+        self.min_position = -1.2
+        self.max_position = 0.6
+        self.max_speed = 0.07
+        self.goal_position = 0.5
+        self.goal_velocity = 0.0
+        self.force = 0.001
+        self.gravity = 0.0025
+        self.observation_space = spaces.Box(
+            np.array([self.min_position, -self.max_speed], dtype=np.float32),
+            np.array([self.max_position, self.max_speed], dtype=np.float32),
+            dtype=np.float32,
+        )
+        self.action_space = spaces.Discrete(3)
+
+    def reset(self, key):
+        s = jnp.stack([jax.random.uniform(key, minval=-0.6, maxval=-0.4), 0.0])
+        return {"s": s, "t": jnp.zeros((), dtype=jnp.int32)}, s
+
+    def step(self, key, state, action):
+        position, velocity = state["s"]
+        velocity = velocity + (action[0] - 1) * self.force - jnp.cos(3 * position) * self.gravity
+        velocity = jnp.clip(velocity, -self.max_speed, self.max_speed)
+        position = jnp.clip(position + velocity, self.min_position, self.max_position)
+        velocity = jnp.where((position == self.min_position) & (velocity < 0), 0.0, velocity)
+        s = jnp.stack([position, velocity])
+        terminated = (position >= self.goal_position) & (velocity >= self.goal_velocity)
+        state, truncated = self.time_limit({**state, "s": s})
+        return state, s, -jnp.ones(()), terminated, truncated
+
+
+jax_envs = {
+    "CartPole-v1": CartPole,
+    "Acrobot-v1": Acrobot,
+    "Pendulum-v1": Pendulum,
+    "MountainCar-v0": MountainCar,
+}
+
+
+def make_jax_env(env_id):
+    assert env_id in jax_envs, f"no jax implementation of {env_id}, one of {list(jax_envs)}"
+    return jax_envs[env_id]()
+
+
+class JaxVectorizedEnv(VectorizedEnv):
+    def __init__(self, env_id, worker_num=8, seed=0):
+        """Vectorized environment of a JaxEnv, all environments are stepped by one vmapped call.
+
+        ``step_fn`` is the pure, vmapped step with automatic reset which the learners scan inside
+        their own jitted loop. current_obs/step/get_result step it from Python like the other
+        vectorized environments.
+
+        :param env_id: (str) id of a JaxEnv, one of jax_envs
+        :param worker_num: (int) number of environments
+        :param seed: (int) seed of the environment keys
+        """
+        self.env_id = env_id
+        self.worker_num = worker_num
+        self.batch_size = worker_num
+        self.env = make_jax_env(env_id)
+        self.env_info = {
+            "observation_space": self.env.observation_space,
+            "action_space": self.env.action_space,
+            "env_type": "jax_env",
+            "env_id": env_id,
+        }
+        self.discrete = isinstance(self.env.action_space, spaces.Discrete)
+        self.key = jax.random.PRNGKey(seed)
+        self._reset = jax.jit(self.reset_fn)
+        self._step = jax.jit(self.step_fn)
+        self.key, reset_key = jax.random.split(self.key)
+        self.state, self.obs = self._reset(reset_key)
+
+    def reset_fn(self, key):
+        return jax.vmap(self.env.reset)(jax.random.split(key, self.worker_num))
+
+    def _auto_reset_step(self, key, state, action):
+        step_key, reset_key = jax.random.split(key)
+        state, obs, reward, terminated, truncated = self.env.step(step_key, state, action)
+        reset_state, reset_obs = self.env.reset(reset_key)
+        done = terminated | truncated
+        state = jax.tree_util.tree_map(lambda r, s: jnp.where(done, r, s), reset_state, state)
+        return state, jnp.where(done, reset_obs, obs), obs, reward, terminated, truncated
+
+    def step_fn(self, key, state, actions):
+        """Steps all environments and resets the ones which ended.
+
+        :return: the env state, the observations to act on, the next observations of the stepped
+            transitions (the last observation of the ended episodes), rewards, terminateds and
+            truncateds, all with a leading worker axis
+        """
+        if self.discrete:
+            actions = jnp.reshape(actions, (self.worker_num, 1)).astype(jnp.int32)
+        return jax.vmap(self._auto_reset_step)(
+            jax.random.split(key, self.worker_num), state, actions
+        )
+
+    def get_info(self):
+        return self.env_info
+
+    def reset(self):
+        self.key, reset_key = jax.random.split(self.key)
+        self.state, self.obs = self._reset(reset_key)
+        return np.asarray(self.obs), [{} for _ in range(self.worker_num)]
+
+    def current_obs(self):
+        return np.asarray(self.obs)
+
+    def step(self, actions):
+        self.actions = actions
+
+    def get_result(self):
+        self.key, step_key = jax.random.split(self.key)
+        self.state, self.obs, next_obs, rewards, terminateds, truncateds = self._step(
+            step_key, self.state, jnp.asarray(self.actions)
+        )
+        return (
+            np.asarray(next_obs),
+            np.asarray(rewards),
+            np.asarray(terminateds),
+            np.asarray(truncateds),
+            [{} for _ in range(self.worker_num)],
+        )
+
+    def close(self):
+        pass
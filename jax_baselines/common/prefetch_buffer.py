@@ -0,0 +1,238 @@
+import queue
+import threading
+import time
+
+import jax
+import numpy as np
+
+
+class PrefetchReplayBuffer(object):
+    def __init__(self, replay_buffer, batch_size: int, beta=None, queue_size=2):
+        """Samples batches of a replay buffer on a background thread and puts them on the device.
+
+        While the learner runs train step N, the sampler thread draws and ``jax.device_put``s the
+        next batches, so sampling and the host to device copy are hidden behind the train step.
+        All other attributes are forwarded to the wrapped buffer.
+
+        Priority updates are handed to the sampler thread and applied before its next sample. A
+        batch waits in the queue after it is sampled, so it can miss the priority updates of at
+        most ``queue_size + 1`` previous train steps. ``queue_size=1`` keeps this staleness
+        smallest, larger queues only help when the sampling time varies a lot.
+
+        :param replay_buffer: (ReplayBuffer) buffer to sample from
+        :param batch_size: (int) batch size of every sample
+        :param beta: (float) importance sampling exponent, None for non prioritized buffers
+        :param queue_size: (int) number of batches sampled ahead
+        """
+        self.replay_buffer = replay_buffer
+        self.batch_size = batch_size
+        self.beta = beta
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.pending_priorities = []
+        self.thread = None
+        self.running = False
+        self.error = None
+
+    def __getattr__(self, name):
+        return getattr(self.replay_buffer, name)
+
+    def __len__(self) -> int:
+        return len(self.replay_buffer)
+
+    def add(self, *args, **kwargs):
+        with self.lock:
+            self.replay_buffer.add(*args, **kwargs)
+
+    def episode_end(self):
+        with self.lock:
+            self.replay_buffer.episode_end()
+
+    def sample(self, batch_size: int = None, beta=None):
+        assert batch_size in (None, self.batch_size), "batch_size is fixed by the sampler thread"
+        assert beta in (None, self.beta), "beta is fixed by the sampler thread"
+        if self.thread is None:
+            self.start()
+        return self._get_batch()
+
+    def update_priorities(self, indexes, priorities):
+        with self.lock:
+            self.pending_priorities.append((indexes, priorities))
+
+    def start(self):
+        self.running = True
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            while self.thread.is_alive():
+                try:
+                    self.batches.get_nowait()
+                except queue.Empty:
+                    pass
+                self.thread.join(timeout=0.1)
+            self.thread = None
+            # a later start samples fresh batches
+            while not self.batches.empty():
+                self.batches.get_nowait()
+
+    def _get_batch(self):
+        # polls, so an error of the sampler thread is raised instead of waiting forever
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                return self.batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _put(self, items, item):
+        # returns False instead of blocking when a thread failed or the buffer is closed
+        while self.error is None and self.running:
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            while self.running:
+                with self.lock:
+                    pending, self.pending_priorities = self.pending_priorities, []
+                # waits for the train steps which computed the priorities, outside of the lock
+                pending = [(np.asarray(i), np.asarray(p)) for i, p in pending]
+                with self.lock:
+                    for indexes, priorities in pending:
+                        self.replay_buffer.update_priorities(indexes, priorities)
+                    if self.beta is None:
+                        data = self.replay_buffer.sample(self.batch_size)
+                    else:
+                        data = self.replay_buffer.sample(self.batch_size, self.beta)
+                indexes = data.pop("indexes", None)
+                data = jax.device_put(data)
+                if indexes is not None:
+                    data["indexes"] = indexes
+                self._put(self.batches, data)
+        except Exception as e:
+            self.error = e
+
+
+class PipelinedReplayBuffer(PrefetchReplayBuffer):
+    def __init__(self, replay_buffer, batch_size: int, beta=None, queue_size=4):
+        """Pipelines the learner of a shared replay buffer (Ape-X) into three threads.
+
+        A sampler thread keeps up to ``queue_size`` batches sampled and on the device, a priority
+        thread applies up to ``queue_size`` pending priority updates and the learner only runs
+        the train steps on the ready batches. Unlike ``PrefetchReplayBuffer`` the sampling does
+        not wait for the priority updates, the shared buffer takes both from different threads.
+        ``stats`` reports the mean queue depths and the fraction of the time the learner waited
+        for a batch or a free priority slot since the last call, and the total sampled batches and
+        applied priority updates. An error of either thread is raised on the learner thread.
+
+        :param replay_buffer: (MultiPrioritizedReplayBuffer) shared buffer the workers add to
+        :param batch_size: (int) batch size of every sample
+        :param beta: (float) importance sampling exponent, None for non prioritized buffers
+        :param queue_size: (int) number of batches sampled ahead
+        """
+        super().__init__(replay_buffer, batch_size, beta, queue_size)
+        self.priorities = queue.Queue(maxsize=queue_size)
+        self.priority_thread = None
+        self.samples = 0
+        self.updates = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.window_start = time.perf_counter()
+        self.window_wait = 0.0
+        self.window_samples = 0
+        self.batch_depth = 0
+        self.priority_depth = 0
+
+    def stats(self):
+        window = time.perf_counter() - self.window_start
+        samples = max(self.window_samples, 1)
+        stats = {
+            "pipeline/batch_queue": self.batch_depth / samples,
+            "pipeline/priority_queue": self.priority_depth / samples,
+            "pipeline/wait_fraction": self.window_wait / max(window, 1e-9),
+            "pipeline/sampled_batches": self.samples,
+            "pipeline/priority_updates": self.updates,
+        }
+        self.reset_stats()
+        return stats
+
+    def sample(self, batch_size: int = None, beta=None):
+        assert batch_size in (None, self.batch_size), "batch_size is fixed by the sampler thread"
+        assert beta in (None, self.beta), "beta is fixed by the sampler thread"
+        if self.error is not None:
+            raise self.error
+        if self.thread is None:
+            self.start()
+        self.batch_depth += self.batches.qsize()
+        self.priority_depth += self.priorities.qsize()
+        start = time.perf_counter()
+        data = self._get_batch()
+        self.window_wait += time.perf_counter() - start
+        self.window_samples += 1
+        self.samples += 1
+        return data
+
+    def update_priorities(self, indexes, priorities):
+        # bounded, so the priorities lag the train steps by at most queue_size updates
+        start = time.perf_counter()
+        if not self._put(self.priorities, (indexes, priorities)) and self.error is not None:
+            raise self.error
+        self.window_wait += time.perf_counter() - start
+
+    def start(self):
+        super().start()
+        self.priority_thread = threading.Thread(target=self._run_priorities, daemon=True)
+        self.priority_thread.start()
+
+    def close(self):
+        super().close()
+        if self.priority_thread is not None:
+            # the updates of the last train steps are still applied, unless the thread failed
+            while self.priority_thread.is_alive():
+                try:
+                    self.priorities.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            self.priority_thread.join()
+            self.priority_thread = None
+
+    def _run(self):
+        try:
+            while self.running:
+                if self.beta is None:
+                    data = self.replay_buffer.sample(self.batch_size)
+                else:
+                    data = self.replay_buffer.sample(self.batch_size, self.beta)
+                indexes = data.pop("indexes", None)
+                data = jax.device_put(data)
+                if indexes is not None:
+                    data["indexes"] = indexes
+                self._put(self.batches, data)
+        except Exception as e:
+            self.error = e
+
+    def _run_priorities(self):
+        while True:
+            update = self.priorities.get()
+            if update is None:
+                return
+            indexes, priorities = update
+            try:
+                # waits for the train step which computed the priorities, not the learner
+                self.replay_buffer.update_priorities(np.asarray(indexes), np.asarray(priorities))
+            except Exception as e:
+                self.error = e
+                return
+            self.updates += 1
@@ -0,0 +1,215 @@
+import os
+
+import numpy as np
+import ray
+
+from jax_baselines.common.cpprb_buffers import get_transition_nbytes, print_memory_report
+from jax_baselines.common.segment_tree import MinSegmentTree, SumSegmentTree
+from model_builder.flax.Module import get_obs_dtypes
+
+
+@ray.remote
+class Replay_shard(object):
+    def __init__(self, size, env_dict, alpha, eps) -> None:
+        """One shard of the sharded prioritized replay, owned by its own process.
+
+        :param size: (int) transitions stored in this shard
+        :param env_dict: (dict) cpprb style layout of a transition
+        :param alpha: (float) how much prioritization is used
+        :param eps: (float) added to the priorities so no transition has zero probability
+        """
+        self.size = size
+        self.alpha = alpha
+        self.eps = eps
+        self.storage = {}
+        for k, v in env_dict.items():
+            shape = v.get("shape", 1)
+            shape = (shape,) if isinstance(shape, int) else tuple(shape)
+            self.storage[k] = np.zeros((size,) + shape, dtype=v.get("dtype", np.float32))
+        capacity = 1 << (size - 1).bit_length()
+        self.sum_tree = SumSegmentTree(capacity)
+        self.min_tree = MinSegmentTree(capacity)
+        self.next_idx = 0
+        self.stored = 0
+
+    def add(self, transitions, priorities):
+        priorities = np.asarray(priorities, dtype=np.float64).reshape(-1)
+        idxs = (self.next_idx + np.arange(len(priorities))) % self.size
+        for k, v in self.storage.items():
+            v[idxs] = np.reshape(transitions[k], (len(priorities),) + v.shape[1:])
+        self.update_priorities(idxs, priorities)
+        self.next_idx = (self.next_idx + len(priorities)) % self.size
+        self.stored = min(self.stored + len(priorities), self.size)
+
+    def sample(self, batch_size):
+        """Samples proportionally to the priorities of this shard.
+
+        :return: (dict, np.ndarray, np.ndarray, tuple) transitions, their indexes in the shard,
+            their probabilities in the shard and the stats of the shard
+        """
+        total = self.sum_tree.sum(0, self.stored)
+        # one sample from each of batch_size equal segments of the priority mass
+        mass = (np.random.random(batch_size) + np.arange(batch_size)) * (total / batch_size)
+        idxs = np.minimum(self.sum_tree.find_prefixsum_idx(mass), self.stored - 1)
+        probs = self.sum_tree[idxs] / total
+        return {k: v[idxs] for k, v in self.storage.items()}, idxs, probs, self.stats()
+
+    def update_priorities(self, idxs, priorities):
+        priorities = (np.abs(priorities) + self.eps) ** self.alpha
+        self.sum_tree[idxs] = priorities
+        self.min_tree[idxs] = priorities
+
+    def stats(self):
+        if self.stored == 0:
+            return 0, 0.0, 0.0
+        return self.stored, self.sum_tree.sum(0, self.stored), self.min_tree.min(0, self.stored)
+
+
+class ShardWriter(object):
+    def __init__(self, shards, max_inflight=2) -> None:
+        """The handle of a worker to the shards, which adds each flush of its local buffer to one
+        shard selected by a hash of the worker and the flush.
+
+        :param shards: (list) Replay_shard handles
+        :param max_inflight: (int) adds of this worker not yet stored before it waits
+        """
+        self.shards = shards
+        self.max_inflight = max_inflight
+        self.inflight = []
+        self.flushes = 0
+
+    def add(self, priorities, **transitions):
+        shard = hash((os.getpid(), self.flushes)) % len(self.shards)
+        self.flushes += 1
+        self.inflight.append(self.shards[shard].add.remote(transitions, np.asarray(priorities)))
+        if len(self.inflight) > self.max_inflight:
+            # back pressure, a worker can not run ahead of the shards
+            _, self.inflight = ray.wait(self.inflight, num_returns=1)
+
+
+class ShardedPrioritizedReplayBuffer(object):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list,
+        alpha: float,
+        action_space=1,
+        n_step=1,
+        gamma=0.99,
+        shards=4,
+        compress_memory=False,
+        eps=1e-4,
+    ):
+        """Prioritized replay split into independent shards, each owned by its own process.
+
+        A drop in for ``MultiPrioritizedReplayBuffer``: the workers add to the shards through the
+        ``ShardWriter`` of ``buffer_info`` and the learner samples and updates the priorities
+        through this object, so the adds of the workers and the sampling of the learner do not
+        contend on one lock. A batch is split over the shards in proportion to their total
+        priority and each shard samples its part proportionally, so every transition is sampled
+        with its global probability. The importance weights are computed from these global
+        probabilities. The indexes of a batch are ``shard * shard_size + index in the shard``, so
+        ``update_priorities`` routes them back to their shards.
+
+        :param size: (int) transitions stored in all shards
+        :param observation_space: (list) observation shapes
+        :param alpha: (float) how much prioritization is used
+        :param action_space: (int) action shape
+        :param n_step: (int) n step return of the workers
+        :param gamma: (float) discount of the n step return
+        :param shards: (int) number of shards
+        :param compress_memory: (bool) not supported, the flushes of many workers can not be
+            compressed
+        :param eps: (float) added to the priorities so no transition has zero probability
+        """
+        assert not compress_memory, "compress_memory is not supported by the Ape-X replay buffer"
+        self.max_size = size
+        self.obsdict = dict(
+            ("obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
+            )
+        )
+        self.nextobsdict = dict(
+            ("next_obs{}".format(idx), {"shape": o, "dtype": dtype})
+            for idx, (o, dtype) in enumerate(
+                zip(observation_space, get_obs_dtypes(observation_space))
+            )
+        )
+        self.env_dict = {
+            **self.obsdict,
+            "action": {"shape": action_space},
+            "reward": {},
+            **self.nextobsdict,
+            "done": {},
+        }
+
+        self.n_s = None
+        if n_step > 1:
+            self.n_s = {
+                "size": n_step,
+                "rew": "reward",
+                "gamma": gamma,
+                "next": list(self.nextobsdict.keys()),
+            }
+
+        self.shard_size = size // shards
+        self.shards = [
+            Replay_shard.remote(self.shard_size, self.env_dict, alpha, eps) for _ in range(shards)
+        ]
+        self.shard_stats = ray.get([s.stats.remote() for s in self.shards])
+
+    def __len__(self):
+        self.shard_stats = ray.get([s.stats.remote() for s in self.shards])
+        return sum(stored for stored, _, _ in self.shard_stats)
+
+    def buffer_info(self):
+        return ShardWriter(self.shards), self.env_dict, self.n_s
+
+    def sample(self, batch_size: int, beta=0.5):
+        # the split of the batch uses the totals of the last sample, the probabilities below are
+        # those of this split, so the weights stay exact while the shards grow
+        totals = np.asarray([total for _, total, _ in self.shard_stats])
+        shard_probs = totals / totals.sum()
+        counts = np.random.multinomial(batch_size, shard_probs)
+        jobs = [
+            (idx, self.shards[idx].sample.remote(int(count)))
+            for idx, count in enumerate(counts)
+            if count > 0
+        ]
+        results = ray.get([job for _, job in jobs])
+        transitions, indexes, probs = [], [], []
+        for (idx, _), (data, shard_idxs, shard_probs_in, stats) in zip(jobs, results):
+            transitions.append(data)
+            indexes.append(idx * self.shard_size + shard_idxs)
+            probs.append(shard_probs[idx] * shard_probs_in)
+            self.shard_stats[idx] = stats
+        smpl = {k: np.concatenate([t[k] for t in transitions]) for k in self.env_dict.keys()}
+        probs = np.concatenate(probs)
+        min_prob = min(
+            shard_probs[idx] * min_priority / total
+            for idx, (_, total, min_priority) in enumerate(self.shard_stats)
+            if shard_probs[idx] > 0
+        )
+        weights = (probs / min_prob) ** (-beta)
+        return {
+            "obses": [smpl[o] for o in self.obsdict.keys()],
+            "actions": smpl["action"],
+            "rewards": smpl["reward"],
+            "nxtobses": [smpl[no] for no in self.nextobsdict.keys()],
+            "terminateds": smpl["done"],
+            "weights": weights.astype(np.float32),
+            "indexes": np.concatenate(indexes),
+        }
+
+    def update_priorities(self, indexes, priorities):
+        indexes = np.asarray(indexes)
+        priorities = np.asarray(priorities).reshape(-1)
+        shard = indexes // self.shard_size
+        for idx in np.unique(shard):
+            self.shards[idx].update_priorities.remote(
+                indexes[shard == idx] - idx * self.shard_size, priorities[shard == idx]
+            )
+
+    def memory_report(self):
+        print_memory_report(self.max_size, get_transition_nbytes(self.env_dict))
@@ -8,6 +8,8 @@ import jax.numpy as jnp
 import numpy as np
 import optax
 
+from model_builder.flax.Module import get_obs_dtypes
+
 cpu_jit = partial(jax.jit, backend="cpu")
 gpu_jit = partial(jax.jit, backend="gpu")
 
@@ -145,6 +147,54 @@ def soft_update(new_tensors: PyTree, old_tensors: PyTree, tau: float):
     )
 
 
+def scan_train_step(train_step: Callable, carry_map: dict, step_arg=None, key_arg=None):
+    """Fuses the gradient steps of a single step train function into one lax.scan.
+
+    :param train_step: (Callable) train_step(*args, **batch) of one gradient step
+    :param carry_map: (dict) argument index -> index of the output replacing it in the next step
+    :param step_arg: (int) index of the step counter argument, increased by one every step
+    :param key_arg: (int) index of the PRNG key argument, split every step (a None key stays None)
+    :return: (Callable) f(*args, **batches) where every batch leaf has a leading gradient step axis.
+        Carried outputs are the ones of the last step, all other outputs are stacked over the steps.
+    """
+    carried_outputs = set(carry_map.values())
+
+    def scanned(*args, **batches):
+        n_outputs = []
+
+        def body(carry, batch):
+            args, key = carry
+            args = list(args)
+            if key is not None:
+                key, args[key_arg] = jax.random.split(key)
+            outputs = train_step(*args, **batch)
+            n_outputs.append(len(outputs))
+            for a, o in carry_map.items():
+                args[a] = outputs[o]
+            if step_arg is not None:
+                args[step_arg] = args[step_arg] + 1
+            stacked = tuple(x for i, x in enumerate(outputs) if i not in carried_outputs)
+            return (tuple(args), key), stacked
+
+        args = list(args)
+        if step_arg is not None:
+            args[step_arg] = jnp.asarray(args[step_arg], dtype=jnp.int32)
+        key = args[key_arg] if key_arg is not None else None
+        (args, _), stacked = jax.lax.scan(body, (tuple(args), key), batches)
+        carried = dict((o, args[a]) for a, o in carry_map.items())
+        stacked = iter(stacked)
+        return tuple(
+            carried[i] if i in carried_outputs else next(stacked) for i in range(n_outputs[0])
+        )
+
+    return scanned
+
+
+def split_batch(data: PyTree, n: int):
+    """Reshapes every leaf of a sampled batch from [n * batch_size, ...] to [n, batch_size, ...]."""
+    return jax.tree_util.tree_map(lambda x: x.reshape(n, -1, *x.shape[1:]), data)
+
+
 def truncated_mixture(quantiles, cut):
     """Concatenates and sorts quantile values, then truncates the highest values.
 
@@ -168,7 +218,13 @@ def convert_states(obs: list):
 
 
 def convert_jax(obs: list):
-    return [jax.device_get(o).astype(jnp.float32) for o in obs]
+    # the observations move to the device in the dtype PreProcess declares for them, the images
+    # stay uint8 and PreProcess casts and scales them on the device
+    obs_dtypes = get_obs_dtypes([o.shape[1:] for o in obs])
+    return [
+        jnp.asarray(o) if dtype == jnp.uint8 else jnp.asarray(o, dtype=dtype)
+        for o, dtype in zip(obs, obs_dtypes)
+    ]
 
 
 def q_log_pi(q, entropy_tau):
@@ -155,11 +155,18 @@ def visual_embedding(mode: str = "normal", flatten=True) -> Callable[[jnp.ndarra
     return net
 
 
+def get_obs_dtypes(states_size: List[Tuple[int, ...]]) -> list:
+    # the dtype every observation is stored and moved to the device in, images stay uint8 until
+    # PreProcess casts and scales them on the device
+    return [jnp.uint8 if len(st) >= 3 else jnp.float32 for st in states_size]
+
+
 class PreProcess(nn.Module):
     states_size: List[Tuple[int, ...]]
     embedding_mode: str = "normal"
     flatten: bool = True
     pre_postprocess: Callable = lambda x: x  # Identity function
+    image_scale: float = 1.0 / 255.0
 
     def setup(self):
         self.embedding = [
@@ -169,10 +176,18 @@ class PreProcess(nn.Module):
 
     @nn.compact
     def __call__(self, obses: List[jnp.ndarray]) -> jnp.ndarray:
+        obses = [
+            x.astype(jnp.float32) * self.image_scale if len(st) == 3 else x.astype(jnp.float32)
+            for x, st in zip(obses, self.states_size)
+        ]
         return self.pre_postprocess(
             jnp.concatenate([pre(x) for pre, x in zip(self.embedding, obses)], axis=1)
         )
 
+    @property
+    def obs_dtypes(self):
+        return get_obs_dtypes(self.states_size)
+
     @property
     def output_size(self):
         return sum(
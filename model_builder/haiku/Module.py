@@ -4,6 +4,8 @@ import haiku as hk
 import jax
 import jax.numpy as jnp
 
+from model_builder.flax.Module import get_obs_dtypes
+
 
 def visual_embedding(mode="simple"):
     if mode == "normal":
@@ -83,11 +85,19 @@ def visual_embedding(mode="simple"):
 
 
 class PreProcess(hk.Module):
-    def __init__(self, state_size, embedding_mode="normal"):
+    def __init__(self, state_size, embedding_mode="normal", image_scale=1.0 / 255.0):
         super().__init__()
+        self.state_size = state_size
+        self.image_scale = image_scale
+        self.obs_dtypes = get_obs_dtypes(state_size)
         self.embedding = [
             visual_embedding(embedding_mode) if len(st) == 3 else lambda x: x for st in state_size
         ]
 
     def __call__(self, obses: List[jnp.ndarray]) -> jnp.ndarray:
+        # the images arrive as uint8, the cast and scale run on the device
+        obses = [
+            x.astype(jnp.float32) * self.image_scale if len(st) == 3 else x.astype(jnp.float32)
+            for x, st in zip(obses, self.state_size)
+        ]
         return jnp.concatenate([pre(x) for pre, x in zip(self.embedding, obses)], axis=1)
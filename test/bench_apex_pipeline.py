@@ -0,0 +1,116 @@
+import argparse
+import base64
+import multiprocessing as mp
+import time
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+import ray
+
+from jax_baselines.common.cpprb_buffers import MultiPrioritizedReplayBuffer
+from jax_baselines.common.prefetch_buffer import PipelinedReplayBuffer
+
+
+@ray.remote(num_cpus=1)
+class Bench_Writer(object):
+    encoded = base64.b64encode(mp.current_process().authkey)
+
+    def __init__(self) -> None:
+        mp.current_process().authkey = base64.b64decode(self.encoded)
+
+    def run(self, buffer_info, local_size, stop):
+        # the flushes of an Ape-X worker's local buffer, without the env
+        gloabal_buffer, env_dict, _ = buffer_info
+        transition = {
+            k: np.random.random((local_size,) + tuple(np.atleast_1d(v.get("shape", 1)))).astype(
+                v.get("dtype", np.float32)
+            )
+            for k, v in env_dict.items()
+        }
+        while not stop.is_set():
+            gloabal_buffer.add(**transition, priorities=np.random.random(local_size))
+            time.sleep(0.01)  # the env steps of a flush
+
+
+def make_train_step(obs_size, node):
+    # a q network sized train step which returns new priorities, like the Ape-X train steps
+    key1, key2 = jax.random.split(jax.random.PRNGKey(0))
+    params = {
+        "w1": jax.random.normal(key1, (obs_size, node)) * 0.01,
+        "w2": jax.random.normal(key2, (node, 1)) * 0.01,
+    }
+
+    def loss(params, obses, rewards, weights):
+        q = jnp.tanh(obses @ params["w1"]) @ params["w2"]
+        td = q - rewards
+        return jnp.mean(weights[:, None] * jnp.square(td)), jnp.abs(td)[:, 0]
+
+    @jax.jit
+    def train_step(params, obses, rewards, weights):
+        (_, priorities), grad = jax.value_and_grad(loss, has_aux=True)(
+            params, obses, rewards, weights
+        )
+        params = jax.tree.map(lambda p, g: p - 1e-3 * g, params, grad)
+        return params, priorities
+
+    return params, train_step
+
+
+def bench(replay_buffer, train_step, params, steps):
+    for step in range(steps + 10):
+        if step == 10:
+            start = time.perf_counter()
+            if isinstance(replay_buffer, PipelinedReplayBuffer):
+                replay_buffer.reset_stats()
+        data = replay_buffer.sample(replay_buffer.batch_size, 0.4)
+        params, priorities = train_step(
+            params, data["obses"][0], data["rewards"], data["weights"].reshape(-1)
+        )
+        replay_buffer.update_priorities(data["indexes"], priorities)
+    jax.block_until_ready(params)
+    elapsed = time.perf_counter() - start
+    stats = {}
+    if isinstance(replay_buffer, PipelinedReplayBuffer):
+        stats = replay_buffer.stats()
+    return steps / elapsed, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=2, help="number of workers")
+    parser.add_argument("--obs", type=int, default=128, help="observation size")
+    parser.add_argument("--node", type=int, default=512, help="hidden units of the train step")
+    parser.add_argument("--batch_size", type=int, default=8192, help="batch_num * mini_batch")
+    parser.add_argument("--queue_sizes", type=str, default="1,2,4", help="batches sampled ahead")
+    parser.add_argument("--steps", type=int, default=100, help="train steps per setting")
+    args = parser.parse_args()
+
+    ray.init(num_cpus=args.writers + 1)
+    m = mp.Manager()
+    stop = m.Event()
+    replay_buffer = MultiPrioritizedReplayBuffer(200000, [[args.obs]], 0.6, 1, manager=m)
+    replay_buffer.batch_size = args.batch_size
+    writers = [Bench_Writer.remote() for _ in range(args.writers)]
+    jobs = [w.run.remote(replay_buffer.buffer_info(), 1000, stop) for w in writers]
+    while len(replay_buffer) < args.batch_size * 2:
+        time.sleep(0.1)
+    params, train_step = make_train_step(args.obs, args.node)
+
+    results = [("serial", bench(replay_buffer, train_step, params, args.steps))]
+    for queue_size in [int(q) for q in args.queue_sizes.split(",")]:
+        pipeline = PipelinedReplayBuffer(replay_buffer, args.batch_size, 0.4, queue_size)
+        results.append((f"pipeline {queue_size}", bench(pipeline, train_step, params, args.steps)))
+        pipeline.close()
+    stop.set()
+    ray.get(jobs)
+
+    print("------------------------------------------------------------")
+    print(f"writers : {args.writers}, observation : {args.obs}, batch : {args.batch_size}")
+    print(f"{'learner':>11} | {'steps/sec':>9} | {'batch q':>7} | {'prio q':>6} | {'wait':>5}")
+    for name, (rate, stats) in results:
+        batch_q = stats.get("pipeline/batch_queue", 0.0)
+        prio_q = stats.get("pipeline/priority_queue", 0.0)
+        wait = stats.get("pipeline/wait_fraction", float("nan"))
+        print(f"{name:>11} | {rate:9.2f} | {batch_q:7.2f} | {prio_q:6.2f} | {wait:5.2f}")
+    print("------------------------------------------------------------")
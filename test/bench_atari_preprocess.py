@@ -0,0 +1,102 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from jax_baselines.common.atari_wrappers import BatchedAtariPreprocessing, make_raw_atari
+from jax_baselines.common.env_builer import get_env_builder
+
+
+def collect_raw_frames(env_name, n):
+    env = make_raw_atari(env_name)
+    raws = [env.reset()[0]]
+    while len(raws) < n:
+        raw, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        raws.append(raw)
+        if terminated or truncated:
+            raws.append(env.reset()[0])
+    env.close()
+    return np.stack(raws[:n], axis=0)
+
+
+def warp_frames(raws):
+    # max pooling of MaxAndSkipEnv and the cv2 calls of WarpFrame, one frame at a time
+    return np.stack(
+        [
+            cv2.resize(
+                cv2.cvtColor(raw.max(axis=0), cv2.COLOR_RGB2GRAY),
+                (84, 84),
+                interpolation=cv2.INTER_AREA,
+            )
+            for raw in raws
+        ],
+        axis=0,
+    )[..., None]
+
+
+def bench_ops(raws, repeat):
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reference = warp_frames(raws)
+    results.append(("per frame cv2", len(raws) * repeat / (time.perf_counter() - start), 0))
+    for use_jax in [False, True]:
+        preprocessing = BatchedAtariPreprocessing(len(raws), raws.shape[2:], use_jax=use_jax)
+        dones = np.zeros(len(raws), dtype=np.bool_)
+        preprocessing.reset(raws)
+        preprocessing.step(raws, raws, dones)  # compile
+        start = time.perf_counter()
+        for _ in range(repeat):
+            next_obs, _ = preprocessing.step(raws, raws, dones)
+        elapsed = time.perf_counter() - start
+        diff = np.abs(next_obs[..., -1:].astype(np.int32) - reference).max()
+        name = "batched jax" if use_jax else "batched numpy"
+        results.append((name, len(raws) * repeat / elapsed, diff))
+    return results
+
+
+def bench_env(env_name, vectorized_env, atari_preprocessing, workers, steps):
+    env_builder, _ = get_env_builder(
+        env_name, vectorized_env=vectorized_env, atari_preprocessing=atari_preprocessing
+    )
+    env = env_builder(workers)
+    n_actions = env.env_info["action_space"].n
+    for _ in range(10):
+        env.step(np.random.randint(0, n_actions, (workers, 1)))
+        env.get_result()
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(np.random.randint(0, n_actions, (workers, 1)))
+        env.get_result()
+    elapsed = time.perf_counter() - start
+    env.close()
+    return workers * steps / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default="BreakoutNoFrameskip-v4", help="environment")
+    parser.add_argument("--vectorized_env", type=str, default="multiprocessing", help="backend")
+    parser.add_argument("--workers", type=int, default=8, help="number of envs")
+    parser.add_argument("--steps", type=int, default=500, help="vector steps per setting")
+    parser.add_argument("--batch", type=int, default=64, help="frames per preprocessing batch")
+    parser.add_argument("--repeat", type=int, default=50, help="preprocessing batches")
+    args = parser.parse_args()
+
+    op_results = bench_ops(collect_raw_frames(args.env, args.batch), args.repeat)
+    env_results = [
+        (pre, bench_env(args.env, args.vectorized_env, pre, args.workers, args.steps))
+        for pre in ["worker", "numpy", "jax"]
+    ]
+
+    print("------------------------------------------------------------")
+    print(f"env : {args.env}, preprocessing batch : {args.batch}")
+    print(f"{'preprocessing':>14} | {'frames/sec':>12} | {'max diff to cv2':>15}")
+    for name, rate, diff in op_results:
+        print(f"{name:>14} | {rate:12.0f} | {diff:15d}")
+    print(f"backend : {args.vectorized_env}, envs : {args.workers}")
+    print(f"{'preprocessing':>14} | {'env steps/sec':>13}")
+    for pre, rate in env_results:
+        print(f"{pre:>14} | {rate:13.0f}")
+    print("------------------------------------------------------------")
@@ -0,0 +1,97 @@
+import argparse
+import time
+
+import numpy as np
+import ray
+from ray.util.queue import Queue
+
+from jax_baselines.IMPALA.cpprb_buffers import ImpalaBuffer, batch
+
+
+@ray.remote(num_cpus=1)
+class Bench_Actor(object):
+    def run_queue(self, queue, env_dict, length, trajectories):
+        # the trajectory of Impala_Worker before the store, pickled into a ray queue
+        for _ in range(trajectories):
+            trajectory = batch(
+                [np.random.random((length, *env_dict["obs0"]["shape"])).astype(np.float32)],
+                np.zeros((length, 1), np.float32),
+                np.zeros((length, 1), np.float32),
+                np.zeros((length, 1), np.float32),
+                [np.random.random((length, *env_dict["obs0"]["shape"])).astype(np.float32)],
+                np.zeros((length, 1), np.float32),
+                np.zeros((length, 1), np.float32),
+            )
+            queue.put(trajectory)
+
+    def run_store(self, buffer_info, length, trajectories):
+        local_buffer, env_dict, _ = buffer_info
+        obs = [np.random.random((1, *env_dict["obs0"]["shape"])).astype(np.float32)]
+        for _ in range(trajectories):
+            local_buffer.acquire()
+            for _ in range(length):
+                local_buffer.add(obs, 0, 0.0, 0.0, obs, False, False)
+            local_buffer.commit()
+        local_buffer.close()
+
+
+def bench_queue(actors, env_dict, length, sample_size, batches):
+    queue = Queue(maxsize=len(actors) * 2)
+    per_actor = -(-sample_size * batches // len(actors))
+    jobs = [a.run_queue.remote(queue, env_dict, length, per_actor) for a in actors]
+    start = time.perf_counter()
+    for _ in range(batches):
+        gets = [queue.get() for _ in range(sample_size)]
+        data = batch(*zip(*gets))
+        np.stack(data.actions)  # the stacking the learner did on every batch
+    elapsed = time.perf_counter() - start
+    while len(ray.wait(jobs, num_returns=len(jobs), timeout=0.01)[1]) > 0:
+        queue.get_nowait_batch(queue.size())  # the actors finish their last trajectories
+    return sample_size * batches / elapsed
+
+
+def bench_store(actors, observation_space, length, sample_size, batches):
+    buffer = ImpalaBuffer(0, len(actors), observation_space, sample_size=sample_size, length=length)
+    per_actor = -(-sample_size * batches // len(actors))
+    jobs = [
+        a.run_store.remote(buffer.buffer_info(idx), length, per_actor)
+        for idx, a in enumerate(actors)
+    ]
+    start = time.perf_counter()
+    for _ in range(batches):
+        buffer.sample()
+    elapsed = time.perf_counter() - start
+    while len(ray.wait(jobs, num_returns=len(jobs), timeout=0.01)[1]) > 0:
+        if len(buffer) > 0:
+            buffer.store.take(len(buffer))  # the actors finish their last trajectories
+    nbytes = buffer.store.nbytes
+    buffer.close()
+    return sample_size * batches / elapsed, nbytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actors", type=int, default=4, help="number of actors")
+    parser.add_argument("--obs", type=int, default=128, help="observation size")
+    parser.add_argument("--length", type=int, default=256, help="steps T of a trajectory")
+    parser.add_argument("--sample_size", type=int, default=8, help="trajectories per batch")
+    parser.add_argument("--batches", type=int, default=50, help="learner batches per setting")
+    args = parser.parse_args()
+
+    ray.init(num_cpus=args.actors + 1)
+    actors = [Bench_Actor.remote() for _ in range(args.actors)]
+    observation_space = [[args.obs]]
+    env_dict = {"obs0": {"shape": (args.obs,)}}
+
+    queue_rate = bench_queue(actors, env_dict, args.length, args.sample_size, args.batches)
+    store_rate, nbytes = bench_store(
+        actors, observation_space, args.length, args.sample_size, args.batches
+    )
+
+    print("------------------------------------------------------------")
+    print(f"actors : {args.actors}, observation : {args.obs}, T : {args.length}")
+    print(f"store : {nbytes / 2**20:.1f} MB, sample size : {args.sample_size}")
+    print(f"{'transport':>10} | {'trajectories/sec':>16}")
+    print(f"{'ray queue':>10} | {queue_rate:16.1f}")
+    print(f"{'shm store':>10} | {store_rate:16.1f}")
+    print("------------------------------------------------------------")
@@ -0,0 +1,113 @@
+import argparse
+import time
+from itertools import repeat
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+import ray
+
+from jax_baselines.common.inference_server import Inference_server, remote_inference
+from jax_baselines.common.param_channel import ParamChannel
+from jax_baselines.common.utils import convert_jax
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+
+def make_builder(observation_space, action_size):
+    # the batched q network policy of the Ape-X DQN actors
+    model_builder = model_builder_maker(
+        observation_space, action_size, False, False, {"node": 256, "hidden_n": 2}
+    )
+
+    def builder():
+        preproc, model = model_builder()
+
+        def actor(params, obses, key):
+            return jnp.argmax(model(params, key, preproc(params, key, convert_jax(obses))), axis=1)
+
+        return actor, None, repeat(None)
+
+    return model_builder, builder
+
+
+@ray.remote(num_cpus=1)
+class Bench_Worker(object):
+    def run(self, builder, params, observation_space, steps, inference_server=None):
+        if inference_server is None:
+            actor, _, _ = builder()
+            actor = jax.jit(actor)
+        else:
+            actor, _ = remote_inference(inference_server)
+        obs = [
+            np.zeros((1, *o), dtype=np.uint8 if len(o) == 3 else np.float32)
+            for o in observation_space
+        ]
+        actor(params, obs, None)  # compile
+        latency = np.zeros(steps)
+        for i in range(steps):
+            start = time.perf_counter()
+            np.asarray(actor(params, obs, None))
+            latency[i] = time.perf_counter() - start
+        return latency
+
+
+def bench(workers, builder, params, observation_space, steps, use_server):
+    inference_server = None
+    if use_server:
+        param_channel = ParamChannel(params)
+        inference_server = Inference_server.remote(builder, param_channel, len(workers))
+    start = time.perf_counter()
+    latency = np.concatenate(
+        ray.get(
+            [
+                w.run.remote(builder, params, observation_space, steps, inference_server)
+                for w in workers
+            ]
+        )
+    )
+    elapsed = time.perf_counter() - start
+    mean_batch = 1.0
+    if use_server:
+        mean_batch = ray.get(inference_server.get_stats.remote())["mean_batch"]
+        ray.kill(inference_server)
+        param_channel.close()
+    return (
+        len(latency) / elapsed,
+        np.mean(latency) * 1e3,
+        np.percentile(latency, 99) * 1e3,
+        mean_batch,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actors", type=str, default="8,32,64", help="actor counts")
+    parser.add_argument("--steps", type=int, default=500, help="forward passes per actor")
+    parser.add_argument("--atari", action="store_true", help="84x84x4 observations")
+    args = parser.parse_args()
+
+    observation_space = [[84, 84, 4]] if args.atari else [[4]]
+    model_builder, builder = make_builder(observation_space, [4])
+    _, _, params = model_builder(jax.random.PRNGKey(0))
+    actor_counts = [int(a) for a in args.actors.split(",")]
+    ray.init(num_cpus=max(actor_counts) + 1)
+
+    results = []
+    for n in actor_counts:
+        workers = [Bench_Worker.remote() for _ in range(n)]
+        for use_server in [False, True]:
+            results.append(
+                (n, use_server)
+                + bench(workers, builder, params, observation_space, args.steps, use_server)
+            )
+        for w in workers:
+            ray.kill(w)
+
+    print("------------------------------------------------------------")
+    print(f"observation : {observation_space}, forward passes per actor : {args.steps}")
+    header = ["actors", "inference", "forwards/sec", "mean ms", "p99 ms", "batch"]
+    print(" | ".join(f"{h:>{w}}" for h, w in zip(header, [6, 9, 12, 8, 8, 6])))
+    for n, use_server, rate, mean, p99, batch in results:
+        name = "server" if use_server else "actor"
+        print(f"{n:6d} | {name:>9} | {rate:12.0f} | {mean:8.2f} | {p99:8.2f} | {batch:6.2f}")
+    print("------------------------------------------------------------")
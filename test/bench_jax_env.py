@@ -0,0 +1,106 @@
+import argparse
+import time
+
+import numpy as np
+
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.common.schedules import LinearSchedule
+
+
+def build_agent(algo, env_name, vectorized_env, workers, steps, args):
+    env_builder, _ = get_env_builder(env_name, vectorized_env=vectorized_env)
+    if algo == "DQN":
+        from jax_baselines.DQN.dqn import DQN
+        from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+        agent = DQN(
+            env_builder,
+            model_builder_maker=model_builder_maker,
+            num_workers=workers,
+            batch_size=args.batch,
+            buffer_size=args.buffer_size,
+            train_freq=args.train_freq,
+            learning_starts=args.learning_starts,
+            policy_kwargs={"node": 64, "hidden_n": 2},
+        )
+        agent.exploration = LinearSchedule(steps, final_p=0.02, initial_p=1.0)
+        agent.update_eps = 1.0
+    else:
+        from jax_baselines.PPO.ppo import PPO
+        from model_builder.flax.ac.ac_builder import model_builder_maker
+
+        agent = PPO(
+            env_builder,
+            model_builder_maker=model_builder_maker,
+            num_workers=workers,
+            batch_size=args.rollout,
+            minibatch_size=args.batch,
+            policy_kwargs={"node": 64, "hidden_n": 2},
+        )
+    agent.logger_run = None
+    agent.eval = lambda steps: None  # throughput of the training loop only
+    return agent
+
+
+def run(algo, env_name, vectorized_env, workers, steps, args):
+    agent = build_agent(algo, env_name, vectorized_env, workers, steps, args)
+    if agent.env_type == "JaxEnv":
+        chunk = workers * (args.rollout if algo == "PPO" else args.scan_steps)
+        steps = max(steps // chunk, 1) * chunk
+        agent.eval_freq = chunk
+        agent.learn_JaxEnv(range(0, chunk, chunk))  # compile
+        train_steps = agent.train_steps_count if algo == "DQN" else 0
+        start = time.perf_counter()
+        agent.learn_JaxEnv(range(chunk, chunk + steps, chunk))
+        elapsed = time.perf_counter() - start
+    else:
+        agent.eval_freq = steps + 1
+        # the compile of the train step is in the first steps, run them before the clock starts
+        warmup = workers * 10
+        if algo == "DQN":
+            agent.learning_starts = min(agent.learning_starts, warmup // 2)
+        agent.learn_VectorizedEnv(range(0, warmup, workers))
+        train_steps = agent.train_steps_count if algo == "DQN" else 0
+        start = time.perf_counter()
+        agent.learn_VectorizedEnv(range(warmup, warmup + steps, workers))
+        elapsed = time.perf_counter() - start
+    train_steps = agent.train_steps_count - train_steps if algo == "DQN" else np.nan
+    agent.env.close()
+    return steps / elapsed, train_steps / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--algo", type=str, default="both", help="DQN, PPO or both")
+    parser.add_argument("--env", type=str, default="CartPole-v1", help="environment")
+    parser.add_argument("--ray_workers", type=int, default=8, help="envs of the ray path")
+    parser.add_argument("--jax_workers", type=int, default=1024, help="envs of the jax path")
+    parser.add_argument("--ray_steps", type=int, default=20000, help="env steps of the ray path")
+    parser.add_argument("--jax_steps", type=int, default=2000000, help="env steps of the jax path")
+    parser.add_argument("--scan_steps", type=int, default=100, help="vector steps per dispatch")
+    parser.add_argument("--rollout", type=int, default=32, help="PPO steps per worker and epoch")
+    parser.add_argument("--batch", type=int, default=256, help="batch and minibatch size")
+    parser.add_argument("--train_freq", type=int, default=64, help="DQN env steps per train step")
+    parser.add_argument("--learning_starts", type=int, default=1000, help="DQN learning start")
+    parser.add_argument("--buffer_size", type=int, default=100000, help="DQN buffer size")
+    args = parser.parse_args()
+
+    algos = ["DQN", "PPO"] if args.algo == "both" else [args.algo]
+    results = []
+    for algo in algos:
+        for backend, workers, steps in [
+            ("ray", args.ray_workers, args.ray_steps),
+            ("jax", args.jax_workers, args.jax_steps),
+        ]:
+            results.append(
+                (algo, backend, workers, *run(algo, args.env, backend, workers, steps, args))
+            )
+
+    print("------------------------------------------------------------")
+    print(f"env : {args.env}, DQN train_freq : {args.train_freq}, batch : {args.batch}")
+    print(
+        f"{'algo':>5} | {'backend':>7} | {'envs':>5} | {'env steps/sec':>13} | {'train steps/sec':>15}"
+    )
+    for algo, backend, workers, env_rate, train_rate in results:
+        print(f"{algo:>5} | {backend:>7} | {workers:>5} | {env_rate:13.0f} | {train_rate:15.1f}")
+    print("------------------------------------------------------------")
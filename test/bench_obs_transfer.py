@@ -0,0 +1,49 @@
+import argparse
+import time
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from jax_baselines.common.utils import convert_jax
+from model_builder.flax.Module import PreProcess
+
+
+def old_convert_jax(obs: list):
+    # the host side float32 cast convert_jax did before the observations were kept as uint8
+    return [jax.device_get(o).astype(jnp.float32) for o in obs]
+
+
+def run(name, convert, batch, repeat):
+    preproc = PreProcess([batch["obses"][0].shape[1:]], embedding_mode="normal")
+    params = preproc.init(jax.random.PRNGKey(0), [jnp.zeros((1, *batch["obses"][0].shape[1:]))])
+    train_step = jax.jit(lambda params, obses, nxtobses: preproc.apply(params, obses).mean())
+
+    def step():
+        obses, nxtobses = convert(batch["obses"]), convert(batch["nxtobses"])
+        train_step(params, obses, nxtobses).block_until_ready()
+        return sum(o.nbytes for o in obses + nxtobses)
+
+    nbytes = step()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    step_time = (time.perf_counter() - start) / repeat
+    print(f"{name:>8} | {nbytes / 2**20:>15.2f} | {step_time * 1e3:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=32, help="train batch size")
+    parser.add_argument("--repeat", type=int, default=100, help="timed train steps")
+    args = parser.parse_args()
+
+    shape = (args.batch, 84, 84, 4)
+    batch = {
+        "obses": [np.random.randint(0, 255, size=shape, dtype=np.uint8)],
+        "nxtobses": [np.random.randint(0, 255, size=shape, dtype=np.uint8)],
+    }
+    print(f"device : {jax.devices()[0]}, batch : {args.batch}, obs : 84x84x4 uint8")
+    print(f"{'transfer':>8} | {'MB / train step':>15} | {'step (ms)':>12}")
+    run("float32", old_convert_jax, batch, args.repeat)
+    run("uint8", convert_jax, batch, args.repeat)
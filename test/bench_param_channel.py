@@ -0,0 +1,129 @@
+import argparse
+import base64
+import multiprocessing as mp
+import time
+
+import jax
+import numpy as np
+import ray
+
+from jax_baselines.common.param_channel import ParamChannel
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+
+@ray.remote
+class Rpc_Param_server(object):
+    # the parameter server the Ape-X and IMPALA learners used before the channel
+    def __init__(self, params) -> None:
+        self.params = params
+
+    def get_params(self):
+        return self.params
+
+    def update_params(self, params):
+        self.params = params
+
+
+@ray.remote(num_cpus=1)
+class Bench_Reader(object):
+    encoded = base64.b64encode(mp.current_process().authkey)
+
+    def __init__(self) -> None:
+        mp.current_process().authkey = base64.b64decode(self.encoded)
+
+    def warm_up(self, source):
+        # the first fetch of a process initializes jax, it is left out of the timings
+        if isinstance(source, ParamChannel):
+            source.read()
+            source.close()
+        else:
+            ray.get(source.get_params.remote())
+
+    def run_rpc(self, param_server, update, stop):
+        fetch = []
+        while not stop.is_set():
+            if update.is_set():
+                start = time.perf_counter()
+                ray.get(param_server.get_params.remote())
+                fetch.append(time.perf_counter() - start)
+                update.clear()
+            time.sleep(0.001)  # an env step
+        return np.asarray(fetch)
+
+    def run_channel(self, param_channel, stop):
+        version = param_channel.version
+        fetch = []
+        while not stop.is_set():
+            if param_channel.version != version:
+                start = time.perf_counter()
+                version, _ = param_channel.read()
+                fetch.append(time.perf_counter() - start)
+            time.sleep(0.001)  # an env step
+        param_channel.close()
+        return np.asarray(fetch)
+
+
+def bench(params, readers, updates, interval, use_channel):
+    m = mp.Manager()
+    stop = m.Event()
+    publish = np.zeros(updates)
+    if use_channel:
+        param_channel = ParamChannel(params)
+        ray.get([r.warm_up.remote(param_channel) for r in readers])
+        jobs = [r.run_channel.remote(param_channel, stop) for r in readers]
+    else:
+        cpu = jax.devices("cpu")[0]
+        param_server = Rpc_Param_server.remote(jax.device_put(params, cpu))
+        ray.get([r.warm_up.remote(param_server) for r in readers])
+        update = [m.Event() for _ in readers]
+        jobs = [r.run_rpc.remote(param_server, u, stop) for r, u in zip(readers, update)]
+    time.sleep(1)
+    for i in range(updates):
+        start = time.perf_counter()
+        if use_channel:
+            param_channel.publish(params)
+        else:
+            param_server.update_params.remote(jax.device_put(params, cpu))
+            for u in update:
+                u.set()
+        publish[i] = time.perf_counter() - start
+        time.sleep(interval)
+    stop.set()
+    fetch = np.concatenate(ray.get(jobs))
+    if use_channel:
+        param_channel.close()
+    else:
+        ray.kill(param_server)
+    m.shutdown()
+    return np.mean(publish) * 1e3, np.mean(fetch) * 1e3, np.percentile(fetch, 99) * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=4, help="number of workers")
+    parser.add_argument("--updates", type=int, default=50, help="parameter updates")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between updates")
+    parser.add_argument("--node", type=int, default=512, help="hidden units of the q network")
+    parser.add_argument("--atari", action="store_true", help="84x84x4 observations")
+    args = parser.parse_args()
+
+    observation_space = [[84, 84, 4]] if args.atari else [[4]]
+    model_builder = model_builder_maker(
+        observation_space, [18], False, False, {"node": args.node, "hidden_n": 2}
+    )
+    _, _, params = model_builder(jax.random.PRNGKey(0))
+    nbytes = sum(x.nbytes for x in jax.tree.leaves(params))
+    ray.init(num_cpus=args.readers + 1)
+    readers = [Bench_Reader.remote() for _ in range(args.readers)]
+
+    results = [
+        (name, bench(params, readers, args.updates, args.interval, use_channel))
+        for name, use_channel in [("ray rpc", False), ("shm channel", True)]
+    ]
+
+    print("------------------------------------------------------------")
+    print(f"parameters : {nbytes / 2**20:.2f} MB, readers : {args.readers}")
+    print(f"{'broadcast':>12} | {'publish ms':>10} | {'fetch ms':>9} | {'p99 fetch ms':>12}")
+    for name, (publish, fetch, p99) in results:
+        print(f"{name:>12} | {publish:10.3f} | {fetch:9.3f} | {p99:12.3f}")
+    print("------------------------------------------------------------")
@@ -0,0 +1,101 @@
+import argparse
+import base64
+import multiprocessing as mp
+import time
+
+import numpy as np
+import ray
+
+from jax_baselines.common.cpprb_buffers import MultiPrioritizedReplayBuffer
+from jax_baselines.common.sharded_buffers import ShardedPrioritizedReplayBuffer
+
+
+@ray.remote(num_cpus=1)
+class Bench_Writer(object):
+    encoded = base64.b64encode(mp.current_process().authkey)
+
+    def __init__(self) -> None:
+        mp.current_process().authkey = base64.b64decode(self.encoded)
+
+    def run(self, buffer_info, local_size, stop):
+        # the flushes of an Ape-X worker's local buffer, without the env
+        gloabal_buffer, env_dict, _ = buffer_info
+        transition = {
+            k: np.random.random((local_size,) + tuple(np.atleast_1d(v.get("shape", 1)))).astype(
+                v.get("dtype", np.float32)
+            )
+            for k, v in env_dict.items()
+        }
+        added = 0
+        start = time.perf_counter()
+        while not stop.is_set():
+            gloabal_buffer.add(**transition, priorities=np.random.random(local_size))
+            added += local_size
+        return added / (time.perf_counter() - start)
+
+
+def bench(replay_buffer, writers, local_size, batch_size, warmup, seconds, m):
+    stop = m.Event()
+    jobs = [w.run.remote(replay_buffer.buffer_info(), local_size, stop) for w in writers]
+    while len(replay_buffer) < warmup:
+        time.sleep(0.1)
+    sampled = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        data = replay_buffer.sample(batch_size, 0.4)
+        replay_buffer.update_priorities(data["indexes"], np.random.random(batch_size))
+        sampled += batch_size
+    elapsed = time.perf_counter() - start
+    stop.set()
+    added = sum(ray.get(jobs))
+    return sampled / elapsed, added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=str, default="1,2,4,8", help="shard counts")
+    parser.add_argument("--writers", type=int, default=4, help="number of workers")
+    parser.add_argument("--obs", type=int, default=128, help="observation size")
+    parser.add_argument("--buffer_size", type=int, default=200000, help="transitions stored")
+    parser.add_argument("--local_size", type=int, default=1000, help="transitions per flush")
+    parser.add_argument("--batch_size", type=int, default=8192, help="batch_num * mini_batch")
+    parser.add_argument("--seconds", type=float, default=20, help="seconds per setting")
+    args = parser.parse_args()
+
+    shard_counts = [int(s) for s in args.shards.split(",")]
+    ray.init(num_cpus=args.writers + max(shard_counts) + 1)
+    m = mp.Manager()
+    writers = [Bench_Writer.remote() for _ in range(args.writers)]
+    observation_space = [[args.obs]]
+
+    results = []
+    for shards in [0] + shard_counts:
+        if shards == 0:
+            replay_buffer = MultiPrioritizedReplayBuffer(
+                args.buffer_size, observation_space, 0.6, 1, manager=m
+            )
+        else:
+            replay_buffer = ShardedPrioritizedReplayBuffer(
+                args.buffer_size, observation_space, 0.6, 1, shards=shards
+            )
+        sample_rate, add_rate = bench(
+            replay_buffer,
+            writers,
+            args.local_size,
+            args.batch_size,
+            args.batch_size * 2,
+            args.seconds,
+            m,
+        )
+        results.append(("cpprb mp" if shards == 0 else f"{shards} shards", sample_rate, add_rate))
+        if shards > 0:
+            for s in replay_buffer.shards:
+                ray.kill(s)
+        del replay_buffer
+
+    print("------------------------------------------------------------")
+    print(f"writers : {args.writers}, observation : {args.obs}, batch : {args.batch_size}")
+    print(f"{'replay':>10} | {'sampled/sec':>12} | {'added/sec':>12}")
+    for name, sample_rate, add_rate in results:
+        print(f"{name:>10} | {sample_rate:12.0f} | {add_rate:12.0f}")
+    print("------------------------------------------------------------")
@@ -0,0 +1,90 @@
+import argparse
+import multiprocessing as mp
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+
+def memory_status():
+    # peak and current resident set size in MB, split by anonymous and file-backed pages
+    status = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in ("VmHWM", "RssAnon", "RssFile"):
+                status[key] = int(value.split()[0]) / 1024
+    return status
+
+
+def run(storage, size, steps, batch_size, obs_shape, frame_stack, result_queue):
+    from jax_baselines.SPR.efficent_buffer import TransitionReplayBuffer
+
+    memmap_dir = tempfile.mkdtemp(prefix="bench_spr_buffer_") if storage == "memmap" else None
+    buffer = TransitionReplayBuffer(
+        size, [obs_shape], 1, prediction_depth=10, memmap_dir=memmap_dir, frame_stack=frame_stack
+    )
+    obs = np.random.randint(0, 255, size=(1, *obs_shape), dtype=np.uint8)
+    start = time.perf_counter()
+    for step in range(steps):
+        next_obs = np.random.randint(0, 255, size=(1, *obs_shape), dtype=np.uint8)
+        terminated = step % 1000 == 999
+        buffer.add([obs], 0, 1.0, [next_obs], terminated)
+        obs = next_obs
+    add_rate = steps / (time.perf_counter() - start)
+
+    buffer.sample(batch_size)  # warm up
+    repeat = 50
+    start = time.perf_counter()
+    for _ in range(repeat):
+        buffer.sample(batch_size)
+    sample_rate = repeat * batch_size / (time.perf_counter() - start)
+    result_queue.put((storage, add_rate, sample_rate, memory_status()))
+    del buffer
+    if memmap_dir is not None:
+        shutil.rmtree(memmap_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000000, help="buffer size")
+    parser.add_argument("--steps", type=int, default=200000, help="transitions to add")
+    parser.add_argument("--batch", type=int, default=32 * 2, help="sample batch size")
+    parser.add_argument("--storage", type=str, default="both", help="ram, memmap or both")
+    parser.add_argument(
+        "--frame_stack", type=int, default=1, help="4 stores only the newest frame per slot"
+    )
+    args = parser.parse_args()
+
+    storages = ["ram", "memmap"] if args.storage == "both" else [args.storage]
+    ctx = mp.get_context("spawn")  # a fresh process per backend so peak RSS is not shared
+    result_queue = ctx.Queue()
+    print(
+        f"size : {args.size}, added : {args.steps}, batch : {args.batch}, obs : 84x84x4 uint8, "
+        f"frame_stack : {args.frame_stack}"
+    )
+    print(
+        f"{'storage':>8} | {'add/sec':>9} | {'samples/sec':>11} | "
+        f"{'peak RSS(MB)':>12} | {'anon RSS(MB)':>12} | {'file RSS(MB)':>12}"
+    )
+    for storage in storages:
+        process = ctx.Process(
+            target=run,
+            args=(
+                storage,
+                args.size,
+                args.steps,
+                args.batch,
+                (84, 84, 4),
+                args.frame_stack,
+                result_queue,
+            ),
+        )
+        process.start()
+        storage, add_rate, sample_rate, status = result_queue.get()
+        process.join()
+        print(
+            f"{storage:>8} | {add_rate:>9.0f} | {sample_rate:>11.0f} | {status['VmHWM']:>12.0f} | "
+            f"{status['RssAnon']:>12.0f} | {status['RssFile']:>12.0f}"
+        )
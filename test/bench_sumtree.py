@@ -0,0 +1,61 @@
+import argparse
+import time
+
+import numpy as np
+
+from jax_baselines.SPR.efficent_buffer import SumTree, VectorizedSumTree
+
+
+def fill(tree, capacity):
+    # write the leaves directly and build the inner nodes once, adding 1M items one by one is slow
+    priorities = np.random.uniform(0.1, 1.0, size=capacity)
+    tree.tree[capacity - 1 :] = priorities
+    tree.data[:] = np.arange(capacity)
+    for idx in range(capacity - 2, -1, -1):
+        tree.tree[idx] = tree.tree[2 * idx + 1] + tree.tree[2 * idx + 2]
+    tree.n_entries = capacity
+
+
+def stratified(tree, batch_size):
+    segment = tree.total() / batch_size
+    return (np.arange(batch_size) + np.random.uniform(0, 1, size=batch_size)) * segment
+
+
+def bench_loop(tree, batch_size, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        s = stratified(tree, batch_size)
+        idxs = np.zeros(batch_size, dtype=np.int64)
+        for i in range(batch_size):
+            idxs[i], _, _ = tree.get(s[i])
+        for idx, p in zip(idxs, np.random.uniform(0.1, 1.0, size=batch_size)):
+            tree.update(idx, p)
+    return repeat * batch_size / (time.perf_counter() - start)
+
+
+def bench_batch(tree, batch_size, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        idxs, _, _ = tree.get_batch(stratified(tree, batch_size))
+        tree.update_batch(idxs, np.random.uniform(0.1, 1.0, size=batch_size))
+    return repeat * batch_size / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capacity", type=int, default=1000000, help="sum tree capacity")
+    parser.add_argument("--repeat", type=int, default=20, help="sample/update rounds per batch")
+    args = parser.parse_args()
+
+    loop_tree = SumTree(args.capacity)
+    batch_tree = VectorizedSumTree(args.capacity)
+    fill(loop_tree, args.capacity)
+    fill(batch_tree, args.capacity)
+    bench_batch(batch_tree, 32, 1)  # warm up
+
+    print(f"capacity : {args.capacity}, samples/sec (sample + update_priorities)")
+    print(f"{'batch':>6} | {'SumTree':>12} | {'VectorizedSumTree':>18} | {'speedup':>7}")
+    for batch_size in [32, 64, 128, 256, 512, 1024, 2048]:
+        loop = bench_loop(loop_tree, batch_size, max(args.repeat // 4, 1))
+        batch = bench_batch(batch_tree, batch_size, args.repeat)
+        print(f"{batch_size:>6} | {loop:>12.0f} | {batch:>18.0f} | {batch / loop:>6.1f}x")
@@ -40,6 +40,9 @@ if __name__ == "__main__":
     parser.add_argument("--hidden_n", type=int, default=2, help="hidden layer number")
     parser.add_argument("--action_noise", type=float, default=0.1, help="action_noise")
     parser.add_argument("--optimizer", type=str, default="adopt", help="optimaizer")
+    parser.add_argument("--inference_server", action="store_true")
+    parser.add_argument("--replay_shards", type=int, default=0, help="replay shards")
+    parser.add_argument("--pipeline_batches", type=int, default=0, help="batches sampled ahead")
     parser.add_argument("--gradient_steps", type=int, default=1, help="gradient_steps")
     parser.add_argument("--critic_num", type=int, default=2, help="tqc critic number")
     parser.add_argument("--ent_coef", type=str, default="auto", help="sac entropy coefficient")
@@ -92,6 +95,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
+            replay_shards=args.replay_shards,
+            pipeline_batches=args.pipeline_batches,
         )
     elif args.algo == "TD3":
         if args.model_lib == "flax":
@@ -118,6 +124,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
+            replay_shards=args.replay_shards,
+            pipeline_batches=args.pipeline_batches,
         )
 
     agent.learn(int(args.steps))
@@ -45,6 +45,9 @@ if __name__ == "__main__":
     parser.add_argument("--final_eps", type=float, default=0.1, help="final epsilon")
     parser.add_argument("--worker", type=int, default=1, help="gym_worker_size")
     parser.add_argument("--optimizer", type=str, default="adamw", help="optimaizer")
+    parser.add_argument("--inference_server", action="store_true")
+    parser.add_argument("--replay_shards", type=int, default=0, help="replay shards")
+    parser.add_argument("--pipeline_batches", type=int, default=0, help="batches sampled ahead")
     parser.add_argument("--gradient_steps", type=int, default=1, help="gradient steps")
     parser.add_argument("--learning_starts", type=int, default=5000, help="learning start")
     parser.add_argument("--initial_eps", type=float, default=0.4, help="initial epsilon")
@@ -99,6 +102,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
+            replay_shards=args.replay_shards,
+            pipeline_batches=args.pipeline_batches,
             compress_memory=args.compress_memory,
         )
     elif args.algo == "C51":
@@ -129,6 +135,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
+            replay_shards=args.replay_shards,
+            pipeline_batches=args.pipeline_batches,
             compress_memory=args.compress_memory,
             categorial_max=args.max,
             categorial_min=args.min,
@@ -161,6 +170,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
+            replay_shards=args.replay_shards,
+            pipeline_batches=args.pipeline_batches,
             compress_memory=args.compress_memory,
             n_support=args.n_support,
             delta=args.delta,
@@ -193,6 +205,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
+            replay_shards=args.replay_shards,
+            pipeline_batches=args.pipeline_batches,
             compress_memory=args.compress_memory,
             n_support=args.n_support,
             delta=args.delta,
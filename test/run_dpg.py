@@ -19,6 +19,21 @@ if __name__ == "__main__":
     parser.add_argument("--env", type=str, default="Pendulum-v0", help="environment")
     parser.add_argument("--worker_id", type=int, default=0, help="unlty ml agent's worker id")
     parser.add_argument("--worker", type=int, default=1, help="gym_worker_size")
+    parser.add_argument(
+        "--vectorized_env", type=str, default="ray", help="ray, multiprocessing or jax"
+    )
+    parser.add_argument("--envs_per_actor", type=int, default=1, help="envs in one ray actor")
+    parser.add_argument(
+        "--atari_preprocessing", type=str, default="worker", help="worker, numpy or jax"
+    )
+    parser.add_argument(
+        "--env_batch_size", type=int, default=None, help="envs returned per async ray step"
+    )
+    parser.add_argument("--eval_workers", type=int, default=1, help="parallel eval envs")
+    parser.add_argument("--async_eval", action="store_true")
+    parser.add_argument(
+        "--cpu_actor_update_freq", type=int, default=0, help="cpu actor update freq"
+    )
     parser.add_argument("--algo", type=str, default="DDPG", help="algo ID")
     parser.add_argument("--gamma", type=float, default=0.995, help="gamma")
     parser.add_argument(
@@ -55,11 +70,20 @@ if __name__ == "__main__":
     parser.add_argument(
         "--capture_frame_rate", type=int, default=1, help="unity capture frame rate"
     )
+    parser.add_argument("--compress_memory", action="store_true")
+    parser.add_argument("--prefetch_sampler", action="store_true")
+    parser.add_argument("--scanned_updates", action="store_true")
     args = parser.parse_args()
     env_name = args.env
     embedding_mode = "normal"
     env_builder, env_info = get_env_builder(
-        env_name, timescale=args.time_scale, capture_frame_rate=args.capture_frame_rate
+        env_name,
+        vectorized_env=args.vectorized_env,
+        envs_per_actor=args.envs_per_actor,
+        env_batch_size=args.env_batch_size,
+        atari_preprocessing=args.atari_preprocessing,
+        timescale=args.time_scale,
+        capture_frame_rate=args.capture_frame_rate,
     )
     env_name = env_info["env_id"]
     env_type = env_info["env_type"]
@@ -96,6 +120,12 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     if args.algo == "TD3":
         if args.model_lib == "flax":
@@ -126,6 +156,12 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     if args.algo == "SAC":
         if args.model_lib == "flax":
@@ -156,6 +192,12 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     if args.algo == "CrossQ":
         if args.model_lib == "flax":
@@ -188,6 +230,12 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     if args.algo == "DAC":
         if args.model_lib == "flax":
@@ -218,6 +266,12 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     if args.algo == "TQC":
         if args.model_lib == "flax":
@@ -252,6 +306,12 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     if args.algo == "TD7":
         if args.model_lib == "flax":
@@ -281,6 +341,12 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
 
     agent.learn(int(args.steps), experiment_name=args.experiment_name)
@@ -30,6 +30,7 @@ if __name__ == "__main__":
     parser.add_argument("--node", type=int, default=256, help="network node number")
     parser.add_argument("--hidden_n", type=int, default=2, help="hidden layer number")
     parser.add_argument("--optimizer", type=str, default="rmsprop", help="optimaizer")
+    parser.add_argument("--inference_server", action="store_true")
     parser.add_argument("--ent_coef", type=float, default=0.1, help="entropy coefficient")
     parser.add_argument("--val_coef", type=float, default=0.6, help="val coefficient")
     parser.add_argument("--gae_normalize", dest="gae_normalize", action="store_true")
@@ -73,6 +74,7 @@ if __name__ == "__main__":
             buffer_size=int(args.buffer_size),
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
             val_coef=args.val_coef,
             ent_coef=args.ent_coef,
             rho_max=args.rho_max,
@@ -93,6 +95,7 @@ if __name__ == "__main__":
             buffer_size=int(args.buffer_size),
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
             val_coef=args.val_coef,
             ent_coef=args.ent_coef,
             rho_max=args.rho_max,
@@ -113,6 +116,7 @@ if __name__ == "__main__":
             buffer_size=int(args.buffer_size),
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            inference_server=args.inference_server,
             val_coef=args.val_coef,
             ent_coef=args.ent_coef,
             rho_max=args.rho_max,
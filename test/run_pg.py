@@ -12,6 +12,13 @@ if __name__ == "__main__":
     parser.add_argument("--model_lib", type=str, default="flax", help="model lib")
     parser.add_argument("--worker_id", type=int, default=0, help="unlty ml agent's worker id")
     parser.add_argument("--worker", type=int, default=1, help="gym_worker_size")
+    parser.add_argument(
+        "--vectorized_env", type=str, default="ray", help="ray, multiprocessing or jax"
+    )
+    parser.add_argument("--envs_per_actor", type=int, default=1, help="envs in one ray actor")
+    parser.add_argument(
+        "--atari_preprocessing", type=str, default="worker", help="worker, numpy or jax"
+    )
     parser.add_argument("--algo", type=str, default="A2C", help="algo ID")
     parser.add_argument("--gamma", type=float, default=0.995, help="gamma")
     parser.add_argument("--lamda", type=float, default=0.95, help="gae lamda")
@@ -31,13 +38,22 @@ if __name__ == "__main__":
     parser.add_argument(
         "--capture_frame_rate", type=int, default=1, help="unity capture frame rate"
     )
+    parser.add_argument("--compress_memory", action="store_true")
+    parser.add_argument("--device_buffer", action="store_true")
+    parser.add_argument("--eval_workers", type=int, default=1, help="parallel eval envs")
+    parser.add_argument("--async_eval", action="store_true")
     parser.set_defaults(gae_normalize=False)
 
     args = parser.parse_args()
     env_name = args.env
     embedding_mode = "normal"
     env_builder, env_info = get_env_builder(
-        env_name, timescale=args.time_scale, capture_frame_rate=args.capture_frame_rate
+        env_name,
+        vectorized_env=args.vectorized_env,
+        envs_per_actor=args.envs_per_actor,
+        atari_preprocessing=args.atari_preprocessing,
+        timescale=args.time_scale,
+        capture_frame_rate=args.capture_frame_rate,
     )
     env_name = env_info["env_id"]
     env_type = env_info["env_type"]
@@ -60,6 +76,10 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            device_buffer=args.device_buffer,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
         )
     if args.algo == "PPO":
         agent = PPO(
@@ -76,6 +96,10 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            device_buffer=args.device_buffer,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
         )
     if args.algo == "TPPO":
         agent = TPPO(
@@ -92,6 +116,10 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            compress_memory=args.compress_memory,
+            device_buffer=args.device_buffer,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
         )
 
     agent.learn(int(args.steps), experiment_name=args.experiment_name)
@@ -50,6 +50,21 @@ if __name__ == "__main__":
     parser.add_argument("--hidden_n", type=int, default=2, help="hidden layer number")
     parser.add_argument("--final_eps", type=float, default=0.1, help="final epsilon")
     parser.add_argument("--worker", type=int, default=1, help="gym_worker_size")
+    parser.add_argument(
+        "--vectorized_env", type=str, default="ray", help="ray, multiprocessing or jax"
+    )
+    parser.add_argument("--envs_per_actor", type=int, default=1, help="envs in one ray actor")
+    parser.add_argument(
+        "--atari_preprocessing", type=str, default="worker", help="worker, numpy or jax"
+    )
+    parser.add_argument(
+        "--env_batch_size", type=int, default=None, help="envs returned per async ray step"
+    )
+    parser.add_argument("--eval_workers", type=int, default=1, help="parallel eval envs")
+    parser.add_argument("--async_eval", action="store_true")
+    parser.add_argument(
+        "--cpu_actor_update_freq", type=int, default=0, help="cpu actor update freq"
+    )
     parser.add_argument("--optimizer", type=str, default="adamw", help="optimaizer")
     parser.add_argument("--train_freq", type=int, default=1, help="train_frequancy")
     parser.add_argument("--gradient_steps", type=int, default=1, help="gradient steps")
@@ -59,6 +74,10 @@ if __name__ == "__main__":
     )
     parser.add_argument("--clip_rewards", action="store_true")
     parser.add_argument("--compress_memory", action="store_true")
+    parser.add_argument("--prefetch_sampler", action="store_true")
+    parser.add_argument("--scanned_updates", action="store_true")
+    parser.add_argument("--memmap_buffer", action="store_true")
+    parser.add_argument("--device_buffer", action="store_true")
     parser.add_argument("--hl_gauss", action="store_true")
     parser.add_argument("--scaled_by_reset", action="store_true")
     parser.add_argument("--time_scale", type=float, default=20.0, help="unity time scale")
@@ -69,7 +88,13 @@ if __name__ == "__main__":
     env_name = args.env
     embedding_mode = "normal"
     env_builder, env_info = get_env_builder(
-        env_name, timescale=args.time_scale, capture_frame_rate=args.capture_frame_rate
+        env_name,
+        vectorized_env=args.vectorized_env,
+        envs_per_actor=args.envs_per_actor,
+        env_batch_size=args.env_batch_size,
+        atari_preprocessing=args.atari_preprocessing,
+        timescale=args.time_scale,
+        capture_frame_rate=args.capture_frame_rate,
     )
     env_name = env_info["env_id"]
     env_type = env_info["env_type"]
@@ -104,6 +129,12 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_buffer=args.device_buffer,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     elif args.algo == "C51":
         if args.model_lib == "flax":
@@ -138,6 +169,12 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                device_buffer=args.device_buffer,
+                prefetch_sampler=args.prefetch_sampler,
+                scanned_updates=args.scanned_updates,
+                eval_workers=args.eval_workers,
+                async_eval=args.async_eval,
+                cpu_actor_update_freq=args.cpu_actor_update_freq,
             )
         else:
             agent = C51(
@@ -166,6 +203,12 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                device_buffer=args.device_buffer,
+                prefetch_sampler=args.prefetch_sampler,
+                scanned_updates=args.scanned_updates,
+                eval_workers=args.eval_workers,
+                async_eval=args.async_eval,
+                cpu_actor_update_freq=args.cpu_actor_update_freq,
             )
     elif args.algo == "QRDQN":
         if args.model_lib == "flax":
@@ -198,6 +241,12 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_buffer=args.device_buffer,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     elif args.algo == "IQN":
         if args.model_lib == "flax":
@@ -231,6 +280,12 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_buffer=args.device_buffer,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     elif args.algo == "FQF":
         if args.model_lib == "flax":
@@ -263,6 +318,12 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_buffer=args.device_buffer,
+            prefetch_sampler=args.prefetch_sampler,
+            scanned_updates=args.scanned_updates,
+            eval_workers=args.eval_workers,
+            async_eval=args.async_eval,
+            cpu_actor_update_freq=args.cpu_actor_update_freq,
         )
     elif args.algo == "SPR":
         if args.model_lib == "flax":
@@ -290,6 +351,7 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                memmap_buffer=args.memmap_buffer,
             )
         else:
             agent = SPR(
@@ -311,6 +373,7 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                memmap_buffer=args.memmap_buffer,
             )
 
     elif args.algo == "BBF":
@@ -342,6 +405,7 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                memmap_buffer=args.memmap_buffer,
             )
         else:
             agent = BBF(
@@ -366,6 +430,7 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                memmap_buffer=args.memmap_buffer,
             )
 
     agent.learn(int(args.steps), experiment_name=args.experiment_name)